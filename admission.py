@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+准入控制 (admission control)：每種工作一個 Gate，滿了就快速回 503，不讓請求在 worker 裡越積越多
+
+  CPU = Gate("cpu", ...)         # 本地排盤 (/analyze、/api/analyze)
+  SCRAPE = Gate("scrape", ...)   # headless Chrome 爬蟲 (/api/scrape)，預算小很多
+  EXPORT = Gate("export", ...)   # NDJSON 串流匯出 (/export/readings)：一條串流可能跑好幾分鐘，不佔 CPU 的名額
+
+每個 Gate：
+  - 最多 limit 個同時執行
+  - 額滿時最多 queue 個請求排隊，各自最多等 wait 秒 (deadline)；逾時就放棄
+  - 連排隊位置都沒有 -> 立即拒絕
+  - 有人在排隊時新來的請求不能直接佔用空位；但排隊者之間不保證先來先服務：
+    名額空出時所有排隊者一起被喚醒 (ASGI 的排隊者則是輪詢)，誰先搶到誰用
+被拒絕的請求回 503 + Retry-After。計數與排隊深度輸出到 /metrics：
+  bazi_admission_total{gate, result=admitted|queued|rejected|timeout}
+  bazi_admission_in_flight{gate} / bazi_admission_queue_depth{gate}   (gauge)
+  bazi_admission_wait_seconds{gate}                                    (排隊等了多久)
+
+限制是「每個 worker 行程」的；整個容器的上限 = workers × limit。
+gthread 的執行緒數要大於 limit + queue，超出的請求才會走到這裡被快速拒絕，
+而不是卡在 gunicorn 內部的佇列裡等到 proxy 逾時。
+
+ASGI (asgi.py) 不能在 event loop 裡阻塞等待：用 try_acquire() / enqueue() / acquire_queued() / give_up()
+這組不等待的操作，排隊時由呼叫端 await 一小段時間再試 (規則與 acquire() 相同)。
+
+串流回應要等送完 (或用戶端斷線) 才歸還名額：不用 admit()，改成 acquire() 後
+由 response.call_on_close(gate.release) 歸還。
+
+環境變數 (NAME 為 CPU、SCRAPE 或 EXPORT)：
+  BAZI_ADMIT_<NAME>_LIMIT / BAZI_ADMIT_<NAME>_QUEUE / BAZI_ADMIT_<NAME>_WAIT_MS / BAZI_ADMIT_<NAME>_RETRY_AFTER
+"""
+import functools
+import os
+import threading
+import time
+
+from metrics import REGISTRY
+
+REGISTRY.describe("bazi_admission_total", "Admission decisions by gate and result", "counter")
+REGISTRY.describe("bazi_admission_in_flight", "Requests currently running per gate", "gauge")
+REGISTRY.describe("bazi_admission_queue_depth", "Requests currently waiting per gate", "gauge")
+REGISTRY.describe("bazi_admission_wait_seconds", "Time spent waiting for an admission slot", "histogram")
+
+
+def _env_num(name, default, cast=int):
+    v = os.environ.get(name)
+    return cast(v) if v else default
+
+
+class Gate:
+    def __init__(self, name, limit, queue, wait, retry_after):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_queue = max(0, queue)
+        self.wait = wait
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_env(cls, name, limit, queue, wait_ms, retry_after):
+        key = "BAZI_ADMIT_%s_" % name.upper()
+        return cls(name,
+                   _env_num(key + "LIMIT", limit),
+                   _env_num(key + "QUEUE", queue),
+                   _env_num(key + "WAIT_MS", wait_ms, float) / 1000.0,
+                   _env_num(key + "RETRY_AFTER", retry_after))
+
+    def _publish(self):
+        REGISTRY.set_gauge("bazi_admission_in_flight", self.active, gate=self.name)
+        REGISTRY.set_gauge("bazi_admission_queue_depth", self.waiting, gate=self.name)
+
+    def acquire(self):
+        """取得執行名額；回傳 True (可執行) 或 False (已拒絕，不必 release)"""
+        with self._cond:
+            # 有人在排隊時新來的也要排，不搶在排隊者前面 (排隊者之間的順序不保證)
+            if self.active < self.limit and self.waiting == 0:
+                self.active += 1
+                self._publish()
+                REGISTRY.inc("bazi_admission_total", gate=self.name, result="admitted")
+                return True
+            if self.waiting >= self.max_queue:
+                REGISTRY.inc("bazi_admission_total", gate=self.name, result="rejected")
+                return False
+
+            t0 = time.monotonic()
+            deadline = t0 + self.wait
+            self.waiting += 1
+            self._publish()
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        REGISTRY.inc("bazi_admission_total", gate=self.name, result="timeout")
+                        return False
+                    self._cond.wait(remaining)
+                self.active += 1
+                REGISTRY.inc("bazi_admission_total", gate=self.name, result="queued")
+                return True
+            finally:
+                self.waiting -= 1
+                self._publish()
+                REGISTRY.observe("bazi_admission_wait_seconds", time.monotonic() - t0, gate=self.name)
+
+    # ---------- 不等待的版本 (event loop 用) ----------
+    def try_acquire(self):
+        """有空位且沒人排隊就佔用並回傳 True；不會等待"""
+        with self._cond:
+            if self.active < self.limit and self.waiting == 0:
+                self.active += 1
+                self._publish()
+                REGISTRY.inc("bazi_admission_total", gate=self.name, result="admitted")
+                return True
+            return False
+
+    def enqueue(self):
+        """排進隊伍 (之後用 acquire_queued 輪詢)；隊伍已滿時回傳 False (已拒絕)"""
+        with self._cond:
+            if self.waiting >= self.max_queue:
+                REGISTRY.inc("bazi_admission_total", gate=self.name, result="rejected")
+                return False
+            self.waiting += 1
+            self._publish()
+            return True
+
+    def acquire_queued(self, t0):
+        """已在隊伍裡 (t0 = enqueue 的 monotonic 時間)：有空位就離開隊伍並佔用"""
+        with self._cond:
+            if self.active >= self.limit:
+                return False
+            self.active += 1
+            self.waiting -= 1
+            self._publish()
+        REGISTRY.inc("bazi_admission_total", gate=self.name, result="queued")
+        REGISTRY.observe("bazi_admission_wait_seconds", time.monotonic() - t0, gate=self.name)
+        return True
+
+    def give_up(self, t0):
+        """排隊逾時 (或用戶端斷線)：離開隊伍"""
+        with self._cond:
+            self.waiting -= 1
+            self._publish()
+        REGISTRY.inc("bazi_admission_total", gate=self.name, result="timeout")
+        REGISTRY.observe("bazi_admission_wait_seconds", time.monotonic() - t0, gate=self.name)
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._publish()
+            # notify_all：只叫醒一個時，它若剛好逾時放棄，空出的名額就沒人接手 (迴圈會重新檢查條件)
+            self._cond.notify_all()
+
+    def state(self):
+        return {"limit": self.limit, "queue": self.max_queue, "active": self.active, "waiting": self.waiting}
+
+
+CPU = Gate.from_env("cpu", limit=2, queue=4, wait_ms=1000, retry_after=1)
+SCRAPE = Gate.from_env("scrape", limit=1, queue=1, wait_ms=5000, retry_after=15)
+EXPORT = Gate.from_env("export", limit=1, queue=0, wait_ms=0, retry_after=30)
+
+
+def admit(gate, busy):
+    """Flask view 裝飾器：拿不到名額時回傳 busy() 的內容，並加上 503 與 Retry-After"""
+    def deco(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not gate.acquire():
+                body, ctype = busy()
+                return body, 503, {"Retry-After": str(gate.retry_after), "Content-Type": ctype}
+            try:
+                return view(*args, **kwargs)
+            finally:
+                gate.release()
+        return wrapper
+    return deco
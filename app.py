@@ -1,17 +1,20 @@
-from flask import Flask, request, render_template_string
-import traceback
+from flask import Flask, request, render_template, Response, jsonify
+from jinja2 import DictLoader
 import os
-from datetime import datetime, timedelta
-try:
-    from zoneinfo import ZoneInfo  # Py3.9+
-except Exception:
-    ZoneInfo = None  # type: ignore
+import html
+import hashlib
+import hmac
+import threading
+import time
+from datetime import date, datetime
+from typing import Optional
 
 # ✅ 改用「八字.py」本地運算，不再走爬蟲
-#    兼容中文檔名：優先正常 import，失敗則用 importlib 動態載入
+#    兼容中文檔名：優先正常 import，找不到模組時才用 importlib 從檔案載入
+#    (只接 ImportError：八字.py 本身出錯時不要再從磁碟重跑一次)
 try:
     import 八字 as bazi_py  # type: ignore
-except Exception:
+except ImportError:
     import importlib.util
     from pathlib import Path
     _bazi_path = Path(__file__).with_name("八字.py")
@@ -23,23 +26,39 @@ except Exception:
 
 calc_bazi_8char = bazi_py.calc_bazi_8char
 
-from bazi_calc_v2 import WebBaziAnalyzer, ZHI
+from bazi_calc_v2 import WebBaziAnalyzer, ZHI, VARIANT_RELATIONS, build_tables, compare_hour_variants
+import admission
+import daily_feed
+import interpretations
+import jsonlog
+import lunar_index
+import memprof
+import metrics
+import profiler
+import shared_cache
+import ten_gods
+import today_chart
+from metrics import stage
 
 app = Flask(__name__)
+metrics.init_app(app)
+# 結構化日誌：request id + access log (含各階段耗時)，輸出在背景執行緒
+jsonlog.init_app(app)
+log = jsonlog.get_logger("app")
+# 取樣剖析：BAZI_PROFILE_RATE / BAZI_PROFILE_TOKEN 未設定時為 None (不掛中介層)
+PROFILER = profiler.install(app)
+# 記憶體帳：RSS / PSS 與各快取大小隨時可看；BAZI_MEMPROF=1 時另開 tracemalloc
+MEMPROF = memprof.install()
+memprof.register_cache("jinja_templates", lambda: {"entries": len(app.jinja_env.cache or ())})
 
 
 def now_in_taipei() -> datetime:
     """Return a 'now' datetime in Asia/Taipei.
 
-    Render (or other minimal containers) might lack IANA tzdata. We try ZoneInfo
-    first and fall back to UTC+8.
+    Render (or other minimal containers) might lack IANA tzdata. The zone object
+    is cached by today_chart, which falls back to a fixed UTC+8 offset.
     """
-    if ZoneInfo is not None:
-        try:
-            return datetime.now(ZoneInfo("Asia/Taipei"))
-        except Exception:
-            pass
-    return datetime.utcnow() + timedelta(hours=8)
+    return datetime.now(today_chart.get_zone("Asia/Taipei"))
 
 # ==========================================
 # 🎨 前端設計：CSS 樣式庫 (米黃禪意風)
@@ -170,6 +189,15 @@ INDEX_HTML = f"""
                     </div>
                 </div>
 
+                <div class="form-group">
+                    <label>曆法</label>
+                    <div class="radio-group">
+                        <label><input type="radio" name="calendar" value="solar" checked> 國曆</label>
+                        <label><input type="radio" name="calendar" value="lunar"> 農曆</label>
+                        <label><input type="checkbox" name="leap" value="1"> 閏月 (僅農曆)</label>
+                    </div>
+                </div>
+
                 <div class="form-group">
                     <label>出生民國年 (例如：76)</label>
                     <input type="number" name="year" required placeholder="請輸入數字，如 76">
@@ -193,7 +221,8 @@ INDEX_HTML = f"""
                 <div style="display: flex; gap: 15px;">
                     <div class="form-group" style="flex:1">
                         <label>出生時 (0-23)</label>
-                        <select name="hour" required>
+                        <select name="hour">
+                            <option value="">不詳</option>
                             <script>for(let i=0;i<=23;i++) document.write(`<option value="${{i}}">${{i}} 時</option>`);</script>
                         </select>
                     </div>
@@ -202,7 +231,18 @@ INDEX_HTML = f"""
                         <input type="number" name="minute" value="0" min="0" max="59">
                     </div>
                 </div>
+
+                <div class="form-group">
+                    <label><input type="checkbox" name="hour_unknown" value="1" style="width:auto"> 不知道出生時辰 (列出 12 個時辰的可能結果)</label>
+                </div>
                 
+                <div class="form-group">
+                    <label>所在地經度 (選填，填寫則今日盤改用真太陽時)</label>
+                    <input type="number" name="lon" step="0.01" min="-180" max="180" placeholder="例如台北 121.56">
+                </div>
+
+                <input type="hidden" name="tz" id="tz">
+                <script>try {{ document.getElementById('tz').value = Intl.DateTimeFormat().resolvedOptions().timeZone || ''; }} catch (e) {{}}</script>
                 <input type="hidden" name="year_mode" value="1"> 
                 <button type="submit" class="btn-primary">開始運算</button>
             </form>
@@ -332,6 +372,11 @@ RESULT_HTML = f"""
             display: inline-block; transition: all 0.3s;
         }}
         .btn-strategy:hover {{ background: #fff; transform: scale(1.05); }}
+
+        /* 時辰不詳：各時辰對照表 */
+        .variant-table {{ width: 100%; border-collapse: collapse; font-size: 0.9rem; }}
+        .variant-table th, .variant-table td {{ border-bottom: 1px solid #eee; padding: 6px 4px; text-align: center; }}
+        .variant-table th {{ color: var(--primary-color); }}
     </style>
 </head>
 <body>
@@ -347,7 +392,45 @@ RESULT_HTML = f"""
                 <div style="margin-top: 10px; font-size: 0.9rem; color: #666;">
                     今日月令：{{{{ result.branches.today_month }}}}
                 </div>
+                <div style="font-size: 0.8rem; color: #aaa;">今日盤時區：{{{{ result.today_zone }}}}</div>
+                {{% if result.chart %}}
+                <div style="margin-top: 10px; font-size: 0.9rem; color: #666;">
+                    日主 {{{{ result.chart.day_master }}}} ({{{{ result.chart.day_master_element }}}}) · {{{{ result.chart.strength }}}} ·
+                    五行 {{% for el, v in result.chart.elements.items() %}}{{{{ el }}}}{{{{ v }}}} {{% endfor %}}
+                </div>
+                {{% endif %}}
+                {{% if result.hour_variants %}}
+                <div style="margin-top: 10px; font-size: 0.85rem; color: #888;">
+                    時辰不詳 · 所有時辰都相同：{{{{ result.hour_variants.stable | join('、') or '無' }}}}
+                    {{% if result.hour_variants.varying %}} · 隨時辰改變：{{{{ result.hour_variants.varying | join('、') }}}}{{% endif %}}
+                </div>
+                {{% endif %}}
+                {{% if result.timeline %}}
+                <div style="font-size: 0.85rem; color: #888;">
+                    {{{{ '順行' if result.timeline.forward else '逆行' }}}} · 出生後 {{{{ result.timeline.start_offset.years }}}} 年 {{{{ result.timeline.start_offset.months }}}} 個月起運 ·
+                    目前大運 {{{{ result.timeline.current_dayun or '未起運' }}}} · {{{{ result.timeline.this_year.year }}}} 流年 {{{{ result.timeline.this_year.pillar }}}}
+                </div>
+                {{% endif %}}
+            </div>
+
+            {{% if result.hour_variants %}}
+            <div class="layer-section" style="margin-bottom: 3rem;">
+                <div class="layer-title">12 個時辰的可能結果</div>
+                <table class="variant-table">
+                    <tr><th>時辰</th><th>八字</th><th>強弱</th><th>時支×日支</th><th>時支×今日</th><th>目前大運</th></tr>
+                    {{% for row in result.hour_variants.rows %}}
+                    <tr>
+                        <td>{{{{ row.hour }}}}<br><small>{{{{ row.range }}}}</small></td>
+                        <td>{{{{ row.pillars | join(' ') }}}}{{% if row.after_jie %}}<br><small>{{{{ row.jie[11:16] }}}} 交節後 {{{{ row.after_jie | join(' ') }}}}</small>{{% endif %}}</td>
+                        <td>{{{{ row.strength }}}}</td>
+                        <td>{{{{ row.relations.hour_day | join('、') }}}}</td>
+                        <td>{{{{ row.relations.hour_today | join('、') }}}}</td>
+                        <td>{{{{ row.current_dayun or '未起運' }}}}</td>
+                    </tr>
+                    {{% endfor %}}
+                </table>
             </div>
+            {{% endif %}}
 
             <div class="layer-section">
                 <div class="layer-title">今日核心運勢</div>
@@ -384,6 +467,25 @@ RESULT_HTML = f"""
                 </div>
                 {{% endfor %}}
             </div>
+
+            {{% if result.layer3 %}}
+            <div class="layer-section" style="margin-top: 3rem;">
+                <div class="layer-title">日柱天干互動 ({{{{ result.pillars.user_day }}}} × {{{{ result.pillars.today_day }}}})</div>
+                {{% for item in result.layer3 %}}
+                <div class="relation-block rel-{{{{ item.relation_type }}}}">
+                    <div class="rel-name">{{{{ item.relation_name }}}}</div>
+                    <div class="content-body">
+                        {{% for line in item.content.split('\\n') %}}
+                            {{% if line.strip() %}} {{% if '👉' in line %}}<span class="fmt_highlight">{{{{ line }}}}</span>
+                                {{% elif '建議' in line or '提醒' in line %}}<span class="fmt_subhead">{{{{ line }}}}</span>
+                                {{% else %}}<span class="fmt_text_line">{{{{ line }}}}</span>{{% endif %}}
+                            {{% endif %}}
+                        {{% endfor %}}
+                    </div>
+                </div>
+                {{% endfor %}}
+            </div>
+            {{% endif %}}
         </div>
 
 <div class="strategy-card">
@@ -419,60 +521,479 @@ RESULT_HTML = f"""
 </html>
 """
 
+# 模板註冊成具名模板：Jinja 只編譯一次並快取 (render_template_string 每次都重新編譯)
+app.jinja_loader = DictLoader({
+    "index.html": INDEX_HTML,
+    "result.html": RESULT_HTML,
+})
+
+
+# 預熱狀態：/readyz 只在 warmup() 跑完後回 200 (gunicorn 在 master 預熱，fork 後每個 worker 都是 ready)
+WARM_STATE = {"ready": False, "warming": False, "iterations": 0, "seconds": None,
+              "timings": {}, "finished_at": None, "error": None}
+_WARM_LOCK = threading.Lock()
+
+
+def _timed(fn, n):
+    """執行 n 次，回傳每次的秒數"""
+    out = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        fn(i)
+        out.append(time.perf_counter() - t0)
+    return out
+
+
+def _summary(samples):
+    ordered = sorted(samples)
+    return {"runs": len(samples), "first_ms": round(samples[0] * 1000, 3),
+            "min_ms": round(ordered[0] * 1000, 3),
+            "median_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+            "max_ms": round(ordered[-1] * 1000, 3)}
+
+
+def warmup(iterations: int = 3) -> dict:
+    """預熱並自我量測：資料檔、關係表、排盤 (calc_bazi_8char + 大運)、get_analysis_result、結果頁渲染。
+
+    每一項跑 iterations 次並記錄耗時 (第一次 = 冷啟動，其餘 = 暖機後)，寫進 WARM_STATE 給 /readyz。
+    gunicorn master 預載後呼叫，fork 後共用。回傳各項總耗時 (秒)。
+    """
+    n = max(1, iterations)
+    samples = {}
+    t_start = time.perf_counter()
+    with _WARM_LOCK:
+        WARM_STATE["warming"] = True
+    try:
+        samples["data_files"] = _timed(lambda i: (interpretations.current(), lunar_index.index()), 1)
+        samples["tables"] = _timed(lambda i: build_tables(), 1)
+
+        charts = []
+        samples["calc_bazi_8char"] = _timed(
+            lambda i: charts.append(calc_bazi_8char(1987 + i, 5, 3, 10, 30)), n)
+        samples["timeline"] = _timed(
+            lambda i: bazi_py.luck_timeline(datetime(1987 + i, 5, 3, 10, 30), 1, charts[i]), n)
+        samples["today_chart"] = _timed(lambda i: today_chart.today_chart(calc_bazi_8char), 1)
+
+        results = []
+        samples["get_analysis_result"] = _timed(
+            lambda i: results.append(WebBaziAnalyzer.get_analysis_result(
+                charts[i].day[-1], ZHI[i % 12], ZHI[(i * 5) % 12],
+                user_pillar=charts[i].day, today_pillar=charts[-i - 1].day)), n)
+        samples["ten_gods"] = _timed(lambda i: ten_gods.score(charts[i]), n)
+
+        sample = dict(results[-1], today_zone=today_chart.DEFAULT_TZ, chart=ten_gods.score(charts[-1]),
+                      timeline=timeline_summary(bazi_py.luck_timeline(
+                          datetime(1987, 5, 3, 10, 30), 1, charts[0]), now_in_taipei().year))
+        with app.app_context():
+            samples["render_index"] = _timed(lambda i: app.jinja_env.get_template("index.html").render(), n)
+            samples["render_result"] = _timed(
+                lambda i: app.jinja_env.get_template("result.html").render(result=sample), n)
+    except Exception as e:
+        with _WARM_LOCK:
+            WARM_STATE.update(warming=False, error="%s: %s" % (type(e).__name__, e))
+        raise
+
+    with _WARM_LOCK:
+        WARM_STATE.update(
+            ready=True, warming=False, iterations=n, error=None,
+            seconds=round(time.perf_counter() - t_start, 4),
+            timings={k: _summary(v) for k, v in samples.items()},
+            finished_at=now_in_taipei().isoformat(timespec="seconds"),
+        )
+    return {k: sum(v) for k, v in samples.items()}
+
+
+def warmup_in_background(iterations: Optional[int] = None) -> bool:
+    """沒有經過 gunicorn/ASGI 預熱時 (例如 python app.py)，由 /readyz 觸發背景預熱；回傳是否有啟動"""
+    with _WARM_LOCK:
+        if WARM_STATE["ready"] or WARM_STATE["warming"]:
+            return False
+        WARM_STATE["warming"] = True
+    n = iterations or int(os.environ.get("BAZI_WARMUP_ITERATIONS") or 3)
+
+    def run():
+        try:
+            warmup(n)
+        except Exception:
+            log.exception("warmup failed")
+
+    threading.Thread(target=run, name="bazi-warmup", daemon=True).start()
+    return True
+
+
 @app.route('/', methods=['GET'])
 def index():
-    return render_template_string(INDEX_HTML)
+    return render_template("index.html")
 
-@app.route('/analyze', methods=['POST'])
-def analyze():
-    try:
-        data = request.form
+def today_for(data):
+    """表單的時區 / 經度 -> (now, zone_label, 今日 BaZi)；本行程與跨實例共用快取都有"""
+    lon = (data.get('lon') or '').strip()
+    return today_chart.today_chart(
+        calc_bazi_8char, tz=(data.get('tz') or '').strip() or None,
+        longitude=float(lon) if lon else None, build=bazi_py.BaZi)
+
+def compute_analysis(data, today=None) -> dict:
+    """表單資料 (dict-like) -> 分析結果；Flask 與 ASGI (asgi.py) 共用
 
+    today：已經算好的 today_for(data) 結果 (analyze_page 用來確保快取鍵與內容一致)
+    """
+    with stage("parse"):
         # 1) 使用者輸入（表單是「民國年」）
         roc_year = int(data.get('year'))
         year = roc_year + 1911 if roc_year < 1911 else roc_year
         month = int(data.get('month'))
         day = int(data.get('day'))
-        hour = int(data.get('hour'))
-        minute = int(data.get('minute') or 0)
+        # 時辰不詳 (勾選或沒填小時)：不假設 12:00，改列出 12 個時辰
+        hour_unknown = data.get('hour_unknown') == '1' or not (data.get('hour') or '').strip()
+        hour = None if hour_unknown else int(data.get('hour'))
+        minute = None if hour_unknown else int(data.get('minute') or 0)
+        # 農曆生日：查預先算好的索引換成國曆 (閏月由 leap 勾選)
+        if data.get('calendar') == 'lunar':
+            year, month, day = lunar_index.to_solar(year, month, day, leap=data.get('leap') == '1')
+        # 表單的日期選單一律是 1~31：不存在的日期 (例如 2023-02-31) 在這裡擋下，後面才能放心組 datetime
+        if not 1 <= month <= 12:
+            raise ValueError("月份需為 1~12")
+        if not 1 <= day <= bazi_py.days_in_month(year, month):
+            raise ValueError("日期不存在：%d 年 %d 月只有 %d 天" % (year, month, bazi_py.days_in_month(year, month)))
+        # locale：文案語系；沒帶時用預設語系，文案檔沒有的語系直接拒絕
+        locale = (data.get('locale') or '').strip() or None
+        if locale and locale not in interpretations.current().locales:
+            raise ValueError("不支援的語系：%s" % locale)
+
+    # 2) 計算「使用者八字」
+    #    時辰不詳：年 / 月 / 日柱排一次，時柱由日干推出 (日柱不隨時辰改變，日支相關的分析只做一次)
+    with stage("calc_user"):
+        if hour is None:
+            variants = bazi_py.hour_variants(year, month, day)
+            user_bazi = variants[0].bazi
+        else:
+            variants = None
+            user_bazi = calc_bazi_8char(year, month, day, hour, minute)
+
+    # 3) 計算「今日八字」：依表單的時區 (tz，瀏覽器自動帶入) 或經度 (lon → 真太陽時)，
+    #    沒帶或無效時以 Asia/Taipei 為準；同一時區同一時辰內直接用快取
+    if today is None:
+        with stage("today"):
+            today = today_for(data)
+    now, zone_label, today_bazi = today
+
+    # 4) 抽取地支：日主地支、今日日支、今日月支
+    user_day = user_bazi.day[-1]
+    today_day = today_bazi.day[-1]
+    today_month = today_bazi.month[-1]
+
+    # 5) 依序丟給 bazi_calc_v2
+    if not all(b in ZHI for b in [user_day, today_day, today_month]):
+        raise ValueError("地支解析異常（請確認八字輸出是否為「天干地支」兩字組合）")
+
+    with stage("analysis"):
+        result = WebBaziAnalyzer.get_analysis_result(
+            user_day, today_day, today_month, locale=locale,
+            user_pillar=user_bazi.day, today_pillar=today_bazi.day)
+
+    if variants is not None:
+        # 時辰不詳：強弱、大運逐一時辰列出，並標出哪些關係在所有時辰都相同
+        with stage("variants"):
+            result["chart"] = None
+            result["timeline"] = None
+            result["hour_variants"] = hour_variant_summary(
+                variants, datetime(year, month, day), data.get('sex') or '1', today_day, today_month, now.year)
+    else:
+        # 十神 / 五行強弱 (查表，用到完整四柱的天干)
+        with stage("ten_gods"):
+            result["chart"] = ten_gods.score(user_bazi)
+
+        # 大運 / 流年：用表單的性別 (1 男 / 0 女) 決定順逆；節氣表依年份快取
+        with stage("timeline"):
+            result["timeline"] = timeline_summary(
+                bazi_py.luck_timeline(datetime(year, month, day, hour, minute), data.get('sex') or '1', user_bazi),
+                now.year)
+
+    # debug：保留四柱方便你檢查
+    result["today_zone"] = zone_label
+    result["debug_info"] = {
+        "user_pillars": [user_bazi.year, user_bazi.month, user_bazi.day, user_bazi.hour if variants is None else None],
+        "today_pillars": [today_bazi.year, today_bazi.month, today_bazi.day, today_bazi.hour],
+        "now_local": now.isoformat(timespec="seconds"),
+        "interpretations_version": interpretations.current().version,
+    }
+    return result
+
+
+def timeline_summary(tl, this_year: int) -> dict:
+    """Timeline -> 可 JSON 化的摘要 (起運、八步大運、今年流年)"""
+    current = tl.dayun_at(this_year)
+    liunian = next((ln for ln in tl.liunian if ln.year == this_year), None)
+    return {
+        "forward": tl.forward,
+        "start": tl.start.isoformat(timespec="minutes"),
+        "start_offset": {"years": tl.start_offset[0], "months": tl.start_offset[1],
+                         "days": tl.start_offset[2], "hours": tl.start_offset[3]},
+        "dayun": [{"pillar": d.pillar, "start_year": d.start.year, "start_age": d.start_age} for d in tl.dayun],
+        "current_dayun": current.pillar if current else None,
+        "this_year": {"year": this_year, "pillar": liunian.pillar if liunian else None,
+                      "age": liunian.age if liunian else None},
+    }
 
-        # 2) 計算「使用者八字」
-        user_bazi = calc_bazi_8char(year, month, day, hour, minute)
 
-        # 3) 計算「今日八字」（以 Asia/Taipei 為準；若缺 tzdata 則退回 UTC+8）
-        now = now_in_taipei()
-        today_bazi = calc_bazi_8char(now.year, now.month, now.day, now.hour, now.minute)
+def hour_variant_summary(variants, birth_date: datetime, sex, today_day: str, today_month: str, this_year: int) -> dict:
+    """時辰不詳：每個候選時辰的四柱、強弱、時支關係與目前大運；stable / varying 列出關係是否隨時辰改變"""
+    rels, stable = compare_hour_variants(
+        [(v.bazi.day[-1], v.branch) for v in variants], today_day, today_month)
+    rows = []
+    for v, rel in zip(variants, rels):
+        tl = bazi_py.luck_timeline(
+            bazi_py.variant_start(v, birth_date.year, birth_date.month, birth_date.day), sex, v.bazi)
+        current = tl.dayun_at(this_year)
+        rows.append({
+            "hour": bazi_py.hour_label(v),
+            "range": "%s-%s" % (v.start, v.end),
+            "pillars": list(v.bazi.as_tuple()),
+            "strength": ten_gods.score(v.bazi)["strength"],
+            "relations": rel,
+            "current_dayun": current.pillar if current else None,
+            "jie": v.jie.isoformat(timespec="seconds") if v.jie else None,
+            "after_jie": list(v.after_jie.as_tuple()) if v.after_jie else None,
+        })
+    return {
+        "rows": rows,
+        "stable": [VARIANT_RELATIONS[k] for k, ok in stable.items() if ok],
+        "varying": [VARIANT_RELATIONS[k] for k, ok in stable.items() if not ok],
+    }
 
-        # 4) 抽取地支：日主地支、今日日支、今日月支
-        user_day = user_bazi.day[-1]
-        today_day = today_bazi.day[-1]
-        today_month = today_bazi.month[-1]
 
-        # 5) 依序丟給 bazi_calc_v2
-        if not all(b in ZHI for b in [user_day, today_day, today_month]):
-            raise ValueError("地支解析異常（請確認八字輸出是否為「天干地支」兩字組合）")
+def render_result(result: dict) -> str:
+    with stage("render"):
+        return app.jinja_env.get_template("result.html").render(result=result)
 
-        result = WebBaziAnalyzer.get_analysis_result(user_day, today_day, today_month)
 
-        # debug：保留四柱方便你檢查
-        result["debug_info"] = {
-            "user_pillars": [user_bazi.year, user_bazi.month, user_bazi.day, user_bazi.hour],
-            "today_pillars": [today_bazi.year, today_bazi.month, today_bazi.day, today_bazi.hour],
-            "now_local": now.isoformat(timespec="seconds") if "now" in locals() else None,
-        }
+# 結果頁快取：頁面只取決於下列表單欄位 + 今日四柱 / 時區 + 今年 + 文案版本 + 模板
+PAGE_FIELDS = ('year', 'month', 'day', 'hour', 'minute', 'hour_unknown', 'calendar', 'leap', 'sex', 'locale')
+PAGE_VERSION = hashlib.sha1(RESULT_HTML.encode("utf-8")).hexdigest()[:8]
+PAGE_TTL = float(os.environ.get("BAZI_PAGE_CACHE_TTL") or 600)
+PAGE_GRACE = 60.0
 
-        return render_template_string(RESULT_HTML, result=result)
 
-    except Exception as e:
-        traceback.print_exc()
-        return f"""
+def analyze_page(data) -> str:
+    """/analyze 的 HTML；同樣的輸入在同一時辰內跨實例只渲染一次 (BAZI_PAGE_CACHE_TTL=0 關閉)"""
+    with stage("today"):
+        today = today_for(data)
+    if PAGE_TTL <= 0:
+        return render_result(compute_analysis(data, today))
+    now, zone_label, today_bazi = today
+    parts = (PAGE_VERSION, interpretations.current().version, zone_label, "".join(today_bazi.as_tuple()), now.year) + \
+        tuple((data.get(f) or '').strip() for f in PAGE_FIELDS)
+    return shared_cache.CACHE.get_or_compute(
+        "page", parts, lambda: render_result(compute_analysis(data, today)), ttl=PAGE_TTL, grace=PAGE_GRACE)
+
+
+def error_page(e: Exception) -> str:
+    return f"""
         <div style="font-family:sans-serif; text-align:center; padding-top:50px;">
             <h1 style="color:#c0392b;">⚠️ 分析發生中斷</h1>
-            <p>原因：{str(e)}</p>
+            <p>原因：{html.escape(str(e))}</p>
             <p>請按上一頁修正輸入後再試一次。</p>
             <a href="/" style="display:inline-block; margin-top:20px; padding:10px 20px; background:#5d4037; color:white; text-decoration:none; border-radius:5px;">回首頁</a>
         </div>
-        """, 500
+        """
+
+
+def crawler_enabled() -> bool:
+    # 舊的爬蟲路徑 (headless Chrome)；預設關閉，BAZI_ENABLE_CRAWLER=1 才開
+    # 壓測時可配合 BAZI_NCC_URL 指向 ncc_standin.py
+    return os.environ.get("BAZI_ENABLE_CRAWLER") == "1"
+
+
+def scrape_pillars(data) -> dict:
+    import crawler_service  # selenium 只有這條路徑需要
+    return crawler_service.scrape_all_data(
+        data.get('name', ''), data.get('sex', '1'), data.get('year', '76'),
+        int(data.get('month')), int(data.get('day')),
+        int(data.get('hour') or 12), int(data.get('minute') or 0),
+    )
+
+
+def busy_page():
+    return """
+        <div style="font-family:sans-serif; text-align:center; padding-top:50px;">
+            <h1 style="color:#d35400;">⏳ 目前使用人數較多</h1>
+            <p>系統正忙，請稍候幾秒再試一次。</p>
+            <a href="/" style="display:inline-block; margin-top:20px; padding:10px 20px; background:#5d4037; color:white; text-decoration:none; border-radius:5px;">回首頁</a>
+        </div>
+        """, "text/html; charset=utf-8"
+
+
+def busy_json():
+    return '{"error": "server busy, retry later"}', "application/json"
+
+
+# 准入控制：本地排盤與爬蟲各有自己的名額 (admission.CPU / admission.SCRAPE)，額滿直接 503
+@app.route('/analyze', methods=['POST'])
+@admission.admit(admission.CPU, busy_page)
+def analyze():
+    try:
+        return analyze_page(request.form)
+    except ValueError as e:
+        log.warning("analyze rejected: %s", e)
+        return error_page(e), 400
+    except Exception as e:
+        log.exception("analyze failed")
+        return error_page(e), 500
+
+@app.route('/api/analyze', methods=['POST'])
+@admission.admit(admission.CPU, busy_json)
+def api_analyze():
+    # 與 /analyze 相同的運算，回傳 JSON (不渲染 HTML)
+    try:
+        return jsonify(compute_analysis(request.form))
+    except Exception as e:
+        log.warning("api analyze rejected: %s", e)
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/scrape', methods=['POST'])
+def api_scrape():
+    if not crawler_enabled():
+        return jsonify({"error": "crawler disabled"}), 404
+    return _scrape()
+
+@admission.admit(admission.SCRAPE, busy_json)
+def _scrape():
+    try:
+        return jsonify(scrape_pillars(request.form))
+    except Exception as e:
+        log.exception("scrape failed")
+        return jsonify({"error": str(e)}), 500
+
+def readiness():
+    """(status, payload)：預熱完成才是 200，並附上預熱時的自我量測 (方便找出慢的節點)"""
+    with _WARM_LOCK:
+        state = dict(WARM_STATE)
+    if not state["ready"]:
+        warmup_in_background()
+        return 503, {"ready": False, "warming": True, "error": state["error"], "pid": os.getpid()}
+    return 200, dict(state, pid=os.getpid())
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    # 存活檢查：行程還能回應就是 200 (不代表已預熱)
+    return jsonify({"status": "ok", "pid": os.getpid()})
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    status, payload = readiness()
+    return jsonify(payload), status
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Prometheus 文字格式；多 worker 時由 BAZI_METRICS_DIR 彙總
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+def admin_authorized() -> bool:
+    """管理端點需帶 X-Admin-Token，且與 BAZI_ADMIN_TOKEN 相同；未設定 token 時一律拒絕"""
+    return admin_token_ok(request.headers.get("X-Admin-Token"))
+
+def admin_token_ok(sent) -> bool:
+    """admin_authorized 的核心 (ASGI 也用)：sent 為請求帶的 X-Admin-Token"""
+    expected = os.environ.get("BAZI_ADMIN_TOKEN")
+    return bool(expected and sent and hmac.compare_digest(sent, expected))
+
+@app.route('/admin/profile', methods=['GET', 'DELETE'])
+def admin_profile():
+    # 取樣剖析結果：?route=POST%20/analyze&top=30&sort=cumulative；DELETE 清空
+    if not admin_authorized():
+        return "forbidden\n", 403, {"Content-Type": "text/plain; charset=utf-8"}
+    if PROFILER is None:
+        return "profiling disabled (set BAZI_PROFILE_RATE or BAZI_PROFILE_TOKEN)\n", 404, {"Content-Type": "text/plain; charset=utf-8"}
+    if request.method == 'DELETE':
+        PROFILER.reset()
+        return "reset\n", 200, {"Content-Type": "text/plain; charset=utf-8"}
+    try:
+        limit = int(request.args.get("top", 30))
+    except ValueError:
+        limit = 30
+    sort = request.args.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime", "ncalls", "time", "calls"):
+        sort = "cumulative"
+    text = PROFILER.top(request.args.get("route"), limit=limit, sort=sort)
+    return text, 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+@app.route('/export/readings', methods=['GET'])
+def export_readings():
+    # 每日運勢 NDJSON 串流 (daily_feed)：?start=YYYY-MM-DD&end=YYYY-MM-DD&cursor=&full=1&locale=
+    # 使用者清單在 BAZI_FEED_USERS；串流中斷時用最後一行的 cursor 續傳
+    if not admin_authorized():
+        return jsonify({"error": "forbidden"}), 403
+    if not daily_feed.USERS_PATH:
+        return jsonify({"error": "export disabled (set BAZI_FEED_USERS)"}), 404
+    try:
+        params = export_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    gate = admission.EXPORT
+    if not gate.acquire():
+        return jsonify({"error": "busy"}), 503, {"Retry-After": str(gate.retry_after)}
+    try:
+        blocks = daily_feed.export(daily_feed.USERS_PATH, *params)
+    except (ValueError, OSError) as e:
+        gate.release()
+        return jsonify({"error": str(e)}), 400
+    # 名額在串流送完或用戶端斷線時 (WSGI close) 歸還
+    resp = Response(blocks, content_type=daily_feed.CONTENT_TYPE, headers={"Cache-Control": "no-store"})
+    resp.call_on_close(gate.release)
+    return resp
+
+def export_params(args):
+    """/export/readings 的查詢參數 -> daily_feed.export 的 (start, end, cursor, locale, full)；WSGI 與 ASGI 共用"""
+    try:
+        start = date.fromisoformat(args.get("start", ""))
+        end = date.fromisoformat(args.get("end", ""))
+    except ValueError:
+        raise ValueError("start / end 需為 YYYY-MM-DD")
+    locale = args.get("locale") or None
+    if locale and locale not in interpretations.current().locales:
+        raise ValueError("不支援的語系：%s" % locale)
+    return start, end, args.get("cursor", ""), locale, args.get("full") == "1"
+
+@app.route('/admin/memory', methods=['GET', 'POST', 'DELETE'])
+def admin_memory():
+    # 本 worker 的記憶體帳：?top=20；?diff=baseline..latest；POST ?action=snapshot&label=x | start | stop；DELETE 清快照
+    if not admin_authorized():
+        return jsonify({"error": "forbidden"}), 403
+    status, payload = memory_admin(request.method, request.args)
+    return jsonify(payload), status
+
+def memory_admin(method, args):
+    """/admin/memory 的內容 (WSGI 與 ASGI 共用；呼叫前先驗 token)：回傳 (status, 可 JSON 化的 dict)"""
+    try:
+        top = max(1, min(int(args.get("top", 20)), 200))
+    except ValueError:
+        top = 20
+    try:
+        if method == 'DELETE':
+            MEMPROF.reset()
+            return 200, {"reset": True}
+        if method == 'POST':
+            action = args.get("action", "snapshot")
+            if action == "start":
+                MEMPROF.start()
+            elif action == "stop":
+                MEMPROF.stop()
+            elif action == "snapshot":
+                return 200, {"label": MEMPROF.snapshot(args.get("label") or None), "snapshots": MEMPROF.labels()}
+            else:
+                return 400, {"error": "action 需為 snapshot / start / stop"}
+            return 200, {"tracing": action == "start"}
+        diff = args.get("diff")
+        if diff:
+            old, sep, new = diff.partition("..")
+            if not sep:
+                return 400, {"error": "diff 格式為 OLD..NEW"}
+            return 200, MEMPROF.diff(old, new or "latest", top)
+        return 200, MEMPROF.report(top)
+    except KeyError as e:
+        return 404, {"error": e.args[0]}
+    except RuntimeError as e:
+        return 409, {"error": str(e)}
 
 if __name__ == '__main__':
     # 本機測試用：Render 會用 gunicorn 啟動，不會走到這裡
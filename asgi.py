@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI 進入點 (非同步服務模式)
+
+  uvicorn asgi:app --host 0.0.0.0 --port $PORT
+  gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker asgi:app
+
+與 WSGI 的 app.py 共用同一套運算與模板 (compute_analysis / render_result / scrape_pillars)，
+差別在於：event loop 不做重活，
+  - 排盤 + 渲染 (CPU) 丟到有上限的執行緒池 (BAZI_ASGI_CPU_WORKERS，預設 CPU 數)
+  - 爬蟲 (等待 I/O) 丟到另一個小池子 (BAZI_ASGI_SCRAPE_WORKERS，預設 2) 並 await
+所以慢路徑只佔用池子裡的一個位置，不會卡住整個 worker；同一個 worker 可同時掛著大量連線。
+串流匯出 /export/readings 也與 WSGI 相同 (admission.EXPORT)：區塊在 CPU 池裡一塊一塊產生，
+await send() 送出後才產生下一塊 (背壓)；送完、出錯或用戶端斷線時關掉 generator 並歸還名額。
+管理端點 /admin/memory 與 WSGI 相同 (X-Admin-Token，內容由 app.memory_admin 產生)；
+/admin/profile 依賴 WSGI 中介層 (profiler.py)，只在 WSGI 模式提供。
+執行緒池的佇列沒有上限，所以送進池子之前先過與 WSGI 相同的准入控制 (admission.CPU / admission.SCRAPE)：
+額滿時在 event loop 裡排隊 (每 ADMIT_POLL 秒再試，不佔執行緒)，排不進去或逾時就回 503 + Retry-After。
+"""
+import asyncio
+import contextvars
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import admission
+import app as wsgi
+import daily_feed
+import jsonlog
+import metrics
+
+MAX_BODY = 64 * 1024
+# 排隊中的請求多久再試一次名額 (秒)
+ADMIT_POLL = 0.005
+
+CPU_WORKERS = int(os.environ.get("BAZI_ASGI_CPU_WORKERS") or (os.cpu_count() or 1))
+SCRAPE_WORKERS = int(os.environ.get("BAZI_ASGI_SCRAPE_WORKERS") or 2)
+
+_cpu_pool = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="bazi-cpu")
+_scrape_pool = ThreadPoolExecutor(max_workers=SCRAPE_WORKERS, thread_name_prefix="bazi-scrape")
+
+HTML = "text/html; charset=utf-8"
+JSON = "application/json"
+TEXT = "text/plain; charset=utf-8"
+
+_INDEX_BODY = None
+
+log = jsonlog.get_logger("asgi")
+access = jsonlog.get_logger("access")
+
+
+async def _offload(pool, fn, *args):
+    """在執行緒池執行 fn；帶上目前的 contextvars，stage() 的耗時才收得進 Server-Timing"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(pool, ctx.run, fn, *args)
+
+
+async def _admit(gate):
+    """不阻塞 event loop 的准入：規則與 Gate.acquire() 相同 (有人排隊就得排、最多排 gate.wait 秒)"""
+    if gate.try_acquire():
+        return True
+    if not gate.enqueue():
+        return False
+    t0 = time.monotonic()
+    deadline = t0 + gate.wait
+    try:
+        while not gate.acquire_queued(t0):
+            if time.monotonic() >= deadline:
+                gate.give_up(t0)
+                return False
+            await asyncio.sleep(ADMIT_POLL)
+    except asyncio.CancelledError:
+        gate.give_up(t0)
+        raise
+    return True
+
+
+async def _gated(gate, busy, handler, *args):
+    """拿到名額才執行 handler；額滿回 503 + Retry-After (內容由 busy() 決定，與 WSGI 相同)"""
+    if not await _admit(gate):
+        body, ctype = busy()
+        return 503, ctype, body, [(b"retry-after", str(gate.retry_after).encode("latin-1"))]
+    try:
+        return await handler(*args)
+    finally:
+        gate.release()
+
+
+def _json(obj):
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def _analyze_and_render(form):
+    return wsgi.analyze_page(form)
+
+
+def _render_index():
+    return wsgi.app.jinja_env.get_template("index.html").render()
+
+
+# ==========================================
+# 路由
+# ==========================================
+async def index(form, scope):
+    global _INDEX_BODY
+    # 首頁是靜態內容：渲染一次後重用
+    if _INDEX_BODY is None:
+        _INDEX_BODY = await _offload(_cpu_pool, _render_index)
+    return 200, HTML, _INDEX_BODY
+
+
+async def analyze(form, scope):
+    return await _gated(admission.CPU, wsgi.busy_page, _analyze, form)
+
+
+async def _analyze(form):
+    try:
+        return 200, HTML, await _offload(_cpu_pool, _analyze_and_render, form)
+    except ValueError as e:
+        log.warning("analyze rejected: %s", e)
+        return 400, HTML, wsgi.error_page(e)
+    except Exception as e:
+        log.exception("analyze failed")
+        return 500, HTML, wsgi.error_page(e)
+
+
+async def api_analyze(form, scope):
+    return await _gated(admission.CPU, wsgi.busy_json, _api_analyze, form)
+
+
+async def _api_analyze(form):
+    try:
+        return 200, JSON, _json(await _offload(_cpu_pool, wsgi.compute_analysis, form))
+    except Exception as e:
+        log.warning("api analyze rejected: %s", e)
+        return 400, JSON, _json({"error": str(e)})
+
+
+async def api_scrape(form, scope):
+    if not wsgi.crawler_enabled():
+        return 404, JSON, _json({"error": "crawler disabled"})
+    return await _gated(admission.SCRAPE, wsgi.busy_json, _api_scrape, form)
+
+
+async def _api_scrape(form):
+    try:
+        return 200, JSON, _json(await _offload(_scrape_pool, wsgi.scrape_pillars, form))
+    except Exception as e:
+        log.exception("scrape failed")
+        return 500, JSON, _json({"error": str(e)})
+
+
+async def export_readings(form, scope):
+    if not wsgi.admin_token_ok(_header(scope, b"x-admin-token")):
+        return 403, JSON, _json({"error": "forbidden"})
+    if not daily_feed.USERS_PATH:
+        return 404, JSON, _json({"error": "export disabled (set BAZI_FEED_USERS)"})
+    try:
+        params = wsgi.export_params(_parse_form(scope.get("query_string")))
+    except ValueError as e:
+        return 400, JSON, _json({"error": str(e)})
+    gate = admission.EXPORT
+    if not await _admit(gate):
+        return 503, JSON, _json({"error": "busy"}), [(b"retry-after", str(gate.retry_after).encode("latin-1"))]
+    try:
+        # export() 先排好日曆 (CPU) 再回傳 generator
+        blocks = await _offload(_cpu_pool, daily_feed.export, daily_feed.USERS_PATH, *params)
+    except (ValueError, OSError) as e:
+        gate.release()
+        return 400, JSON, _json({"error": str(e)})
+    except BaseException:
+        gate.release()
+        raise
+    return 200, daily_feed.CONTENT_TYPE, _stream(gate, blocks), [(b"cache-control", b"no-store")]
+
+
+async def _stream(gate, blocks):
+    """在 CPU 池裡逐塊取出 blocks；結束 (含 aclose) 時關掉 generator 並歸還名額"""
+    try:
+        while True:
+            block = await _offload(_cpu_pool, next, blocks, None)
+            if block is None:
+                return
+            yield block
+    finally:
+        try:
+            blocks.close()
+        except ValueError:
+            pass  # 被取消時下一塊可能還在執行緒裡產生：交給 GC 收尾
+        gate.release()
+
+
+async def admin_memory(form, scope):
+    if not wsgi.admin_token_ok(_header(scope, b"x-admin-token")):
+        return 403, JSON, _json({"error": "forbidden"})
+    # 快照 / 比對要走過整個 heap：丟到執行緒池，不卡 event loop
+    status, payload = await _offload(_cpu_pool, wsgi.memory_admin, scope["method"],
+                                     _parse_form(scope.get("query_string")))
+    return status, JSON, _json(payload)
+
+
+async def metrics_endpoint(form, scope):
+    return 200, metrics.CONTENT_TYPE, await _offload(_cpu_pool, metrics.REGISTRY.render)
+
+
+async def healthz(form, scope):
+    return 200, JSON, _json({"status": "ok", "pid": os.getpid()})
+
+
+async def readyz(form, scope):
+    # lifespan 預熱完成前回 503；不經過執行緒池，池子忙的時候也能回應
+    status, payload = wsgi.readiness()
+    return status, JSON, _json(payload)
+
+
+ROUTES = {
+    ("GET", "/"): index,
+    ("POST", "/analyze"): analyze,
+    ("POST", "/api/analyze"): api_analyze,
+    ("POST", "/api/scrape"): api_scrape,
+    ("GET", "/metrics"): metrics_endpoint,
+    ("GET", "/healthz"): healthz,
+    ("GET", "/readyz"): readyz,
+    ("GET", "/export/readings"): export_readings,
+    ("GET", "/admin/memory"): admin_memory,
+    ("POST", "/admin/memory"): admin_memory,
+    ("DELETE", "/admin/memory"): admin_memory,
+}
+_PATHS = {path for _, path in ROUTES}
+
+
+# ==========================================
+# ASGI 協定
+# ==========================================
+async def _read_body(receive):
+    chunks, size = [], 0
+    while True:
+        msg = await receive()
+        if msg["type"] == "http.disconnect":
+            return None
+        chunk = msg.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY:
+            raise ValueError("request body too large")
+        chunks.append(chunk)
+        if not msg.get("more_body"):
+            return b"".join(chunks)
+
+
+def _header(scope, name):
+    for k, v in scope.get("headers", ()):
+        if k == name:
+            return v.decode("latin-1")
+    return None
+
+
+def _parse_form(body):
+    """urlencoded (本文或 query string) -> {key: 第一個值}，介面與 request.form.get 相同"""
+    if not body:
+        return {}
+    return {k: v[0] for k, v in parse_qs(body.decode("utf-8", "replace")).items()}
+
+
+async def _respond(send, status, ctype, payload, extra_headers=(), receive=None):
+    if not isinstance(payload, (str, bytes)):
+        return await _respond_stream(send, receive, status, ctype, payload, extra_headers)
+    data = payload.encode("utf-8") if isinstance(payload, str) else payload
+    headers = [(b"content-type", ctype.encode("latin-1")),
+               (b"content-length", str(len(data)).encode("latin-1"))]
+    headers.extend(extra_headers)
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": data})
+
+
+async def _wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _respond_stream(send, receive, status, ctype, chunks, extra_headers):
+    """payload 是 async generator：逐塊送出 (more_body)；用戶端斷線就停下並 aclose()"""
+    headers = [(b"content-type", ctype.encode("latin-1"))]
+    headers.extend(extra_headers)
+    gone = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        async for chunk in chunks:
+            if gone.done():
+                return
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    except OSError:
+        pass  # 送出時連線已斷 (伺服器回報的 ClientDisconnected 之類)
+    finally:
+        gone.cancel()
+        await chunks.aclose()
+
+
+async def _lifespan(receive, send):
+    while True:
+        msg = await receive()
+        if msg["type"] == "lifespan.startup":
+            try:
+                iterations = int(os.environ.get("BAZI_WARMUP_ITERATIONS") or 3)
+                await _offload(_cpu_pool, wsgi.warmup, iterations)
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif msg["type"] == "lifespan.shutdown":
+            _cpu_pool.shutdown(wait=False)
+            _scrape_pool.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"]
+    handler = ROUTES.get((method, path))
+    if handler is None:
+        status = 405 if path in _PATHS else 404
+        return await _respond(send, status, TEXT, "method not allowed\n" if status == 405 else "not found\n")
+
+    try:
+        body = await _read_body(receive)
+    except ValueError as e:
+        return await _respond(send, 413, TEXT, str(e) + "\n")
+    if body is None:
+        return  # 用戶端已斷線
+
+    t0 = time.perf_counter()
+    rid, rid_token = jsonlog.bind_request_id(_header(scope, b"x-request-id"))
+    token = metrics.begin_request()
+    try:
+        status, ctype, payload, *headers = await handler(_parse_form(body), scope)
+    finally:
+        timings = metrics.end_request(token)
+    total = time.perf_counter() - t0
+
+    extra = [(b"x-request-id", rid.encode("latin-1"))]
+    if headers:
+        extra.extend(headers[0])
+    if timings:
+        extra.append((b"server-timing",
+                      metrics.server_timing_header(timings + [("total", total)]).encode("latin-1")))
+    metrics.record_request(path, method, status, total)
+    access.info("%s %s %d", method, path, status, extra={
+        "route": path, "method": method, "status": status, "ms": round(total * 1000.0, 3),
+        "phases": {name: round(dt * 1000.0, 3) for name, dt in timings},
+    })
+    jsonlog.reset_request_id(rid_token)
+    # 串流回應：上面記的是開始送出前的耗時
+    await _respond(send, status, ctype, payload, extra, receive)
@@ -1,300 +1,34 @@
 # -*- coding: utf-8 -*-
 # 注意：此檔案已移除 tkinter，專供 Render 雲端環境使用
 # ==========================================
-# 1. 解讀資料庫 (完整保留您的文案)
+# 1. 解讀資料庫
+# 文案放在 data/interpretations.json (見 interpretations.py)：
+# 第一次用到才載入，檔案更新後自動換版，不必重新部署程式
 # ==========================================
+import sys
+from array import array
+from collections import Counter
 
-ZHI = list("子丑寅卯辰巳午未申酉戌亥")
-
-# 1. 第一層：今日運勢解讀 (針對 日支 vs 日支)
-INTERPRETATIONS_DAY = {
-    "沖": """
-【今日狀態】
-內在拉扯感強，想動、想改、想換方向，但判斷雜訊高。
-
-👉 建議：
-重要決定延後
-行動以「清理、調整、移動」為主
-不要在情緒波動時做承諾
-
-行動指引
-整理清單、刪減計畫
-只做「可逆」的事
-把定案留給明天
-
-一句核心提醒
-👉 今天可以動，但不要定錨
-""",
-    
-    "六合": """
-【今日狀態】
-內外狀態對齊，溝通順、阻力低。
-
-👉 建議：適合談判、協商、溝通
-
-適合修復關係
-小事可順手完成
-
-行動指引
-主動聯絡一個人
-處理卡很久的對話
-把話說清楚就好
-
-一句核心提醒
-👉 今天說出口的話，容易被理解。
-""",
-    
-    "刑 (自刑)": """
-【今日狀態】
-情緒與思緒反覆打轉，自己卡自己。
-
-👉 建議：
-停止反覆思考同一件事
-行動要簡單、單一
-不追求完美
-
-行動指引
-做一件「不用想太多」的小事
-設時間上限
-想不通就先放下
-
-一句核心提醒
-👉 今天不是你不行，是想太多。
-""",
-
-    "刑 (無恩之刑)": """
-【今日狀態】
-責任感過重，容易覺得「都是我該扛」。
-
-👉 建議：
-不主動多接任務
-區分「該做」與「別人該做」
-避免過度付出
-
-行動指引
-明確分工
-該拒絕就拒絕
-把界線說清楚
-
-一句核心提醒
-👉 今天你不用證明自己。
-""",
-
-    "刑 (恃勢之刑)": """
-【今日狀態】
-容易用意志硬推事情，忽略阻力。
-👉 建議：
-放慢節奏
-多聽回饋
-不用急著壓過別人
-
-行動指引
-問一句「你的想法是？」
-調整方式，而非目標
-留空間給對方
-
-一句核心提醒
-👉 今天柔一點，反而走得更遠。
-""",
-
-    "刑 (無禮之刑)": """
-【今日狀態】
-情緒表達直接，容易無意傷人。
-
-👉 建議：
-說話前多停一秒
-避免情緒化回應
-不在氣頭上對話
-
-行動指引
-用文字代替即時回應
-把情緒先寫下來
-等平穩再說
-
-一句核心提醒
-👉 今天不是你說錯，是太快。""",
-
-    "害": """
-【今日狀態】
-隱性消耗日，容易被人事牽動，做完事特別累。
-
-👉 建議：
-減少情緒勞動
-保留界線，不多扛
-不必事事回應
-
-行動指引
-少社交、少解釋
-把時間留給自己
-有疲累感時直接停
-
-一句核心提醒
-👉 今天保護能量，比完成事情重要。
-""",
-    
-    "破": """
-【今日狀態】
-結構鬆動，細節容易出錯，小地方慢慢耗能。
-
-👉 建議：
-檢查比推進重要
-放慢節奏，補漏洞
-財務、合約需反覆確認
-
-行動指引
-回頭檢查已完成的事
-補資料、補流程、補說明
-不追效率，只求穩定
-
-一句核心提醒
-👉 今天不是慢，是在避免後悔。
-""",
-    
-    "半合": """
-【今日狀態】
-助力出現，但尚未成局，需要你先動。
-
-👉 建議：適合鋪路，不適合收成
+import interpretations
+import memprof
+from ten_gods import STEMS, pillar_index
 
-行動比觀望重要
-不用一次做到位
-
-行動指引
-先做第一步
-試水溫、丟出訊號
-累積條件，不急著結果
-
-一句核心提醒
-👉 今天是在累積，不是結算。
-""",
-    
-    "無特殊關係": """
-【今日狀態】
-平平淡淡，適合按部就班。
+ZHI = list("子丑寅卯辰巳午未申酉戌亥")
 
-👉 建議：專注在手邊的工作。"""
+# 舊程式用的名稱：INTERPRETATIONS_DAY (日支 vs 日支)、INTERPRETATIONS_MONTH (日支 vs 月支)、
+# INTERPRETATIONS (舊版單一字典，等同 DAY)；每次取用都是目前這一版的唯讀對照表
+_LEGACY_NAMES = {
+    "INTERPRETATIONS_DAY": "day",
+    "INTERPRETATIONS_MONTH": "month",
+    "INTERPRETATIONS": "day",
 }
 
-# 2. 第二層：本月環境解讀 (針對 日支 vs 月支)
-INTERPRETATIONS_MONTH = {
-    "沖": """
-【本月氣場】
-這段時間你容易在方向與選擇之間反覆，
-一邊想推進，一邊又想重來。
-不是你優柔寡斷，而是外在環境與內在節奏不同步。
-
-👉 月提醒：
-計畫容易修改
-對「要不要換方向」特別敏感
-心裡常同時存在兩個答案
-本月調整方向建議
-不急著一次選對
-允許試錯與微調
-把「選擇」拆成階段完成
-
-一句背景型核心提醒
-👉 最近的重點不是定案，而是釐清。
-""",
-    
-    "六合": """
-【本月氣場】
-近期狀態背景定義
-這段時間你的內外狀態較容易對齊，
-人際互動與溝通阻力偏低。
-
-👉 月提醒：
-容易被理解
-關係修復機會增加
-合作意願提高
-本月調整方向建議
-經營長期關係
-把話說清楚、說完整
-推動需要共識的事
-
-一句背景型核心提醒
-👉 最近適合把關係走得更穩。
-""",
-    
-    "刑": """
-【本月氣場】
-近期狀態背景定義
-這段時間內在張力較高，
-容易感到壓力、責任或自我要求加重。
-
-👉 月提醒：
-想得多、做得慢
-對自己要求偏高
-容易累積悶感
-本月調整方向建議
-放下過度自責
-調整期待值
-把力氣用在可控範圍
-
-一句背景型核心提醒
-👉 最近不是你不夠好，而是負荷太多。""",
-
-    "害": """
-【本月氣場】
-近期狀態背景定義
-這段時間你容易在不自覺中付出能量，
-對人、對事都比較容易被牽動。
-
-👉 月提醒：
-做完事特別累
-情緒容易被影響
-很難完全放鬆
-本月調整方向建議
-重設界線與節奏
-減少不必要的情緒投入
-把「照顧自己」放回優先順序
-
-一句背景型核心提醒
-👉 最近的疲累，來自界線模糊，不是能力不足。
-""",
-
-    "破": """
-【本月氣場】
-近期狀態背景定義
-這段時間事情容易變得零散、瑣碎，
-不是大問題，而是原本的結構開始不合用。
-
-👉 月提醒：
-小事變多
-常覺得「一直在補」
-難以一次做到位
-本月調整方向建議
-回頭重整流程與架構
-不要只補洞，要想重排
-接受「舊方式正在退場」
-
-一句背景型核心提醒
-👉 最近不是你效率差，而是結構該更新了。
-""",
-
-    "半合": """【本月氣場】
-近期狀態背景定義
-這段時間助力正在形成，但尚未完全到位，
-你會感覺「好像快了，但還差一點」。
-
-👉 月提醒：
-有方向感，但成果未明
-容易卡在中段
-需要耐心鋪路
-本月調整方向建議
-持續累積條件
-不急著收成
-專注在「讓事情更成熟」
-
-一句背景型核心提醒
-👉 最近是在醞釀，不是停滯。
-""",
-
-    "無特殊關係": """【本月氣場】這個月氣場穩定，無風無雨。
-👉 月提醒：累積實力，等待時機。"""
-}
 
-# 舊版單一字典 (為了相容性保留一份指針)
-INTERPRETATIONS = INTERPRETATIONS_DAY
+def __getattr__(name):
+    layer = _LEGACY_NAMES.get(name)
+    if layer is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    return interpretations.current().layer(layer)
 
 # 關係對照表
 LIU_HE = {
@@ -365,48 +99,294 @@ def analyze_pair_logic(main_zhi, target_zhi, detailed_xing=False):
         
     return relations
 
+# ==========================================
+# 天干關係 + 60×60 整柱關係表 (第三層：日柱 vs 今日日柱)
+# 每格是 16-bit 旗標 (array("H")，3600 格 = 7 KB)，索引 = 甲子索引(主) × 60 + 甲子索引(客)
+# 甲子索引同 ten_gods.pillar_index / pack_many (0 甲子 … 59 癸亥)，批次可直接用打包好的 array("B")
+# 表只記事實 (例如沖的兩干也互剋)，取捨 (合 / 沖優先於剋) 在 pillar_pair_logic 做
+# ==========================================
+GAN_HE = {"甲": "己", "己": "甲", "乙": "庚", "庚": "乙", "丙": "辛", "辛": "丙",
+          "丁": "壬", "壬": "丁", "戊": "癸", "癸": "戊"}
+GAN_HE_ELEMENT = {"甲己": "土", "乙庚": "金", "丙辛": "水", "丁壬": "木", "戊癸": "火"}
+GAN_CHONG = {"甲": "庚", "庚": "甲", "乙": "辛", "辛": "乙", "丙": "壬", "壬": "丙", "丁": "癸", "癸": "丁"}
+
+REL_GAN_HE = 1 << 0           # 天干五合
+REL_GAN_CHONG = 1 << 1        # 天干相沖
+REL_GAN_KE_OUT = 1 << 2       # 主干剋客干 (我剋)
+REL_GAN_KE_IN = 1 << 3        # 客干剋主干 (剋我)
+REL_ZHI_HE = 1 << 4           # 地支六合
+REL_ZHI_BAN_HE = 1 << 5
+REL_ZHI_CHONG = 1 << 6
+REL_ZHI_XING = 1 << 7
+REL_ZHI_HAI = 1 << 8
+REL_ZHI_PO = 1 << 9
+REL_FU_YIN = 1 << 10          # 同一柱
+REL_TIAN_DI_HE = 1 << 11      # 天干五合 + 地支六合
+REL_TIAN_KE_DI_CHONG = 1 << 12  # 天干沖 / 剋 + 地支沖
+
+RELATION_FLAGS = (
+    (REL_GAN_HE, "天干五合"), (REL_GAN_CHONG, "天干相沖"),
+    (REL_GAN_KE_OUT, "天干相剋 (我剋)"), (REL_GAN_KE_IN, "天干相剋 (剋我)"),
+    (REL_ZHI_HE, "六合"), (REL_ZHI_BAN_HE, "半合"), (REL_ZHI_CHONG, "沖"),
+    (REL_ZHI_XING, "刑"), (REL_ZHI_HAI, "害"), (REL_ZHI_PO, "破"),
+    (REL_FU_YIN, "伏吟"), (REL_TIAN_DI_HE, "天地合"), (REL_TIAN_KE_DI_CHONG, "天剋地沖"),
+)
+
+_ZHI_FLAGS = {"六合": REL_ZHI_HE, "半合": REL_ZHI_BAN_HE, "沖": REL_ZHI_CHONG,
+              "刑": REL_ZHI_XING, "害": REL_ZHI_HAI, "破": REL_ZHI_PO}
+
+
+def _gan_mask(a, b):
+    """天干索引 (0 甲 … 9 癸) 兩兩關係；五行依相生順序，相差 2 步是我剋、3 步是剋我"""
+    mask = 0
+    if GAN_HE[STEMS[a]] == STEMS[b]:
+        mask |= REL_GAN_HE
+    if GAN_CHONG.get(STEMS[a]) == STEMS[b]:
+        mask |= REL_GAN_CHONG
+    rel = (b // 2 - a // 2) % 5
+    if rel == 2:
+        mask |= REL_GAN_KE_OUT
+    elif rel == 3:
+        mask |= REL_GAN_KE_IN
+    return mask
+
+
+def _build_pillar_table():
+    gan = [[_gan_mask(a, b) for b in range(10)] for a in range(10)]
+    zhi = [[0] * 12 for _ in range(12)]
+    for a in range(12):
+        for b in range(12):
+            for rel in analyze_pair_logic(ZHI[a], ZHI[b]):
+                zhi[a][b] |= _ZHI_FLAGS.get(rel["name"], 0)
+    table = array("H", bytes(2 * 3600))
+    for a in range(60):
+        for b in range(60):
+            g, z = gan[a % 10][b % 10], zhi[a % 12][b % 12]
+            mask = g | z
+            if a == b:
+                mask |= REL_FU_YIN
+            if g & REL_GAN_HE and z & REL_ZHI_HE:
+                mask |= REL_TIAN_DI_HE
+            if g & (REL_GAN_CHONG | REL_GAN_KE_OUT | REL_GAN_KE_IN) and z & REL_ZHI_CHONG:
+                mask |= REL_TIAN_KE_DI_CHONG
+            table[a * 60 + b] = mask
+    return table
+
+
+_PILLAR_TABLE = None
+
+
+def pillar_table():
+    """60×60 旗標表 (第一次用到才建，約幾毫秒)"""
+    global _PILLAR_TABLE
+    if _PILLAR_TABLE is None:
+        _PILLAR_TABLE = _build_pillar_table()
+    return _PILLAR_TABLE
+
+
+def pillar_relation_mask(main_pillar, target_pillar):
+    """「甲子」×「己丑」-> 旗標 (REL_*)"""
+    return pillar_table()[pillar_index(main_pillar) * 60 + pillar_index(target_pillar)]
+
+
+def relation_names(mask):
+    """旗標 -> 名稱列表 (不做取捨，全部列出)"""
+    return [name for flag, name in RELATION_FLAGS if mask & flag]
+
+
+def pillar_pair_logic(main_pillar, target_pillar):
+    """
+    第三層 (整柱 / 天干) 的關係列表，格式同 analyze_pair_logic
+    地支本身的關係已在第一層，這裡只列：伏吟、天地合 / 天干五合、天剋地沖 / 天干相沖 / 天干相剋
+    """
+    mask = pillar_relation_mask(main_pillar, target_pillar)
+    relations = []
+    if mask & REL_FU_YIN:
+        relations.append({"name": "伏吟", "type": "warn"})
+    if mask & REL_GAN_HE:
+        pair = main_pillar[0] + target_pillar[0]
+        element = GAN_HE_ELEMENT.get(pair) or GAN_HE_ELEMENT[pair[::-1]]
+        name = "天地合" if mask & REL_TIAN_DI_HE else "天干五合"
+        relations.append({"name": "%s (%s合%s)" % (name, pair, element), "type": "good"})
+    elif mask & REL_TIAN_KE_DI_CHONG:
+        relations.append({"name": "天剋地沖", "type": "bad"})
+    elif mask & REL_GAN_CHONG:
+        relations.append({"name": "天干相沖", "type": "bad"})
+    elif mask & REL_GAN_KE_IN:
+        relations.append({"name": "天干相剋 (剋我)", "type": "warn"})
+    elif mask & REL_GAN_KE_OUT:
+        relations.append({"name": "天干相剋 (我剋)", "type": "normal"})
+    if not relations:
+        relations.append({"name": "無特殊關係", "type": "normal"})
+    return relations
+
+
+def pillar_masks_batch(main, target):
+    """
+    main：array("B") (甲子索引)；target：同長度的 array("B")，或單一甲子索引 (例如今日日柱)
+    回傳 array("H") 旗標；target 為單一索引時整批用 bytes.translate 查表 (C 迴圈)
+    """
+    table = pillar_table()
+    main = bytes(main)
+    if main and max(main) >= 60:
+        raise ValueError("甲子索引必須介於 0~59")
+    if isinstance(target, int):
+        if not 0 <= target < 60:
+            raise ValueError("甲子索引必須介於 0~59")
+        column = table[target::60]
+        lo = bytes(m & 0xFF for m in column) + bytes(196)
+        hi = bytes(m >> 8 for m in column) + bytes(196)
+        if sys.byteorder == "big":
+            lo, hi = hi, lo
+        out = bytearray(2 * len(main))
+        out[0::2] = main.translate(lo)
+        out[1::2] = main.translate(hi)
+        return array("H", bytes(out))
+    target = bytes(target)
+    if len(target) != len(main):
+        raise ValueError("main 與 target 長度不同")
+    if target and max(target) >= 60:
+        raise ValueError("甲子索引必須介於 0~59")
+    return array("H", [table[a * 60 + b] for a, b in zip(main, target)])
+
+
+def count_relations(masks):
+    """pillar_masks_batch 的結果 -> {名稱: 筆數} (只列出現過的)"""
+    counts = Counter(masks)
+    out = {}
+    for flag, name in RELATION_FLAGS:
+        n = sum(c for m, c in counts.items() if m & flag)
+        if n:
+            out[name] = n
+    return out
+
+# ==========================================
+# 預先計算的 12×12 關係表 (含對應文案)
+# gunicorn 預載 (preload_app) 時在 master 建好，fork 後各 worker 共用同一份記憶體
+# 文案換版 (generation 改變) 時整張表作廢，用新文案重建
+# ==========================================
+_LAYER_TABLE = {}
+_LAYER_GENERATION = None
+
+_LAYER_NAMES = {1: "day", 2: "month", 3: "pillar"}
+
+
+def format_layer(rels, db):
+    """關係列表 -> Web 用的結構 (db 指定要查哪本字典)"""
+    result = []
+    for rel in rels:
+        # 優先找完整名稱 (例如 "刑 (自刑)")
+        full_name = rel["name"]
+        # 其次找基礎名稱 (例如 "刑")
+        base_name = full_name.split(" ")[0]
+
+        # 從指定的 db (資料庫) 找文字
+        text = db.get(full_name, db.get(base_name, "(尚無此關係的詳細解讀資料)"))
+
+        result.append({
+            "relation_name": rel["name"],
+            "relation_type": rel["type"],
+            "content": text
+        })
+    return result
+
+
+def _layer(main_zhi, target_zhi, layer, locale=None):
+    """查表取得某一層的結果；layer 1 = 日支 vs 日支，layer 2 = 日支 vs 月支，layer 3 = 日柱 vs 日柱 (傳入兩字干支)"""
+    global _LAYER_TABLE, _LAYER_GENERATION
+    snap = interpretations.current()
+    if snap.generation != _LAYER_GENERATION:
+        # 換新的 dict 而不是 clear()：其他執行緒手上的舊表不受影響
+        _LAYER_TABLE, _LAYER_GENERATION = {}, snap.generation
+    table = _LAYER_TABLE
+    # 不認得的語系一律當預設語系：快取鍵只會有文案檔裡的語系，外部輸入撐不大這張表
+    if locale not in snap.locales:
+        locale = snap.default_locale
+    key = (main_zhi, target_zhi, layer, locale)
+    rows = table.get(key)
+    if rows is None:
+        # 第一層的刑要分細項 (自刑 / 無恩 / 恃勢 / 無禮)，第二層只看「刑」；第三層查 60×60 表
+        if layer == 3:
+            rels = pillar_pair_logic(main_zhi, target_zhi)
+        else:
+            rels = analyze_pair_logic(main_zhi, target_zhi, detailed_xing=(layer == 1))
+        rows = tuple(format_layer(rels, snap.layer(_LAYER_NAMES[layer], locale)))
+        table[key] = rows
+    # 回傳新的 dict，呼叫端就算改了內容也不會污染共用表
+    return [dict(r) for r in rows]
+
+
+def build_tables(locale=None):
+    """一次算完 12×12×2 的關係表與 60×60 旗標表，回傳表格筆數 (第三層文案用到才建)"""
+    for a in ZHI:
+        for b in ZHI:
+            _layer(a, b, 1, locale)
+            _layer(a, b, 2, locale)
+    pillar_table()
+    return len(_LAYER_TABLE)
+
+
+def cache_info():
+    return {"entries": len(_LAYER_TABLE), "pillar_cells": len(_PILLAR_TABLE) if _PILLAR_TABLE is not None else 0}
+
+
+memprof.register_cache("relation_tables", cache_info, lambda: (_LAYER_TABLE, _PILLAR_TABLE))
+
+# ==========================================
+# 時辰不詳：比較各候選時辰的地支關係
+# ==========================================
+VARIANT_RELATIONS = {
+    "layer1": "日支 × 今日日支",
+    "layer2": "日支 × 今日月支",
+    "hour_day": "時支 × 本命日支",
+    "hour_today": "時支 × 今日日支",
+}
+
+
+def compare_hour_variants(charts, today_day=None, today_month=None):
+    """
+    charts：[(日支, 時支), ...]，每個候選時辰一筆
+    回傳 (rows, stable)：rows[i] = {關係: [名稱, ...]}；stable[關係] = True 表示所有時辰結果相同
+    沒給今日地支時只比較命盤內的「時支 × 本命日支」
+    """
+    rows = []
+    for day_zhi, hour_zhi in charts:
+        row = {"hour_day": [r["name"] for r in analyze_pair_logic(hour_zhi, day_zhi)]}
+        if today_day:
+            row["layer1"] = [r["name"] for r in analyze_pair_logic(day_zhi, today_day, detailed_xing=True)]
+            row["hour_today"] = [r["name"] for r in analyze_pair_logic(hour_zhi, today_day)]
+        if today_month:
+            row["layer2"] = [r["name"] for r in analyze_pair_logic(day_zhi, today_month)]
+        rows.append(row)
+    stable = {k: all(r[k] == rows[0][k] for r in rows) for k in VARIANT_RELATIONS if rows and k in rows[0]}
+    return rows, stable
+
 # ==========================================
 # 2. Web 專用介面類別 (app.py 需要這個)
 # ==========================================
 
 class WebBaziAnalyzer:
     @staticmethod
-    def get_analysis_result(user_day, today_day, today_month):
+    def get_analysis_result(user_day, today_day, today_month, locale=None, user_pillar=None, today_pillar=None):
         """
         輸入三個地支，回傳完整的結構化資料供 Web 使用
+        locale 指定文案語系 (預設為文案檔的 default_locale)
+        另給日柱與今日日柱 (兩字干支) 時多一個第三層：天干 / 整柱關係
         """
-        # 1. 計算關係
-        layer1_rels = analyze_pair_logic(user_day, today_day, detailed_xing=True)
-        layer2_rels = analyze_pair_logic(user_day, today_month, detailed_xing=False)
-        
-        # 2. 定義格式化函數 (傳入 db 參數指定要查哪本字典)
-        def format_layer(rels, db):
-            result = []
-            for rel in rels:
-                # 優先找完整名稱 (例如 "刑 (自刑)")
-                full_name = rel["name"]
-                # 其次找基礎名稱 (例如 "刑")
-                base_name = full_name.split(" ")[0]
-                
-                # 從指定的 db (資料庫) 找文字
-                text = db.get(full_name, db.get(base_name, "(尚無此關係的詳細解讀資料)"))
-                
-                result.append({
-                    "relation_name": rel["name"],
-                    "relation_type": rel["type"],
-                    "content": text
-                })
-            return result
-
-        return {
+        result = {
             "branches": {
                 "user_day": user_day,
                 "today_day": today_day,
                 "today_month": today_month
             },
-            # 第一層：查 INTERPRETATIONS_DAY
-            "layer1": format_layer(layer1_rels, INTERPRETATIONS_DAY),
-            
-            # 第二層：查 INTERPRETATIONS_MONTH
-            "layer2": format_layer(layer2_rels, INTERPRETATIONS_MONTH)
+            # 第一層：查 day 文案 (原 INTERPRETATIONS_DAY)
+            "layer1": _layer(user_day, today_day, 1, locale),
+
+            # 第二層：查 month 文案 (原 INTERPRETATIONS_MONTH)
+            "layer2": _layer(user_day, today_month, 2, locale)
         }
+        if user_pillar and today_pillar:
+            # 第三層：查 pillar 文案
+            result["pillars"] = {"user_day": user_pillar, "today_day": today_pillar}
+            result["layer3"] = _layer(user_pillar, today_pillar, 3, locale)
+        return result
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+效能基準測試 (benchmark)
+
+用法：
+  python bench.py                              # 全部跑一次，印表格
+  python bench.py --only calc --json out.json  # 只跑名稱含 calc 的項目，並存 JSON
+  python bench.py --save-baseline bench_baseline.json
+  python bench.py --compare bench_baseline.json --threshold 0.10
+      -> 任一項 p50 比 baseline 慢超過 10% 就以 exit code 1 結束
+
+每一項會先暖身，再量測多個樣本；很快的函數會自動把多次呼叫合成一個樣本，
+回報 ops/s 與 p50/p95/p99 (每次呼叫的微秒數)。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+if HERE not in sys.path:
+    sys.path.insert(0, HERE)
+
+# 每個樣本至少要這麼久，計時誤差才可忽略
+MIN_SAMPLE_SECONDS = 0.0002
+
+SAMPLE_FORM = {"name": "測試", "sex": "1", "year": "76", "month": "5", "day": "3",
+               "hour": "10", "minute": "30"}
+
+
+def _percentile(sorted_vals, q):
+    if not sorted_vals:
+        return 0.0
+    k = (len(sorted_vals) - 1) * q
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+def measure(fn, samples=200, warmup=20):
+    """回傳每次呼叫耗時 (秒) 的統計"""
+    for _ in range(warmup):
+        fn()
+    # 校準：一個樣本要包幾次呼叫
+    batch = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(batch):
+            fn()
+        if time.perf_counter() - t0 >= MIN_SAMPLE_SECONDS or batch >= 1 << 16:
+            break
+        batch *= 2
+    per_call = []
+    perf = time.perf_counter
+    for _ in range(samples):
+        t0 = perf()
+        for _ in range(batch):
+            fn()
+        per_call.append((perf() - t0) / batch)
+    return _summarize(per_call, batch)
+
+
+def _summarize(per_call, batch=1):
+    per_call.sort()
+    mean = statistics.fmean(per_call)
+    return {
+        "samples": len(per_call),
+        "batch": batch,
+        "ops_per_sec": (1.0 / mean) if mean > 0 else 0.0,
+        "mean_us": mean * 1e6,
+        "p50_us": _percentile(per_call, 0.50) * 1e6,
+        "p95_us": _percentile(per_call, 0.95) * 1e6,
+        "p99_us": _percentile(per_call, 0.99) * 1e6,
+    }
+
+
+# ==========================================
+# 測項
+# ==========================================
+def _cold_calc_once():
+    """在新行程裡量第一次 calc_bazi_8char (含 lunar_python 載入後的首次初始化)"""
+    code = (
+        "import time, app\n"
+        "t0 = time.perf_counter()\n"
+        "app.calc_bazi_8char(1987, 5, 3, 10, 30)\n"
+        "print(time.perf_counter() - t0)\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=HERE, check=True,
+                         capture_output=True, text=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def bench_cold_calc(runs):
+    return _summarize([_cold_calc_once() for _ in range(runs)])
+
+
+def build_cases():
+    import app as web
+    from bazi_calc_v2 import WebBaziAnalyzer, analyze_pair_logic, pillar_pair_logic
+
+    bazi_py = web.bazi_py
+    client = web.app.test_client()
+    result = WebBaziAnalyzer.get_analysis_result("酉", "子", "午", user_pillar="辛酉", today_pillar="丙子")
+
+    def render_result():
+        with web.app.app_context():
+            web.render_template("result.html", result=result)
+
+    # http_post_analyze 每次送同一份表單：關掉結果頁快取才是完整的排盤 + 渲染 (與加快取前的 baseline 可比)；
+    # 快取命中另外量 http_post_analyze_page_hit
+    page_ttl = web.PAGE_TTL or 600.0
+
+    def post(ttl):
+        web.PAGE_TTL = ttl
+        r = client.post("/analyze", data=SAMPLE_FORM)
+        if r.status_code != 200:
+            raise RuntimeError("/analyze -> %d" % r.status_code)
+
+    def get_index():
+        client.get("/")
+
+    return [
+        ("parse_datetime", lambda: bazi_py.parse_datetime("1987-05-03 10:30")),
+        ("calc_bazi_8char_warm", lambda: bazi_py.calc_bazi_8char(1987, 5, 3, 10, 30)),
+        ("analyze_pair_logic", lambda: analyze_pair_logic("酉", "子", detailed_xing=True)),
+        ("pillar_pair_logic", lambda: pillar_pair_logic("辛酉", "丙子")),
+        ("get_analysis_result", lambda: WebBaziAnalyzer.get_analysis_result("酉", "子", "午")),
+        ("get_analysis_result_layer3", lambda: WebBaziAnalyzer.get_analysis_result(
+            "酉", "子", "午", user_pillar="辛酉", today_pillar="丙子")),
+        ("render_result_html", render_result),
+        ("http_get_index", get_index),
+        ("http_post_analyze", lambda: post(0)),
+        ("http_post_analyze_page_hit", lambda: post(page_ttl)),
+    ]
+
+
+def run(only=None, samples=200, cold_runs=5):
+    results = {}
+    if cold_runs and (not only or only in "calc_bazi_8char_cold"):
+        results["calc_bazi_8char_cold"] = bench_cold_calc(cold_runs)
+    for name, fn in build_cases():
+        if only and only not in name:
+            continue
+        results[name] = measure(fn, samples=samples)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """回傳退步項目 [(name, base_p50, new_p50, ratio)]"""
+    regressions = []
+    for name, cur in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base or base["p50_us"] <= 0:
+            continue
+        ratio = cur["p50_us"] / base["p50_us"]
+        if ratio > 1.0 + threshold:
+            regressions.append((name, base["p50_us"], cur["p50_us"], ratio))
+    return regressions
+
+
+def print_table(results, baseline=None):
+    head = "%-28s %12s %11s %11s %11s" % ("benchmark", "ops/s", "p50(us)", "p95(us)", "p99(us)")
+    if baseline:
+        head += " %9s" % "vs base"
+    print(head)
+    print("-" * len(head))
+    for name, r in results.items():
+        line = "%-28s %12.1f %11.1f %11.1f %11.1f" % (
+            name, r["ops_per_sec"], r["p50_us"], r["p95_us"], r["p99_us"])
+        if baseline:
+            base = baseline.get("results", {}).get(name)
+            line += " %8.2fx" % (r["p50_us"] / base["p50_us"]) if base and base["p50_us"] else " %9s" % "-"
+        print(line)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="八字服務效能基準測試")
+    ap.add_argument("--only", help="只跑名稱包含此字串的項目")
+    ap.add_argument("--samples", type=int, default=200)
+    ap.add_argument("--cold-runs", type=int, default=5, help="冷啟動量測的子行程數 (0 = 跳過)")
+    ap.add_argument("--json", help="把結果寫到這個 JSON 檔")
+    ap.add_argument("--save-baseline", help="把結果存成 baseline")
+    ap.add_argument("--compare", help="與此 baseline JSON 比較")
+    ap.add_argument("--threshold", type=float, default=0.10, help="p50 允許退步比例 (預設 0.10)")
+    args = ap.parse_args(argv)
+
+    results = run(only=args.only, samples=args.samples, cold_runs=args.cold_runs)
+    doc = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(doc, f, ensure_ascii=False, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("\n退步超過 %.0f%%：" % (args.threshold * 100))
+            for name, old, new, ratio in regressions:
+                print("  %-24s p50 %.1fus -> %.1fus (%.2fx)" % (name, old, new, ratio))
+            return 1
+        print("\n無退步 (門檻 %.0f%%)" % (args.threshold * 100))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+本機假的 Redis (只實作 shared_cache 用得到的指令)，給共用快取測試 / 壓測用，不必架真的 Redis
+
+  python cache_standin.py --port 6390 --delay 0.001
+  BAZI_CACHE_URL=redis://127.0.0.1:6390/0 gunicorn -c gunicorn.conf.py app:app
+
+支援：PING / ECHO / AUTH / SELECT / GET / SET (EX, PX, NX, XX) / DEL / EXISTS / DBSIZE / FLUSHDB / FLUSHALL / QUIT
+資料存在 shared_cache.MemoryBackend (所有 db 共用)；stats() 回傳各指令次數與連線數。
+"""
+import argparse
+import threading
+import time
+from collections import Counter
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+
+import shared_cache
+
+_STATS = Counter()
+_STATS_LOCK = threading.Lock()
+
+
+def _simple(s):
+    return b"+%s\r\n" % s.encode("utf-8")
+
+
+def _error(s):
+    return b"-ERR %s\r\n" % s.encode("utf-8")
+
+
+def _int(n):
+    return b":%d\r\n" % n
+
+
+def _bulk(data):
+    return b"$-1\r\n" if data is None else b"$%d\r\n%s\r\n" % (len(data), data)
+
+
+class RespHandler(StreamRequestHandler):
+    store = None
+    password = None
+    delay = 0.0
+
+    def handle(self):
+        with _STATS_LOCK:
+            _STATS["connections"] += 1
+        authed = not self.password
+        while True:
+            try:
+                cmd = shared_cache.read_reply(self.rfile)
+            except (ConnectionError, OSError):
+                return
+            except (shared_cache.CacheError, ValueError) as e:
+                self.wfile.write(_error("protocol error: %s" % e))
+                return
+            if not isinstance(cmd, list) or not cmd:
+                self.wfile.write(_error("expected a command array"))
+                continue
+            name = cmd[0].decode("utf-8", "replace").upper()
+            args = cmd[1:]
+            with _STATS_LOCK:
+                _STATS[name] += 1
+            if self.delay:
+                time.sleep(self.delay)
+            if name == "QUIT":
+                self.wfile.write(_simple("OK"))
+                return
+            if name == "AUTH":
+                if not self.password:
+                    self.wfile.write(_error("Client sent AUTH, but no password is set"))
+                    continue
+                authed = bool(args) and args[-1].decode("utf-8", "replace") == self.password
+                self.wfile.write(_simple("OK") if authed else _error("invalid password"))
+                continue
+            if not authed:
+                self.wfile.write(b"-NOAUTH Authentication required.\r\n")
+                continue
+            try:
+                self.wfile.write(self.dispatch(name, args))
+            except (IndexError, ValueError):
+                self.wfile.write(_error("wrong arguments for '%s'" % name.lower()))
+
+    def dispatch(self, name, args):
+        store = self.store
+        if name == "PING":
+            return _simple("PONG") if not args else _bulk(args[0])
+        if name == "ECHO":
+            return _bulk(args[0])
+        if name == "SELECT":
+            int(args[0])
+            return _simple("OK")
+        if name == "GET":
+            return _bulk(store.get(args[0].decode("utf-8")))
+        if name == "SET":
+            key, value = args[0].decode("utf-8"), args[1]
+            ttl_ms, nx, xx = 10 * 365 * 86400 * 1000.0, False, False
+            opts = [a.decode("utf-8").upper() for a in args[2:]]
+            i = 0
+            while i < len(opts):
+                if opts[i] in ("EX", "PX"):
+                    ttl_ms = float(opts[i + 1]) * (1000.0 if opts[i] == "EX" else 1.0)
+                    i += 2
+                    continue
+                if opts[i] == "NX":
+                    nx = True
+                elif opts[i] == "XX":
+                    xx = True
+                else:
+                    raise ValueError(opts[i])
+                i += 1
+            if xx and store.get(key) is None:
+                return _bulk(None)
+            return _simple("OK") if store.set(key, value, ttl_ms, nx=nx) else _bulk(None)
+        if name == "DEL":
+            return _int(sum(store.delete(k.decode("utf-8")) for k in args))
+        if name == "EXISTS":
+            return _int(sum(1 for k in args if store.get(k.decode("utf-8")) is not None))
+        if name == "DBSIZE":
+            return _int(store.size())
+        if name in ("FLUSHDB", "FLUSHALL"):
+            store.clear()
+            return _simple("OK")
+        return _error("unknown command '%s'" % name.lower())
+
+
+class _Server(ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def stats():
+    """各指令次數 + 連線數 (所有 stand-in 共用)"""
+    with _STATS_LOCK:
+        return dict(_STATS)
+
+
+def serve(host="127.0.0.1", port=6390, delay=0.0, password=None, store=None):
+    """啟動 stand-in；回傳 (server, thread)，呼叫 server.shutdown() 結束"""
+    handler = type("Handler", (RespHandler,), {
+        "store": store or shared_cache.MemoryBackend(), "delay": delay, "password": password})
+    server = _Server((host, port), handler)
+    t = threading.Thread(target=server.serve_forever, name="cache-standin", daemon=True)
+    t.start()
+    return server, t
+
+
+def main():
+    ap = argparse.ArgumentParser(description="本機假的 Redis (共用快取測試用)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=6390)
+    ap.add_argument("--delay", type=float, default=0.0, help="每個指令的人工延遲 (秒)")
+    ap.add_argument("--password", help="要求 AUTH")
+    args = ap.parse_args()
+    server, t = serve(args.host, args.port, args.delay, args.password)
+    print("cache stand-in: redis://%s:%d/0" % (args.host, server.server_address[1]))
+    try:
+        t.join()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,157 @@
 # -*- coding: utf-8 -*-
+"""
+舊的爬蟲路徑 (headless Chrome 打 NCC 排盤頁)
+
+每次排盤只有三個 WebDriver 來回：
+  driver.get(URL)                     載入表單 (page_load_strategy = eager，DOMContentLoaded 就返回)
+  execute_async_script(FILL_SUBMIT)   等表單出現 (MutationObserver) -> 一次填完所有欄位 -> 送出
+  execute_async_script(EXTRACT)       等結果出現 (MutationObserver) -> 一次讀出四柱
+不再有固定 sleep、逐欄位 execute_script、_Hour/_Min 探測或逐個元素 .text。
+圖片 / 樣式 / 字型 / 追蹤碼在網路層 (CDP Network.setBlockedURLs) 直接擋掉，連請求都不發。
+
+每個階段記進 bazi_crawler_phase_seconds (並出現在 Server-Timing)，WebDriver 指令數記進
+bazi_crawler_webdriver_commands_total；回傳結果的 phases 也附上各階段毫秒數與指令數。
+
+本機量測 (打 ncc_standin.py，不碰真站)：
+  python crawler_service.py --bench --runs 5 --delay 0.05 --render-delay 0.2
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
 import time
-from datetime import datetime
-from typing import List, Dict
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait, Select
-from selenium.webdriver.support import expected_conditions as EC
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict
+
+import jsonlog
+import memprof
+import shared_cache
+from metrics import REGISTRY, stage
+
+# 日誌丟進佇列由背景執行緒輸出；逐步驟的細節用 debug (可用 BAZI_LOG_DEBUG_SAMPLE 取樣)
+log = jsonlog.get_logger("crawler")
 
-URL_NCC = "https://pay.ncc.com.tw/s.php?bg=nccsoft&ID=ncc&fw=www"
+# selenium 很重 (且只有爬蟲路徑用得到)：各函數內才 import，`import crawler_service` 不會載入它
+
+# BAZI_NCC_URL 可指向本機 stand-in (ncc_standin.py)，壓測時不打真站
+URL_NCC = os.environ.get("BAZI_NCC_URL") or "https://pay.ncc.com.tw/s.php?bg=nccsoft&ID=ncc&fw=www"
+
+# 等表單 / 結果出現的上限 (秒)
+TIMEOUT = float(os.environ.get("BAZI_CRAWLER_TIMEOUT") or 40)
+
+# 網路層封鎖的網址樣式 (CDP Network.setBlockedURLs，* 為萬用字元)；BAZI_CRAWLER_BLOCK 以逗號分隔覆寫
+BLOCKED_URLS = [p.strip() for p in (os.environ.get("BAZI_CRAWLER_BLOCK") or ",".join([
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.css", "*.woff", "*.woff2", "*.ttf", "*.otf", "*.mp4",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*facebook.net*",
+])).split(",") if p.strip()]
 
 # ==========================================
 # 🧠 全域快取 (Global Cache)
 # 用來暫存「今天的四柱」，避免每次都要重新爬
+# 本行程沒有時再查跨實例共用快取 (shared_cache 的 scrape 命名空間)：
+#   ("today", 日期) 到當天午夜為止；("user", 年, 月, 日, 時, 分) 命主四柱不會變，留 USER_TTL 秒
+# 兩者都命中時連 Chrome 都不用開
 # ==========================================
+USER_TTL = 30 * 86400
 _TODAY_CACHE = {
     "date": None,  # 格式: "2025-12-18"
     "data": None   # 格式: ['乙巳', '戊子', '辛酉', '癸巳']
 }
 
+memprof.register_cache("crawler_today", lambda: {"entries": int(_TODAY_CACHE["data"] is not None)},
+                       lambda: _TODAY_CACHE)
+
+# ==========================================
+# 頁面內腳本 (execute_async_script：最後一個參數是回呼)
+# ==========================================
+# 等表單出現 -> 一次填完 -> 先回報再送出 (送出會換頁，回呼要在換頁前呼叫)
+FILL_SUBMIT_JS = r"""
+var done = arguments[arguments.length - 1], v = arguments[0], t0 = performance.now();
+function whenReady(test, fn) {
+  if (test()) return fn();
+  var ob = new MutationObserver(function () { if (test()) { ob.disconnect(); fn(); } });
+  ob.observe(document.documentElement, {childList: true, subtree: true});
+}
+whenReady(function () { return document.getElementById('_Name'); }, function () {
+  var t1 = performance.now(), missing = [];
+  function set(id, value) {
+    var el = document.getElementById(id);
+    if (!el) { missing.push(id); return; }
+    el.value = value;
+    el.dispatchEvent(new Event('input', {bubbles: true}));
+    el.dispatchEvent(new Event('change', {bubbles: true}));
+  }
+  function pick(name, value) {
+    var el = document.querySelector("input[name='" + name + "'][value='" + value + "']");
+    if (el) el.click(); else missing.push(name);
+  }
+  set('_Name', v.name);
+  pick('_Sex', v.sex);
+  pick('_YearMode', '1');
+  set('_Year', v.year);
+  set('_Month', v.month);
+  set('_Day', v.day);
+  set('_Hour', v.hour);
+  set('_Min', v.minute);
+  var btn = null, cands = document.querySelectorAll("input[type=submit], input[type=button], button, a");
+  for (var i = 0; i < cands.length && !btn; i++) {
+    if ((cands[i].value || cands[i].textContent || '').indexOf('確定送出') >= 0) btn = cands[i];
+  }
+  var form = document.getElementById('_Name').form;
+  if (!btn && !form) return done({error: 'submit button not found', missing: missing});
+  done({wait_ms: t1 - t0, fill_ms: performance.now() - t1, missing: missing});
+  setTimeout(function () { if (btn) btn.click(); else form.submit(); }, 0);
+});
+"""
+
+# 等結果出現 -> 一次讀出四柱 (優先取含「四柱」字樣的 div.w10 裡的 span.w-blue)
+# 若腳本開始時還停在表單頁，換頁會中斷腳本，由 _run_async 在結果頁重跑
+EXTRACT_JS = r"""
+var done = arguments[arguments.length - 1], t0 = performance.now();
+function text(el) { return (el.innerText || el.textContent || '').trim(); }
+function collect(list) {
+  var out = [];
+  for (var j = 0; j < list.length; j++) { var s = text(list[j]); if (s) out.push(s); }
+  return out;
+}
+function read() {
+  var boxes = document.querySelectorAll('div.w10'), out = [];
+  for (var i = 0; i < boxes.length; i++) {
+    var t = text(boxes[i]);
+    if (t.indexOf('四') >= 0 && t.indexOf('柱') >= 0) { out = collect(boxes[i].querySelectorAll('span.w-blue')); break; }
+  }
+  return out.length >= 4 ? out : collect(document.querySelectorAll('span.w-blue'));
+}
+function ready() { return document.querySelector('span.w-blue') && read().length >= 4; }
+function finish() { done({pillars: read(), wait_ms: performance.now() - t0}); }
+if (ready()) return finish();
+var ob = new MutationObserver(function () { if (ready()) { ob.disconnect(); finish(); } });
+ob.observe(document.documentElement, {childList: true, subtree: true, characterData: true});
+"""
+
+REQUIRED_FIELDS = ("_Name", "_Sex", "_YearMode", "_Year", "_Month", "_Day")
+
+
 def _init_driver():
     """初始化 Chrome Driver (穩定極速版)"""
+    from selenium import webdriver
     options = webdriver.ChromeOptions()
     options.add_argument("--headless=new")
     options.add_argument("--disable-gpu")
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
     options.add_argument("--window-size=1920,1080")
-    
-    # 禁止載入圖片與資源 (加速)
+    # DOMContentLoaded 就返回，不等圖片等子資源；之後由頁面內腳本等需要的元素
+    options.page_load_strategy = "eager"
+
+    # 禁止載入圖片與資源 (加速)；網路層封鎖見下方 Network.setBlockedURLs
     prefs = {
-        "profile.managed_default_content_settings.images": 2, 
-        "profile.managed_default_content_settings.stylesheets": 2, 
-        "profile.managed_default_content_settings.fonts": 2, 
+        "profile.managed_default_content_settings.images": 2,
+        "profile.managed_default_content_settings.stylesheets": 2,
+        "profile.managed_default_content_settings.fonts": 2,
         "profile.default_content_setting_values.notifications": 2,
         "profile.managed_default_content_settings.popups": 2,
     }
@@ -40,65 +160,104 @@ def _init_driver():
     options.add_argument("user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36")
     options.add_argument("--disable-blink-features=AutomationControlled")
     options.add_argument("--lang=zh-TW")
-    
+
     driver = webdriver.Chrome(options=options)
+    _count_commands(driver)
     driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
         "source": "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
     })
+    if BLOCKED_URLS:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URLS})
+    driver.set_script_timeout(TIMEOUT)
     return driver
 
+
+def _count_commands(driver):
+    """每個 WebDriver 指令 (= 一次來回) 都計數；driver.bazi_commands 為累計值"""
+    inner = driver.execute
+    driver.bazi_commands = 0
+
+    def execute(command, params=None):
+        driver.bazi_commands += 1
+        REGISTRY.inc("bazi_crawler_webdriver_commands_total", command=command)
+        return inner(command, params)
+
+    driver.execute = execute
+
+
 def _roc_to_ad_year(roc_year: str) -> int:
     try:
         y = int(str(roc_year).strip())
         return y + 1911
     except:
-        return 1911 + 76 
+        return 1911 + 76
 
-def safe_click_submit(driver, wait):
-    """安全點擊送出"""
-    submit_xpath = "//*[contains(normalize-space(.),'確定送出')] | //input[@value='確定送出']"
-    try:
-        btn = wait.until(EC.element_to_be_clickable((By.XPATH, submit_xpath)))
-        driver.execute_script("arguments[0].scrollIntoView({block:'center'});", btn)
-        time.sleep(0.2) # 縮短等待
-        btn.click()
-    except Exception:
+
+class _Phases:
+    """逐階段計時 (stage 直方圖 + Server-Timing)，並記下各階段的毫秒數與 WebDriver 指令數"""
+
+    def __init__(self):
+        self.driver = None
+        self.out = {}
+
+    @contextmanager
+    def __call__(self, name):
+        t0 = time.perf_counter()
+        c0 = getattr(self.driver, "bazi_commands", 0)
         try:
-            btn = driver.find_element(By.XPATH, submit_xpath)
-            driver.execute_script("arguments[0].click();", btn)
-        except Exception as e:
-            print(f"點擊失敗: {e}")
-            raise e
-    print("已點擊送出")
-
-def extract_four_pillars(driver, wait):
-    """擷取四柱"""
-    print("等待結果頁面...")
-    try:
-        wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "span.w-blue")))
-    except Exception as e:
-        print("等待逾時，找不到 span.w-blue")
-        raise e
-    
-    candidates = driver.find_elements(By.CSS_SELECTOR, "div.w10")
-    found_spans = []
-    
-    for c in candidates:
-        if "四" in c.text and "柱" in c.text:
-            spans = c.find_elements(By.CSS_SELECTOR, "span.w-blue")
-            found_spans = [s.text.strip() for s in spans if s.text.strip()]
-            break
-            
-    if len(found_spans) < 4:
-         all_spans = driver.find_elements(By.CSS_SELECTOR, "span.w-blue")
-         found_spans = [s.text.strip() for s in all_spans if s.text.strip()]
-
-    print(f"擷取到: {found_spans}")
-    
-    if len(found_spans) >= 4:
-        return found_spans[:4]
-    else:
-        raise ValueError(f"取得四柱資料不足: {found_spans}")
+            with stage(name, metric="bazi_crawler_phase_seconds"):
+                yield
+        finally:
+            self.out[name] = {
+                "ms": round((time.perf_counter() - t0) * 1000.0, 3),
+                "commands": getattr(self.driver, "bazi_commands", 0) - c0,
+            }
+
+
+def _run_async(driver, script, *args):
+    """execute_async_script；腳本若因換頁中斷 (document unloaded) 就在新頁面重跑"""
+    from selenium.common.exceptions import JavascriptException
+    for attempt in range(3):
+        try:
+            return driver.execute_async_script(script, *args)
+        except JavascriptException as e:
+            if attempt == 2 or "unload" not in str(e):
+                raise
+
+
+def fill_and_submit(driver, name, sex_value, year, month, day, hour, minute):
+    """一次來回：等表單 -> 填完所有欄位 -> 送出 (時 / 分欄位不存在時略過)"""
+    res = _run_async(driver, FILL_SUBMIT_JS, {
+        "name": name, "sex": str(sex_value), "year": str(int(year)), "month": str(int(month)),
+        "day": str(int(day)), "hour": str(int(hour)), "minute": str(int(minute)),
+    })
+    res = res or {"error": "no result"}
+    missing = [f for f in res.get("missing", ()) if f in REQUIRED_FIELDS]
+    if res.get("error") or missing:
+        raise ValueError("表單填寫失敗: %s" % (res.get("error") or "找不到欄位 %s" % ", ".join(missing)))
+    log.debug("form submitted", extra={"wait_ms": round(res["wait_ms"], 3), "fill_ms": round(res["fill_ms"], 3)})
+    return res
+
+
+def extract_four_pillars(driver):
+    """一次來回：等結果頁出現四柱 -> 讀出"""
+    res = _run_async(driver, EXTRACT_JS) or {}
+    found = res.get("pillars") or []
+    log.debug("pillars extracted", extra={"pillars": found, "wait_ms": round(res.get("wait_ms", 0.0), 3)})
+    if len(found) >= 4:
+        return found[:4]
+    raise ValueError(f"取得四柱資料不足: {found}")
+
+
+def _scrape_chart(driver, phases, prefix, name, sex_value, year, month, day, hour, minute):
+    with phases(prefix + "_navigate"):
+        driver.get(URL_NCC)
+    with phases(prefix + "_fill_submit"):
+        fill_and_submit(driver, name, sex_value, year, month, day, hour, minute)
+    with phases(prefix + "_extract"):
+        return extract_four_pillars(driver)
+
 
 # ==========================================
 # ★★★ 核心優化：智慧快取 (Smart Cache) ★★★
@@ -106,109 +265,136 @@ def extract_four_pillars(driver, wait):
 def scrape_all_data(
     name: str, sex_value: str, roc_year: str, month: int, day: int, hour: int, minute: int
 ) -> Dict:
-    
     # 1. 檢查快取
     now = datetime.now()
     today_str = now.strftime("%Y-%m-%d")
-    
+
     global _TODAY_CACHE
     cached_today_pillars = None
-    
+
     # 如果快取裡面有今天的資料，就直接拿來用
     if _TODAY_CACHE["date"] == today_str and _TODAY_CACHE["data"] is not None:
-        print(f"⚡ 命中快取！今日四柱已存在: {_TODAY_CACHE['data']}")
+        log.debug("today pillars cache hit", extra={"pillars": _TODAY_CACHE["data"]})
         cached_today_pillars = _TODAY_CACHE["data"]
-    
-    driver = _init_driver()
-    wait = WebDriverWait(driver, 40) 
+    else:
+        cached_today_pillars = shared_cache.CACHE.get("scrape", "today", today_str)
+        if cached_today_pillars:
+            log.debug("today pillars shared cache hit", extra={"pillars": cached_today_pillars})
+            _TODAY_CACHE["date"] = today_str
+            _TODAY_CACHE["data"] = cached_today_pillars
+    REGISTRY.inc("bazi_crawler_cache_total", result="hit" if cached_today_pillars else "miss")
+
+    year_ad = _roc_to_ad_year(roc_year)
+    user_key = ("user", year_ad, int(month), int(day), int(hour), int(minute))
+    cached_user_pillars = shared_cache.CACHE.get("scrape", *user_key)
+    if cached_user_pillars and cached_today_pillars:
+        return {"user_pillars": cached_user_pillars, "today_pillars": cached_today_pillars, "phases": {}}
+
+    phases = _Phases()
+    with phases("driver_init"):
+        driver = _init_driver()
+    phases.driver = driver
     result = {}
-    
-    # JS 填表腳本
-    script_set_val = """
-    var el = document.getElementById(arguments[0]);
-    if(el){ el.value = arguments[1]; el.dispatchEvent(new Event('change')); }
-    """
-    
+
     try:
         # --- 任務 1: 抓取命主 (每個人不同，一定要抓) ---
-        print(f"=== [1/2] 抓取命主 ===")
-        driver.get(URL_NCC)
-        # 用 eager 策略等待：只要 readyState complete 即可
-        wait.until(lambda d: d.execute_script("return document.readyState") == "complete")
-        
-        name_inp = wait.until(EC.presence_of_element_located((By.ID, "_Name")))
-        name_inp.clear()
-        name_inp.send_keys(name if name else "命主")
-
-        driver.execute_script(f"document.querySelector(\"input[name='_Sex'][value='{sex_value}']\").click();")
-        driver.execute_script("document.querySelector(\"input[name='_YearMode'][value='1']\").click();")
-        
-        # 填寫命主日期
-        year_ad = str(_roc_to_ad_year(roc_year))
-        driver.execute_script(script_set_val, "_Year", year_ad)
-        time.sleep(0.1)
-        driver.execute_script(script_set_val, "_Month", str(int(month)))
-        driver.execute_script(script_set_val, "_Day", str(int(day)))
-        
-        if driver.execute_script("return document.getElementById('_Hour') != null;"):
-            driver.execute_script(script_set_val, "_Hour", str(int(hour)))
-        if driver.execute_script("return document.getElementById('_Min') != null;"):
-            driver.execute_script(script_set_val, "_Min", str(int(minute)))
-
-        safe_click_submit(driver, wait)
-        result['user_pillars'] = extract_four_pillars(driver, wait)
-        
+        if cached_user_pillars:
+            result['user_pillars'] = cached_user_pillars
+        else:
+            log.debug("scraping user pillars")
+            result['user_pillars'] = _scrape_chart(
+                driver, phases, "user", name if name else "命主", sex_value,
+                year_ad, month, day, hour, minute)
+            shared_cache.CACHE.set("scrape", user_key, result['user_pillars'], USER_TTL)
+
         # --- 任務 2: 抓取今日 (如果有快取就跳過) ---
         if cached_today_pillars:
-            print("🚀 跳過第二次抓取，使用快取資料。")
+            log.debug("skipping today scrape, using cached pillars")
             result['today_pillars'] = cached_today_pillars
         else:
-            print("=== [2/2] 抓取今日 (無快取，需執行) ===")
-            
-            # 清除 Cookie 避免干擾，但動作要快
+            log.debug("scraping today pillars (cache miss)", extra={"now": now.isoformat(timespec="minutes")})
+            # 清除 Cookie 避免干擾
             driver.delete_all_cookies()
-            
-            driver.get(URL_NCC)
-            wait.until(lambda d: d.execute_script("return document.readyState") == "complete")
-            
-            name_inp = wait.until(EC.presence_of_element_located((By.ID, "_Name")))
-            name_inp.clear()
-            name_inp.send_keys("今日盤")
-            
-            driver.execute_script("document.querySelector(\"input[name='_Sex'][value='1']\").click();")
-            driver.execute_script("document.querySelector(\"input[name='_YearMode'][value='1']\").click();")
-            
-            print(f"系統時間: {now.year}/{now.month}/{now.day} {now.hour}:{now.minute}")
-
             # 強制寫入當下時間
-            driver.execute_script(script_set_val, "_Year", str(now.year))
-            time.sleep(0.1)
-            driver.execute_script(script_set_val, "_Month", str(now.month))
-            driver.execute_script(script_set_val, "_Day", str(now.day))
-            
-            if driver.execute_script("return document.getElementById('_Hour') != null;"):
-                driver.execute_script(script_set_val, "_Hour", str(now.hour))
-            if driver.execute_script("return document.getElementById('_Min') != null;"):
-                driver.execute_script(script_set_val, "_Min", str(now.minute))
-            
-            safe_click_submit(driver, wait)
-            today_data = extract_four_pillars(driver, wait)
-            
+            today_data = _scrape_chart(
+                driver, phases, "today", "今日盤", "1", now.year, now.month, now.day, now.hour, now.minute)
             result['today_pillars'] = today_data
-            
+
             # ★★★ 寫入快取 ★★★
             _TODAY_CACHE["date"] = today_str
             _TODAY_CACHE["data"] = today_data
-            print("✅ 已將今日四柱寫入快取")
+            midnight = datetime(now.year, now.month, now.day) + timedelta(days=1)
+            shared_cache.CACHE.set("scrape", ("today", today_str), today_data, (midnight - now).total_seconds())
+            log.debug("today pillars cached", extra={"date": today_str})
 
         return result
 
     except Exception as e:
-        print(f"[Error] Scrape Failed: {e}")
+        log.exception("scrape failed")
         raise e
     finally:
-        driver.quit()
+        with phases("driver_quit"):
+            driver.quit()
+        result["phases"] = phases.out
 
 # 兼容舊碼
-def get_user_pillars(*args, **kwargs): pass 
+def get_user_pillars(*args, **kwargs): pass
 def get_today_pillars(*args, **kwargs): pass
+
+
+# ==========================================
+# 本機量測：打 ncc_standin.py
+# ==========================================
+def bench(runs=5, url=None, delay=0.0, render_delay=0.0, today=False):
+    """跑 runs 次 scrape_all_data，回傳各階段的中位數 (ms) 與指令數；沒給 url 時自動啟動 stand-in"""
+    global URL_NCC
+    server = None
+    if url is None:
+        import ncc_standin
+        server, _ = ncc_standin.serve(port=0, delay=delay, render_delay=render_delay)
+        url = "http://127.0.0.1:%d/s.php" % server.server_address[1]
+    saved, URL_NCC = URL_NCC, url
+    # 量的是爬蟲本身：換上沒有 L1、沒有共用層的快取，每次都真的開 Chrome
+    saved_cache, shared_cache.CACHE = shared_cache.CACHE, shared_cache.SharedCache(l1_size=0)
+    samples = {}
+    try:
+        for i in range(runs):
+            if today:
+                _TODAY_CACHE.update(date=None, data=None)
+            t0 = time.perf_counter()
+            res = scrape_all_data("bench", "1", "76", 5, 3, 10, 30)
+            res["phases"]["total"] = {"ms": round((time.perf_counter() - t0) * 1000.0, 3), "commands": None}
+            for name, p in res["phases"].items():
+                samples.setdefault(name, []).append(p)
+    finally:
+        URL_NCC = saved
+        shared_cache.CACHE = saved_cache
+        if server is not None:
+            stats = ncc_standin.stats()
+            server.shutdown()
+    report = {name: {"median_ms": round(statistics.median(p["ms"] for p in ps), 3),
+                     "commands": ps[-1]["commands"]} for name, ps in samples.items()}
+    if server is not None:
+        report["standin"] = stats
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="爬蟲流程本機量測 (需要 selenium + Chrome)")
+    ap.add_argument("--bench", action="store_true", help="跑量測 (預設啟動本機 stand-in)")
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--url", help="改打這個網址 (不啟動 stand-in)")
+    ap.add_argument("--delay", type=float, default=0.0, help="stand-in 每個回應的人工延遲 (秒)")
+    ap.add_argument("--render-delay", type=float, default=0.0, help="stand-in 結果頁延後幾秒才用 JS 畫出四柱")
+    ap.add_argument("--today", action="store_true", help="每次都清掉今日快取 (量測含今日盤的完整流程)")
+    args = ap.parse_args(argv)
+    if not args.bench:
+        ap.print_help()
+        return 0
+    print(json.dumps(bench(args.runs, args.url, args.delay, args.render_delay, args.today),
+                     ensure_ascii=False, indent=1))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
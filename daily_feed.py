@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+每日運勢 NDJSON 匯出：每位使用者 × 每一天一行，邊算邊送，輸出再大記憶體用量也持平
+
+  python daily_feed.py users.csv --start 2026-01-01 --end 2026-03-31 > feed.ndjson
+  python daily_feed.py users.csv --start 2026-01-01 --end 2026-03-31 --out feed.ndjson   # 中斷後再跑一次會接著寫
+  curl -H "X-Admin-Token: $BAZI_ADMIN_TOKEN" \\
+       "http://127.0.0.1:8000/export/readings?start=2026-01-01&end=2026-01-31&cursor=12:2026-01-05"
+
+輸入：與 report_pipeline 相同 (CSV 欄位 id,name,birth 或 JSONL)，逐列讀取，不整批載入。
+HTTP 端點讀 BAZI_FEED_USERS 指定的檔案。每行一筆：
+  {"cursor": "12:2026-01-05", "id": "u12", "user_pillar": "甲子", "date": "2026-01-05",
+   "day_pillar": "庚午", "month_pillar": "戊寅",
+   "day": [{"type": "bad", "name": "沖"}], "month": [...], "pillar": [...]}
+  day / month / pillar = 日支 vs 當天日支、日支 vs 當天月支、日柱 vs 當天日柱；full=1 時每筆另附 "text" (文案全文)
+  出生資料有誤的使用者只輸出一行 {"cursor", "id", "error"}
+  最後一行是 {"end": true, "records": n, "errors": n, "cursor": ...} (筆數只算這一次串流送出的)
+沒收到 end 那一行就是串流中斷了：拿最後一行的 cursor 再請求一次，從下一筆接著送。
+cursor = 「使用者序號:日期」，序號是輸入檔的資料列序號 (從 1 起，表頭不算)，所以輸入檔只能在尾端追加。
+
+做法 (generator pipeline)：read_users -> readings -> chunks
+- 日曆 (每天中午的日柱 / 月柱) 每個日期區間只算一次 (最多 BAZI_FEED_MAX_DAYS 天)
+- 使用者日柱只跟出生日期有關，用 八字.day_pillar 直接算，不經過 lunar_python
+- 關係只取決於 (日支, 當天日支)、(日支, 當天月支)、(日柱, 當天日柱)：三層各自把序列化好的 JSON
+  片段存起來 (最多 144 + 144 + 3600 個)，之後每一行只是字串拼接
+- 背壓：chunks() 湊滿約 64KB 才交出一塊；WSGI 伺服器把上一塊寫進 socket 之後才會再要下一塊，
+  用戶端讀得慢，整條 pipeline 就停在 yield，不會在記憶體裡越堆越多 (ASGI 是 await send() 之後才取下一塊)
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from bisect import bisect_right
+from datetime import date, timedelta
+from functools import lru_cache
+
+import 八字 as bazi_py
+from bazi_calc_v2 import WebBaziAnalyzer
+from metrics import REGISTRY
+
+USERS_PATH = os.environ.get("BAZI_FEED_USERS")
+MAX_DAYS = int(os.environ.get("BAZI_FEED_MAX_DAYS") or 400)
+CHUNK_CHARS = 64 * 1024
+CONTENT_TYPE = "application/x-ndjson; charset=utf-8"
+
+_CURSOR_RE = re.compile(r"(\d+):(\d{4}-\d{2}-\d{2})")
+
+REGISTRY.describe("bazi_feed_records_total", "NDJSON export records by kind", "counter")
+
+
+# ==========================================
+# 輸入
+# ==========================================
+def read_users(path, skip=0):
+    """逐列產生 (序號, 使用者)；前 skip 筆只數不解析"""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        jsonl = path.endswith((".jsonl", ".ndjson"))
+        rows = (line for line in f if line.strip()) if jsonl else csv.DictReader(f)
+        for i, row in enumerate(rows, 1):
+            if i <= skip:
+                continue
+            if jsonl:
+                row = json.loads(row)
+            yield i, {"id": str(row.get("id") or i), "birth": row.get("birth") or ""}
+
+
+def parse_cursor(cursor):
+    """'序號:日期' -> (序號, ISO 日期)；沒給 cursor 時 (0, '')"""
+    if not cursor:
+        return 0, ""
+    m = _CURSOR_RE.fullmatch(cursor)
+    if not m:
+        raise ValueError("cursor 格式需為「序號:YYYY-MM-DD」：%s" % cursor)
+    return int(m.group(1)), m.group(2)
+
+
+@lru_cache(maxsize=4)
+def day_calendar(start, end):
+    """[(ISO 日期, 日柱, 月柱)]，含頭尾；續傳時同一個區間不必重算"""
+    n = (end - start).days + 1
+    if n < 1:
+        raise ValueError("end 不可早於 start")
+    if n > MAX_DAYS:
+        raise ValueError("一次最多匯出 %d 天" % MAX_DAYS)
+    days = []
+    for i in range(n):
+        d = start + timedelta(days=i)
+        bz = bazi_py.calc_bazi_8char(d.year, d.month, d.day, 12, 0)
+        days.append((d.isoformat(), bz.day, bz.month))
+    return tuple(days)
+
+
+def user_pillar(birth):
+    """使用者日柱 (時辰不詳也一樣：日柱不看時辰)"""
+    y, mo, d, _, _ = bazi_py.parse_birth(birth)
+    return bazi_py.day_pillar(y, mo, d)
+
+
+# ==========================================
+# 產生
+# ==========================================
+def _rows_json(rows, full):
+    out = []
+    for r in rows:
+        item = {"type": r["relation_type"], "name": r["relation_name"]}
+        if full:
+            item["text"] = r["content"].strip()
+        out.append(item)
+    return json.dumps(out, ensure_ascii=False, separators=(",", ":"))
+
+
+def readings(users, calendar, cursor="", locale=None, full=False, stats=None):
+    """(序號, 使用者) -> NDJSON 行；cursor 那一筆 (含) 以前的略過。stats 會累計 records / errors / cursor"""
+    after_n, after_day = parse_cursor(cursor)
+    stats = {} if stats is None else stats
+    stats.setdefault("records", 0)
+    stats.setdefault("errors", 0)
+    stats.setdefault("cursor", cursor)
+    # 每天的固定部分先序列化好
+    days = [(iso, '"date":"%s","day_pillar":"%s","month_pillar":"%s"' % (iso, dp, mp), dp, mp[-1])
+            for iso, dp, mp in calendar]
+    isos = [d[0] for d in days]
+    last = isos[-1]
+    fragments = {}   # (層, 主, 對象) -> JSON 片段；只在這次匯出內有效 (文案換版時下一次匯出自然更新)
+
+    def fragment(layer, main, target):
+        key = (layer, main, target)
+        text = fragments.get(key)
+        if text is None:
+            if layer == 3:
+                rows = WebBaziAnalyzer.get_analysis_result(
+                    main[-1], target[-1], target[-1], locale, main, target)["layer3"]
+            else:
+                rows = WebBaziAnalyzer.get_analysis_result(main, target, target, locale)["layer%d" % layer]
+            text = fragments[key] = _rows_json(rows, full)
+        return text
+
+    for n, user in users:
+        if n < after_n:
+            continue
+        todo = days[bisect_right(isos, after_day):] if n == after_n else days
+        if not todo:
+            continue
+        uid = json.dumps(user["id"], ensure_ascii=False)
+        try:
+            up = user_pillar(user["birth"])
+        except Exception as e:
+            stats["errors"] += 1
+            stats["cursor"] = "%d:%s" % (n, last)
+            yield '{"cursor":"%s","id":%s,"error":%s}\n' % (
+                stats["cursor"], uid, json.dumps("%s: %s" % (type(e).__name__, e), ensure_ascii=False))
+            continue
+        uz = up[-1]
+        for iso, day_json, dp, mz in todo:
+            yield '{"cursor":"%d:%s","id":%s,"user_pillar":"%s",%s,"day":%s,"month":%s,"pillar":%s}\n' % (
+                n, iso, uid, up, day_json, fragment(1, uz, dp[-1]), fragment(2, uz, mz), fragment(3, up, dp))
+            stats["records"] += 1
+        stats["cursor"] = "%d:%s" % (n, last)
+
+
+def chunks(lines, size=CHUNK_CHARS):
+    """把行湊成約 size 個字元一塊 (UTF-8 bytes)；每塊交出去之後才繼續產生下一塊"""
+    buf, n = [], 0
+    for line in lines:
+        buf.append(line)
+        n += len(line)
+        if n >= size:
+            yield "".join(buf).encode("utf-8")
+            buf, n = [], 0
+    if buf:
+        yield "".join(buf).encode("utf-8")
+
+
+def export(path, start, end, cursor="", locale=None, full=False):
+    """檢查參數 (錯了直接丟 ValueError / OSError，還沒開始送)，回傳 bytes 區塊的 generator (最後一行是 end)"""
+    after_n, _ = parse_cursor(cursor)
+    calendar = day_calendar(start, end)
+    if not os.path.isfile(path):
+        raise OSError("找不到使用者清單：%s" % path)
+    return _export(read_users(path, skip=max(0, after_n - 1)), calendar, cursor, locale, full)
+
+
+def _export(users, calendar, cursor, locale, full):
+    stats = {}
+    try:
+        yield from chunks(readings(users, calendar, cursor, locale, full, stats))
+        yield ('{"end":true,"records":%d,"errors":%d,"cursor":"%s"}\n' % (
+            stats["records"], stats["errors"], stats["cursor"])).encode("utf-8")
+    finally:
+        # 中斷 (用戶端斷線) 時也記下已經產生的筆數
+        REGISTRY.inc("bazi_feed_records_total", stats.get("records", 0), kind="reading")
+        REGISTRY.inc("bazi_feed_records_total", stats.get("errors", 0), kind="error")
+
+
+# ==========================================
+# CLI
+# ==========================================
+def resume_point(path):
+    """已寫出的 NDJSON 檔：截掉最後不完整的半行，回傳 (最後一行的 cursor, 是否已寫完)"""
+    try:
+        f = open(path, "r+b")
+    except FileNotFoundError:
+        return "", False
+    with f:
+        pos = f.seek(0, os.SEEK_END)
+        tail = b""
+        # 往回讀到至少包含一整行 (前面還有一個換行，或已到檔頭)
+        while pos > 0 and tail.count(b"\n") < 2:
+            step = min(65536, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+        cut = tail.rfind(b"\n") + 1
+        if cut < len(tail):
+            f.truncate(pos + cut)
+        lines = tail[:cut].splitlines()
+        if not lines:
+            return "", False
+        rec = json.loads(lines[-1])
+        return rec.get("cursor", ""), bool(rec.get("end"))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="每日運勢 NDJSON 匯出 (每位使用者 × 每一天一行)")
+    ap.add_argument("input", help="CSV (id,name,birth) 或 JSONL")
+    ap.add_argument("--start", required=True, type=date.fromisoformat, help="YYYY-MM-DD")
+    ap.add_argument("--end", required=True, type=date.fromisoformat, help="YYYY-MM-DD (含)")
+    ap.add_argument("--cursor", help="從這個 cursor 之後接著產生 (預設：--out 檔最後一行)")
+    ap.add_argument("--out", help="輸出檔 (附加寫入，可續跑)；不給時寫到 stdout")
+    ap.add_argument("--locale", help="文案語系")
+    ap.add_argument("--full", action="store_true", help="附上文案全文")
+    args = ap.parse_args(argv)
+
+    cursor = args.cursor
+    if args.out and cursor is None:
+        cursor, done = resume_point(args.out)
+        if done:
+            print("[feed] %s 已完整匯出 (cursor %s)" % (args.out, cursor), file=sys.stderr)
+            return 0
+    t0 = time.perf_counter()
+    try:
+        blocks = export(args.input, args.start, args.end, cursor or "", args.locale, args.full)
+    except (ValueError, OSError) as e:
+        ap.error(str(e))
+    out = open(args.out, "ab") if args.out else sys.stdout.buffer
+    size = 0
+    try:
+        for block in blocks:
+            out.write(block)
+            size += len(block)
+        out.flush()
+    finally:
+        if args.out:
+            out.close()
+    dt = time.perf_counter() - t0
+    print("[feed] %.1f MB in %.1fs" % (size / 1048576.0, dt), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
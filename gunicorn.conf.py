@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+gunicorn 正式環境設定 (gunicorn -c gunicorn.conf.py app:app)
+
+- preload_app：master 先 import app 並預熱 (lunar_python、關係表、模板)，
+  fork 出來的 worker 直接共用這些記憶體頁，不必各自冷啟動
+- gc.freeze()：fork 前把 master 的物件移到永久代，worker 的 GC 不會去碰
+  (避免改寫 refcount/GC header 造成 copy-on-write 把共用頁複製一份)
+- worker/thread 數依 CPU 決定，可用 WEB_CONCURRENCY / GUNICORN_THREADS 覆寫
+"""
+import gc
+import os
+
+
+def _cpu_count():
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+_cpus = _cpu_count()
+
+bind = "0.0.0.0:%s" % os.environ.get("PORT", "8000")
+preload_app = True
+
+# 排盤是 CPU 工作 → 每顆 CPU 一個 worker (至少 2 個，單一 worker 重啟時仍有人接)；
+# gthread 讓等待 I/O (爬蟲、慢速用戶端) 時同一 worker 還能服務其他請求。
+# 執行緒數要大於 admission 的名額 + 排隊數 (預設 CPU 2+4、爬蟲 1+1)，
+# 多出來的請求才會進到 app 被快速回 503，而不是卡在 gunicorn 內部佇列
+workers = int(os.environ.get("WEB_CONCURRENCY") or max(2, _cpus))
+threads = int(os.environ.get("GUNICORN_THREADS") or 10)
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS") or "gthread"
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT") or 60)
+graceful_timeout = 30
+keepalive = 5
+
+# 定期換掉 worker，防止長時間累積的記憶體 (加上抖動避免同時重啟)
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS") or 2000)
+max_requests_jitter = max_requests // 10
+
+accesslog = None
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL") or "info"
+
+
+def on_starting(server):
+    # 清掉上一輪留下的 metrics 快照 (BAZI_METRICS_DIR)，避免已死 worker 的數字被重複加總
+    d = os.environ.get("BAZI_METRICS_DIR") or os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if d:
+        os.makedirs(d, exist_ok=True)
+        for fn in os.listdir(d):
+            if fn.startswith("metrics_"):
+                try:
+                    os.unlink(os.path.join(d, fn))
+                except OSError:
+                    pass
+
+
+def when_ready(server):
+    # preload_app=True 時 app 已在 master 載入；這裡預熱並回收暫時物件
+    import app
+    timings = app.warmup(int(os.environ.get("BAZI_WARMUP_ITERATIONS") or 3))
+    gc.collect()
+    server.log.info("warmup done: %s", ", ".join("%s=%.1fms" % (k, v * 1000) for k, v in timings.items()))
+
+
+def pre_fork(server, worker):
+    # fork 前凍結：master 現有物件不再被 worker 的 GC 掃描/改寫
+    gc.freeze()
+
+
+def worker_exit(server, worker):
+    # worker 結束前寫出最後一次快照 (max_requests 換 worker、關機)，節流中的計數不會漏掉
+    import metrics
+    metrics.REGISTRY.flush(force=True)
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+`import app` 冷啟動預算
+
+  python import_budget.py                 # 量測 + 各模組耗時明細
+  python import_budget.py --check         # 超過預算或載入了不該載入的模組 -> exit 1
+  python import_budget.py --budget-ms 250 --top 25
+
+每次都在全新的子行程裡量，取多次中的最小值 (排除機器抖動)。
+預算可用 BAZI_IMPORT_BUDGET_MS 設定；明細來自 python -X importtime。
+
+LAZY_MODULES 是刻意延後載入的重模組：`import app` 之後若出現在 sys.modules，
+代表有人又把它們改回頂層 import，--check 會直接失敗。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_BUDGET_MS = 300.0
+
+# 第一次用到才載入的模組
+LAZY_MODULES = ("lunar_python", "selenium", "cProfile", "pstats")
+
+_PROBE = (
+    "import sys, time, json\n"
+    "t0 = time.perf_counter()\n"
+    "import app\n"
+    "dt = time.perf_counter() - t0\n"
+    "print(json.dumps({'seconds': dt, 'loaded': [m for m in %r if m in sys.modules]}))\n"
+) % (LAZY_MODULES,)
+
+
+def measure_wall(runs):
+    """回傳 (最小秒數, 被載入的 lazy 模組)"""
+    best, loaded = None, set()
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", _PROBE], cwd=HERE, check=True,
+                             capture_output=True, text=True).stdout
+        doc = json.loads(out.strip().splitlines()[-1])
+        best = doc["seconds"] if best is None else min(best, doc["seconds"])
+        loaded.update(doc["loaded"])
+    return best, sorted(loaded)
+
+
+def importtime_breakdown():
+    """解析 -X importtime：回傳 [(module, self_us, cumulative_us, depth)]"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=HERE,
+                          check=True, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        # 名稱前面 1 個空白 + 每層 2 個空白
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cum_us), depth))
+    return rows
+
+
+def app_subtree(rows, root="app"):
+    """只取 root 底下的列 (importtime 先印子模組、最後才印父模組)"""
+    for i in range(len(rows) - 1, -1, -1):
+        if rows[i][0] == root and rows[i][3] == 0:
+            j = i
+            while j > 0 and rows[j - 1][3] > 0:
+                j -= 1
+            return rows[j:i + 1]
+    return rows
+
+
+def by_package(rows):
+    """依最上層套件加總 self time (us)"""
+    totals = {}
+    for name, self_us, _, _ in rows:
+        top = name.split(".")[0]
+        totals[top] = totals.get(top, 0) + self_us
+    return sorted(totals.items(), key=lambda kv: -kv[1])
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="import app 冷啟動預算")
+    ap.add_argument("--budget-ms", type=float,
+                    default=float(os.environ.get("BAZI_IMPORT_BUDGET_MS") or DEFAULT_BUDGET_MS))
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--top", type=int, default=15)
+    ap.add_argument("--check", action="store_true", help="超過預算就以 exit code 1 結束")
+    args = ap.parse_args(argv)
+
+    seconds, loaded = measure_wall(args.runs)
+    ms = seconds * 1000.0
+    rows = app_subtree(importtime_breakdown())
+
+    print("import app: %.1f ms (best of %d), budget %.0f ms" % (ms, args.runs, args.budget_ms))
+    print("\n依套件 (self time 加總)：")
+    for pkg, us in by_package(rows)[:args.top]:
+        print("  %-28s %8.1f ms" % (pkg, us / 1000.0))
+    print("\napp 直接載入的模組 (cumulative)：")
+    direct = [r for r in rows if r[3] == 1]
+    for name, _, cum, _ in sorted(direct, key=lambda r: -r[2])[:args.top]:
+        print("  %-28s %8.1f ms" % (name, cum / 1000.0))
+
+    failed = False
+    if loaded:
+        print("\n[FAIL] 應延後載入的模組在 import app 時就被載入：%s" % ", ".join(loaded))
+        failed = True
+    if ms > args.budget_ms:
+        print("\n[FAIL] import app %.1f ms 超過預算 %.0f ms" % (ms, args.budget_ms))
+        failed = True
+    if args.check:
+        if not failed:
+            print("\n[OK] 在預算內")
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
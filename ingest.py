@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+大量出生資料匯入：CSV (數百萬筆) -> 欄位式整數陣列 + 拒收清單
+
+  python ingest.py users.csv --out births/                 # 預設讀 birth 欄
+  python ingest.py users.csv --out births/ --column 生日 --chunk-mb 8
+
+輸出 (births/)：
+  year.bin (H)、month.bin (B)、day.bin (B)、hour.bin (B)、minute.bin (B)、row.bin (I)
+      array 原始位元組 (本機位元組序)；hour / minute = 255 表示時辰不詳
+      row = 資料列序號 (表頭不算，從 1 起)，用來對回原始檔；
+      格式混雜的區塊裡標準格式的列排在前面，需要原始順序時依 row 排序
+  meta.json     筆數、各欄 typecode、位元組序
+  rejects.csv   row,value,reason (格式錯誤、不存在的日期…)
+讀回：cols = ingest.load("births/")  -> {"year": array("H"), ...}
+
+做法：檔案以固定大小分塊 (在最後一個換行處切開) 串流讀取，每塊先試快速路徑：
+- 生日在最後一欄、沒有引號、且整塊都是「YYYY-MM-DD HH:MM」(或整塊都是「YYYY-MM-DD」) 時，
+  用 split(",") 的切片把每列的生日拼成定長紀錄，整塊一次驗證格式
+  (translate 成「形狀」後與 b"9999-99-99 99:99\\n" * n 比對)
+- 各欄位的數字從定長紀錄以跨步切片取出，把整欄當成一個大整數做十進位換算
+  (每格一或兩個 byte，運算不會進位)，月 / 日 / 時 / 分的範圍與大小月也都用 translate 整欄檢查
+- 只有少數不合法的列 (例如 2023-02-31) 逐筆交給 八字.parse_birth 取得拒收原因
+格式混雜的區塊先用預先編譯的 regex 挑出標準格式的列照樣走快速路徑，其餘 (農曆、斜線、
+時辰不詳字樣、引號…) 以及生日不在最後一欄的檔案走逐列路徑：csv 解析 + parse_birth
+(預先編譯的 regex，並檢查實際存在的日期)，結果與快速路徑相同。
+"""
+import argparse
+import calendar
+import csv
+import itertools
+import json
+import os
+import re
+import sys
+import time
+from array import array
+from operator import itemgetter
+
+import 八字 as bazi_py
+
+UNKNOWN = 255
+COLUMNS = (("year", "H"), ("month", "B"), ("day", "B"), ("hour", "B"), ("minute", "B"), ("row", "I"))
+DEFAULT_CHUNK_MB = 1
+
+# 快速路徑的兩種紀錄形狀 (數字都換成 9)
+_DIGITS = b"0123456789"
+_SHAPE = bytes.maketrans(_DIGITS, b"9" * 10)
+_VALUE = bytes.maketrans(_DIGITS, bytes(range(10)))
+_DATETIME = b"9999-99-99 99:99\n"
+_DATE = b"9999-99-99\n"
+
+
+def _range_table(lo, hi):
+    """translate 用：lo~hi 對應 0，其餘對應 1"""
+    return bytes(0 if lo <= v <= hi else 1 for v in range(256))
+
+
+_BAD_MONTH = _range_table(1, 12)
+_BAD_DAY = _range_table(1, 31)
+_BAD_HOUR = _range_table(0, 23)
+_BAD_MINUTE = _range_table(0, 59)
+# 每月最多幾天 (二月先算 29，平年的 2/29 另外挑出來)，加上 128 讓「當月天數 - 日」每格都不會借位
+_MAX_DAY = bytes(128 + (bazi_py.days_in_month(2000, v) if 1 <= v <= 12 else 0) for v in range(256))
+_BELOW_128 = bytes(1 if v < 128 else 0 for v in range(256))
+_FLIP = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+
+class Rejects:
+    """拒收清單：row,value,reason"""
+
+    def __init__(self, path=None):
+        self.count = 0
+        self._f = open(path, "w", encoding="utf-8", newline="") if path else None
+        self._w = csv.writer(self._f) if self._f else None
+        if self._w:
+            self._w.writerow(["row", "value", "reason"])
+
+    def add(self, row, value, reason):
+        self.count += 1
+        if self._w:
+            self._w.writerow([row, value, reason])
+
+    def close(self):
+        if self._f:
+            self._f.close()
+
+
+def _new_columns():
+    return {name: array(code) for name, code in COLUMNS}
+
+
+# ==========================================
+# 快速路徑：整塊都是標準格式
+# ==========================================
+def _records(chunk, n, ncols, width):
+    """生日在最後一欄：每列的生日 + 換行拼成定長紀錄；結構不符時回傳 None"""
+    if ncols == 1:
+        return chunk if len(chunk) == n * width else None
+    pieces = chunk.split(b",")
+    if len(pieces) != n * (ncols - 1) + 1:
+        return None
+    # 每列最後一欄會和下一列的第一欄黏在一起 ("生日\n下一列id")：取前 width 個 byte
+    return b"".join(map(itemgetter(slice(0, width)), pieces[ncols - 1::ncols - 1]))
+
+
+def _number(recs, width, offsets, lane):
+    """從定長紀錄取出某欄各位數字，換算成整數；每格 lane 個 byte (大端)，回傳位元組"""
+    n = len(recs) // width
+    total = 0
+    for off in offsets:
+        digits = recs[off::width].translate(_VALUE)
+        if lane > 1:
+            spread = bytearray(n * lane)
+            spread[lane - 1::lane] = digits
+            digits = spread
+        # 每格最大 9999 (年) 或 99：十進位換算不會跨格進位
+        total = total * 10 + int.from_bytes(digits, "big")
+    return total.to_bytes(n * lane, "big")
+
+
+_IOTA = array("I")
+
+
+def _row_numbers(first, n):
+    """first, first+1, …：0..n-1 的樣板 (快取) 加上 first (每格 4 byte，不會進位)"""
+    global _IOTA
+    if len(_IOTA) < n:
+        _IOTA = array("I", range(max(n, 2 * len(_IOTA))))
+    ones = (1).to_bytes(4, sys.byteorder) * n
+    total = int.from_bytes(_IOTA[:n].tobytes(), sys.byteorder) + first * int.from_bytes(ones, sys.byteorder)
+    rows = array("I")
+    rows.frombytes(total.to_bytes(4 * n, sys.byteorder))
+    return rows
+
+
+def _fast_chunk(chunk, n, ncols, rows, cols, rejects):
+    for width, shape in ((len(_DATETIME), _DATETIME), (len(_DATE), _DATE)):
+        recs = _records(chunk, n, ncols, width)
+        if recs is not None and recs.translate(_SHAPE) == shape * n:
+            break
+    else:
+        return False
+
+    years = array("H")
+    years.frombytes(_number(recs, width, (0, 1, 2, 3), 2))
+    if sys.byteorder == "little":
+        years.byteswap()
+    months = _number(recs, width, (5, 6), 1)
+    days = _number(recs, width, (8, 9), 1)
+    if width == len(_DATETIME):
+        hours = _number(recs, width, (11, 12), 1)
+        minutes = _number(recs, width, (14, 15), 1)
+        bad = (int.from_bytes(hours.translate(_BAD_HOUR), "big")
+               | int.from_bytes(minutes.translate(_BAD_MINUTE), "big"))
+    else:
+        hours = minutes = bytes([UNKNOWN]) * n
+        bad = 0
+
+    # 月份 / 日期範圍、大小月 (每格 128 + 當月天數 - 日 < 128 表示超過)
+    over = (int.from_bytes(months.translate(_MAX_DAY), "big") - int.from_bytes(days, "big")).to_bytes(n, "big")
+    bad |= (int.from_bytes(months.translate(_BAD_MONTH), "big")
+            | int.from_bytes(days.translate(_BAD_DAY), "big")
+            | int.from_bytes(over.translate(_BELOW_128), "big"))
+    mask = bytearray(bad.to_bytes(n, "big"))
+    # 年份 0000、平年的 2/29：很少見，只檢查出現的位置
+    if 0 in years:
+        for i in itertools.compress(range(n), map((0).__eq__, years)):
+            mask[i] = 1
+    pos = recs.find(b"-02-29")
+    while pos >= 0:
+        i, r = divmod(pos, width)
+        if r == 4 and not calendar.isleap(years[i]):
+            mask[i] = 1
+        pos = recs.find(b"-02-29", pos + 1)
+
+    if 1 in mask:
+        keep = bytes(mask).translate(_FLIP)
+        for i in itertools.compress(range(n), mask):
+            value = recs[i * width:(i + 1) * width - 1].decode("ascii")
+            rejects.add(rows[i], value, _reason(value))
+        years = array("H", itertools.compress(years, keep))
+        months, days, hours, minutes = (bytes(itertools.compress(c, keep)) for c in (months, days, hours, minutes))
+        rows = array("I", itertools.compress(rows, keep))
+
+    cols["year"].extend(years)
+    cols["month"].frombytes(months)
+    cols["day"].frombytes(days)
+    cols["hour"].frombytes(hours)
+    cols["minute"].frombytes(minutes)
+    cols["row"].extend(rows)
+    return True
+
+
+def _reason(value):
+    try:
+        bazi_py.parse_birth(value)
+    except ValueError as e:
+        return str(e)
+    return "無法解析"
+
+
+# ==========================================
+# 逐列路徑：csv + parse_birth
+# ==========================================
+def _line_pattern(ncols):
+    """整列都是標準格式 (沒有引號、生日在最後一欄) 的 regex"""
+    return re.compile(rb'[^,"]*' + rb'(?:,[^,"]*)' * (ncols - 2) + rb",\d{4}-\d\d-\d\d \d\d:\d\d") if ncols > 1 \
+        else re.compile(rb"\d{4}-\d\d-\d\d \d\d:\d\d")
+
+
+def _mixed_chunk(chunk, n, ncols, column, rows, cols, rejects, pattern):
+    """格式混雜的一塊：標準格式的列挑出來走快速路徑，其餘逐列；回傳走快速路徑的列數"""
+    lines = chunk.split(b"\n")
+    lines.pop()  # 每塊都以換行結尾
+    fast = 0
+    if pattern is not None:
+        ok = bytes(map(bool, map(pattern.fullmatch, lines)))
+        fast = ok.count(1)
+        if fast:
+            picked = list(itertools.compress(lines, ok))
+            picked.append(b"")
+            _fast_chunk(b"\n".join(picked), fast, ncols, array("I", itertools.compress(rows, ok)), cols, rejects)
+            rest = ok.translate(_FLIP)
+            lines, rows = list(itertools.compress(lines, rest)), list(itertools.compress(rows, rest))
+    for row_no, raw in zip(rows, lines):
+        line = raw.decode("utf-8", errors="replace")
+        if not line.strip():
+            continue  # 空白列：不收也不算拒收
+        fields = next(csv.reader((line,)))
+        value = fields[column] if column < len(fields) else ""
+        try:
+            y, mo, d, hh, mm = bazi_py.parse_birth(value)
+        except ValueError as e:
+            rejects.add(row_no, value, str(e))
+        else:
+            cols["year"].append(y)
+            cols["month"].append(mo)
+            cols["day"].append(d)
+            cols["hour"].append(UNKNOWN if hh is None else hh)
+            cols["minute"].append(UNKNOWN if mm is None else mm)
+            cols["row"].append(row_no)
+    return fast
+
+
+# ==========================================
+# 串流
+# ==========================================
+def _chunks(f, size):
+    """以 size 位元組為單位讀取，在最後一個換行處切開 (統一成 \\n 結尾)"""
+    rest = b""
+    while True:
+        block = f.read(size)
+        if not block:
+            break
+        data = rest + block
+        cut = data.rfind(b"\n") + 1
+        if cut == 0:
+            rest = data
+            continue
+        rest = data[cut:]
+        yield _lf(data[:cut])
+    if rest.strip():
+        yield _lf(rest + b"\n")
+
+
+def _lf(data):
+    return data.replace(b"\r\n", b"\n") if b"\r" in data else data
+
+
+def ingest(path, column="birth", chunk_bytes=DEFAULT_CHUNK_MB << 20, rejects_path=None, stats=None):
+    """CSV -> {"year": array, ...}；rejects_path 給定時寫出拒收清單。stats (dict) 會填入筆數與耗時"""
+    cols = _new_columns()
+    rejects = Rejects(rejects_path)
+    t0 = time.perf_counter()
+    fast_rows = slow_rows = 0
+    try:
+        with open(path, "rb") as f:
+            header = f.readline().decode("utf-8-sig").rstrip("\r\n")
+            names = next(csv.reader((header,)))
+            if column not in names:
+                raise ValueError("%s 缺少 %s 欄位 (表頭：%s)" % (path, column, ",".join(names)))
+            col, ncols = names.index(column), len(names)
+            # 快速路徑只處理「生日在最後一欄」的檔案
+            pattern = _line_pattern(ncols) if col == ncols - 1 else None
+            next_row = 1
+            for chunk in _chunks(f, chunk_bytes):
+                n = chunk.count(b"\n")
+                rows = _row_numbers(next_row, n)
+                if pattern is not None and b'"' not in chunk and _fast_chunk(chunk, n, ncols, rows, cols, rejects):
+                    fast = n
+                else:
+                    fast = _mixed_chunk(chunk, n, ncols, col, rows, cols, rejects, pattern)
+                fast_rows += fast
+                slow_rows += n - fast
+                next_row += n
+    finally:
+        rejects.close()
+    if stats is not None:
+        seconds = time.perf_counter() - t0
+        stats.update(rows=fast_rows + slow_rows, accepted=len(cols["row"]), rejected=rejects.count,
+                     fast_rows=fast_rows, slow_rows=slow_rows, seconds=round(seconds, 3),
+                     rows_per_second=round((fast_rows + slow_rows) / seconds) if seconds else None)
+    return cols
+
+
+def save(cols, out_dir, meta=None):
+    os.makedirs(out_dir, exist_ok=True)
+    for name, code in COLUMNS:
+        with open(os.path.join(out_dir, name + ".bin"), "wb") as f:
+            cols[name].tofile(f)
+    doc = dict(meta or {}, count=len(cols["row"]), byteorder=sys.byteorder,
+               columns={name: code for name, code in COLUMNS}, unknown=UNKNOWN)
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, indent=1)
+
+
+def load(out_dir):
+    """讀回 save() 的輸出 -> {"year": array("H"), ...}"""
+    with open(os.path.join(out_dir, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    cols = {}
+    for name, code in meta["columns"].items():
+        arr = array(code)
+        with open(os.path.join(out_dir, name + ".bin"), "rb") as f:
+            arr.frombytes(f.read())
+        if meta["byteorder"] != sys.byteorder:
+            arr.byteswap()
+        cols[name] = arr
+    return cols
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="出生資料 CSV -> 欄位式整數陣列")
+    ap.add_argument("input", help="CSV (含表頭)")
+    ap.add_argument("--out", required=True, help="輸出目錄")
+    ap.add_argument("--column", default="birth", help="生日欄位名稱 (預設 birth)")
+    ap.add_argument("--chunk-mb", type=float, default=DEFAULT_CHUNK_MB, help="每次讀取的大小 (MB)")
+    args = ap.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    stats = {}
+    cols = ingest(args.input, args.column, int(args.chunk_mb * (1 << 20)),
+                  rejects_path=os.path.join(args.out, "rejects.csv"), stats=stats)
+    save(cols, args.out, {"source": os.path.abspath(args.input), "column": args.column})
+    print(json.dumps(stats, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+解讀文案庫：從 data/interpretations.json 載入 (可用 BAZI_INTERPRETATIONS_PATH 指定)
+
+檔案格式：
+  {
+    "version": 1,
+    "default_locale": "zh-TW",
+    "locales": {
+      "zh-TW": {
+        "day":   {"沖": ["第一行", "第二行", ...], ...},   # 第一層：日支 vs 今日日支
+        "month": {"沖": "也可以直接寫成字串", ...}         # 第二層：日支 vs 今日月支
+        "pillar": {"天干五合": [...], ...}                 # 第三層：日柱 vs 今日日柱 (天干 / 整柱，可省略)
+      }
+    }
+  }
+
+- 第一次用到才載入 (lazy)，載入時驗證格式與必要的關係鍵，驗證失敗就不採用
+- 最多每 CHECK_INTERVAL 秒看一次檔案 mtime/size；變了就重新載入並整份原子替換 (hot reload)，
+  不必重啟 gunicorn；進行中的請求繼續用舊的那份
+- 每份快照都是唯讀 (MappingProxyType)；gunicorn 預載時在 master 載入，fork 後各 worker 共用
+- 查詢是兩層 dict 查找，O(1)
+- 以後新增的關係種類 (例如天干) 只要在 locale 底下多一個 layer 名稱
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from types import MappingProxyType
+
+import memprof
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "interpretations.json")
+
+CHECK_INTERVAL = 2.0
+
+# 每一層至少要有的鍵 (analyze_pair_logic 可能產生的名稱)；沒列在這裡的 layer 只檢查格式
+REQUIRED_KEYS = {
+    "day": ("沖", "六合", "刑 (自刑)", "刑 (無恩之刑)", "刑 (恃勢之刑)", "刑 (無禮之刑)",
+            "害", "破", "半合", "無特殊關係"),
+    "month": ("沖", "六合", "刑", "害", "破", "半合", "無特殊關係"),
+}
+
+
+class InterpretationError(ValueError):
+    """文案檔格式錯誤"""
+
+
+class Snapshot:
+    """某一版文案的唯讀快照"""
+
+    __slots__ = ("version", "generation", "default_locale", "locales", "source")
+
+    def __init__(self, version, generation, default_locale, locales, source):
+        self.version = version
+        self.generation = generation
+        self.default_locale = default_locale
+        self.locales = locales
+        self.source = source
+
+    def layer(self, name, locale=None):
+        """回傳某一層的 {關係名稱: 文案}；找不到 locale 時用預設語系"""
+        layers = self.locales.get(locale or self.default_locale) or self.locales[self.default_locale]
+        return layers.get(name) or self.locales[self.default_locale].get(name, MappingProxyType({}))
+
+
+def parse(doc, generation=0, source=None):
+    """驗證並轉成 Snapshot；格式不對時丟 InterpretationError"""
+    if not isinstance(doc, dict):
+        raise InterpretationError("根節點必須是物件")
+    version = doc.get("version")
+    if not isinstance(version, int):
+        raise InterpretationError("缺少整數 version")
+    default_locale = doc.get("default_locale")
+    locales_in = doc.get("locales")
+    if not isinstance(locales_in, dict) or default_locale not in locales_in:
+        raise InterpretationError("locales 必須包含 default_locale (%r)" % default_locale)
+
+    locales = {}
+    for loc, layers_in in locales_in.items():
+        if not isinstance(layers_in, dict):
+            raise InterpretationError("%s：必須是 {layer: {...}}" % loc)
+        layers = {}
+        for layer, texts in layers_in.items():
+            if not isinstance(texts, dict):
+                raise InterpretationError("%s.%s：必須是 {關係: 文案}" % (loc, layer))
+            out = {}
+            for key, text in texts.items():
+                if isinstance(text, list) and all(isinstance(t, str) for t in text):
+                    text = "\n".join(text)
+                if not isinstance(text, str) or not text.strip():
+                    raise InterpretationError("%s.%s.%s：文案必須是非空字串或字串陣列" % (loc, layer, key))
+                out[sys.intern(key)] = text
+            layers[layer] = MappingProxyType(out)
+        locales[loc] = MappingProxyType(layers)
+
+    # 預設語系必須完整；其他語系缺的鍵會退回預設語系
+    base = locales[default_locale]
+    for layer, keys in REQUIRED_KEYS.items():
+        missing = [k for k in keys if k not in base.get(layer, {})]
+        if missing:
+            raise InterpretationError("%s.%s 缺少：%s" % (default_locale, layer, "、".join(missing)))
+
+    return Snapshot(version, generation, default_locale, MappingProxyType(locales), source)
+
+
+class InterpretationStore:
+    def __init__(self, path=None, check_interval=CHECK_INTERVAL):
+        self.path = path or os.environ.get("BAZI_INTERPRETATIONS_PATH") or DEFAULT_PATH
+        self.check_interval = check_interval
+        self._current = None
+        self._stamp = None          # (mtime_ns, size) of the loaded file
+        self._next_check = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.last_error = None
+
+    def _file_stamp(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _load(self, stamp):
+        with open(self.path, encoding="utf-8") as f:
+            doc = json.load(f)
+        snap = parse(doc, self._generation + 1, self.path)
+        self._generation += 1
+        self._current = snap       # 單一參照賦值：讀取端不是拿到舊的就是新的
+        self._stamp = stamp
+        return snap
+
+    def get(self):
+        """目前這一版文案 (必要時載入或重新載入)"""
+        snap = self._current
+        now = time.monotonic()
+        if snap is not None and now < self._next_check:
+            return snap
+        with self._lock:
+            if self._current is not None and now < self._next_check:
+                return self._current
+            self._next_check = now + self.check_interval
+            try:
+                stamp = self._file_stamp()
+                if self._current is None or stamp != self._stamp:
+                    self._load(stamp)
+                    self.last_error = None
+            except (OSError, ValueError) as e:
+                # 新檔案壞掉時繼續用舊的那份；第一次就載入失敗才往外丟
+                self.last_error = "%s: %s" % (type(e).__name__, e)
+                if self._current is None:
+                    raise
+                logging.getLogger("bazi.interpretations").warning(
+                    "reload failed, keeping version %s: %s", self._current.version, self.last_error)
+            return self._current
+
+    def reload(self):
+        """強制立即重新檢查檔案"""
+        self._next_check = 0.0
+        return self.get()
+
+
+STORE = InterpretationStore()
+
+
+def current():
+    return STORE.get()
+
+
+def cache_info():
+    snap = STORE._current
+    if snap is None:
+        return {"loaded": False}
+    return {"loaded": True, "version": snap.version, "generation": snap.generation,
+            "locales": len(snap.locales), "texts": sum(len(l) for loc in snap.locales.values() for l in loc.values())}
+
+
+memprof.register_cache("interpretations", cache_info, lambda: STORE._current)
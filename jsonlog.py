@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+非阻塞結構化日誌：logger "bazi" 底下的紀錄一律丟進佇列，由背景執行緒輸出 JSON 行
+
+- 呼叫端 (請求執行緒) 只做：過濾 / 取樣 -> 組好訊息 -> put_nowait；寫 stdout 在背景執行緒
+- 佇列滿了就丟掉並計數 (bazi_log_dropped_total)，絕不讓請求等 I/O
+- 每筆自動帶 request_id (Flask / ASGI 請求開始時綁定，沿用 X-Request-ID 或自動產生)
+- DEBUG 等級可取樣：BAZI_LOG_DEBUG_SAMPLE=0.01 -> 只留 1%
+- gunicorn 預載後 fork：子行程自動換新佇列並重啟背景執行緒
+
+環境變數：
+  BAZI_LOG_LEVEL          預設 INFO
+  BAZI_LOG_FORMAT         json (預設) / text (本機開發好讀)
+  BAZI_LOG_DEBUG_SAMPLE   DEBUG 取樣比例 0~1，預設 1 (全留)
+  BAZI_LOG_QUEUE_SIZE     佇列上限，預設 10000
+
+用法：
+  log = jsonlog.get_logger("crawler")
+  log.info("scrape done", extra={"phase": "scrape_user", "ms": 812.5})
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+import metrics
+
+ROOT = "bazi"
+
+_REQUEST_ID = contextvars.ContextVar("bazi_request_id", default=None)
+
+# LogRecord 內建欄位；其他欄位 (extra=...) 原樣輸出
+_RESERVED = frozenset(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime", "request_id"}
+
+# 用戶端帶來的 X-Request-ID 只接受這種格式，避免把任意字串寫進日誌
+_VALID_REQUEST_ID = re.compile(r"[\w.:-]{1,64}")
+
+_LOCK = threading.Lock()
+_STATE = {"handler": None, "listener": None}
+
+
+# ==========================================
+# request id
+# ==========================================
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+def bind_request_id(request_id=None):
+    """綁定本次請求的 id；回傳 (id, token)，結束時呼叫 reset_request_id(token)"""
+    rid = request_id if request_id and _VALID_REQUEST_ID.fullmatch(request_id) else new_request_id()
+    return rid, _REQUEST_ID.set(rid)
+
+
+def reset_request_id(token):
+    _REQUEST_ID.reset(token)
+
+
+def current_request_id():
+    return _REQUEST_ID.get()
+
+
+# ==========================================
+# 格式
+# ==========================================
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        doc = {
+            "ts": "%s.%03dZ" % (time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)), record.msecs),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        rid = getattr(record, "request_id", None)
+        if rid:
+            doc["request_id"] = rid
+        for k, v in record.__dict__.items():
+            if k not in _RESERVED and not k.startswith("_"):
+                doc[k] = v
+        if record.exc_text:
+            doc["exc"] = record.exc_text
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record):
+        if not hasattr(record, "request_id"):
+            record.request_id = "-"
+        line = super().format(record)
+        extra = {k: v for k, v in record.__dict__.items() if k not in _RESERVED and not k.startswith("_")}
+        return line + (" " + json.dumps(extra, ensure_ascii=False, default=str) if extra else "")
+
+
+# ==========================================
+# 呼叫端：取樣 + 佇列
+# ==========================================
+class DebugSampler(logging.Filter):
+    """DEBUG (含) 以下的紀錄只留 rate 比例；INFO 以上全留"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """呼叫端只做最少的事：補 request_id、展開訊息參數、例外轉字串，然後 put_nowait"""
+
+    def prepare(self, record):
+        record.request_id = _REQUEST_ID.get()
+        # 參數可能是可變物件：在呼叫端先展開，背景執行緒看到的就是當下的值
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def __init__(self, q, maxsize):
+        super().__init__(q)
+        self.maxsize = maxsize
+
+    def enqueue(self, record):
+        # SimpleQueue (C 實作) 的 put 比 queue.Queue 便宜很多，但沒有上限：自己用 qsize 擋
+        if self.queue.qsize() >= self.maxsize:
+            metrics.REGISTRY.inc("bazi_log_dropped_total")
+            return
+        self.queue.put_nowait(record)
+
+
+def _output_handler():
+    h = logging.StreamHandler(sys.stdout)
+    fmt = (os.environ.get("BAZI_LOG_FORMAT") or "json").lower()
+    h.setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+    return h
+
+
+def _start_listener(handler):
+    listener = logging.handlers.QueueListener(handler.queue, _output_handler())
+    listener.start()
+    _STATE["listener"] = listener
+
+
+def _after_fork_in_child():
+    # fork 只複製呼叫 fork 的執行緒：背景執行緒不在了，換新佇列 (舊的鎖狀態不可靠) 並重啟
+    handler = _STATE["handler"]
+    if handler is None:
+        return
+    handler.queue = queue.SimpleQueue()
+    _start_listener(handler)
+
+
+def _stop():
+    listener = _STATE["listener"]
+    if listener is not None:
+        _STATE["listener"] = None
+        try:
+            listener.stop()  # 送出佇列裡剩下的紀錄
+        except Exception:
+            pass
+
+
+def setup():
+    """設定 "bazi" logger (可重複呼叫，只有第一次生效)"""
+    with _LOCK:
+        if _STATE["handler"] is not None:
+            return logging.getLogger(ROOT)
+        # LogRecord 建構時會查 multiprocessing / asyncio task 名稱：輸出用不到，關掉省下呼叫端的時間
+        logging.logMultiprocessing = False
+        logging.logAsyncioTasks = False
+        size = int(os.environ.get("BAZI_LOG_QUEUE_SIZE") or 10000)
+        handler = _QueueHandler(queue.SimpleQueue(), size)
+        handler.addFilter(DebugSampler(float(os.environ.get("BAZI_LOG_DEBUG_SAMPLE") or 1.0)))
+        logger = logging.getLogger(ROOT)
+        logger.setLevel((os.environ.get("BAZI_LOG_LEVEL") or "INFO").upper())
+        logger.addHandler(handler)
+        logger.propagate = False
+        _STATE["handler"] = handler
+        _start_listener(handler)
+        atexit.register(_stop)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_after_fork_in_child)
+        return logger
+
+
+def get_logger(name=None):
+    setup()
+    return logging.getLogger(ROOT + "." + name if name else ROOT)
+
+
+# ==========================================
+# Flask
+# ==========================================
+def init_app(app):
+    """每個請求綁定 request_id (沿用 X-Request-ID)，回應時帶回 header 並記一行 access log"""
+    from flask import g, request
+
+    access = get_logger("access")
+
+    @app.before_request
+    def _log_begin():
+        g._log_t0 = time.perf_counter()
+        rid, g._log_token = bind_request_id(request.headers.get("X-Request-ID"))
+        g.request_id = rid
+
+    @app.after_request
+    def _log_end(response):
+        t0 = getattr(g, "_log_t0", None)
+        if t0 is None:
+            return response
+        response.headers["X-Request-ID"] = g.request_id
+        if access.isEnabledFor(logging.INFO):
+            route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+            access.info("%s %s %d", request.method, route, response.status_code, extra={
+                "route": route, "method": request.method, "status": response.status_code,
+                "ms": round((time.perf_counter() - t0) * 1000.0, 3),
+                "phases": {name: round(dt * 1000.0, 3) for name, dt in metrics.current_timings()},
+            })
+        return response
+
+    @app.teardown_request
+    def _log_teardown(exc):
+        token = g.pop("_log_token", None)
+        if token is not None:
+            reset_request_id(token)
+
+    return app
@@ -0,0 +1,416 @@
+# -*- coding: utf-8 -*-
+"""
+本機壓力測試：用 gunicorn 啟動 app，非同步用戶端以目標速率打 / 與 /analyze
+
+  python loadtest.py --workers 2 --threads 4 --profile 20:15,50:15,100:15
+  python loadtest.py --worker-class sync --workers 4 --mix index=1,analyze=4
+  python loadtest.py --mix scrape=1 --standin        # 爬蟲路徑打本機 stand-in
+  python loadtest.py --url http://127.0.0.1:5000     # 打已在跑的服務 (不啟動 gunicorn)
+  python loadtest.py --config gunicorn.conf.py --workers 4   # 用正式設定 (preload + gc.freeze)
+  python loadtest.py --target asgi:app --worker-class uvicorn.workers.UvicornWorker  # ASGI 模式
+  python loadtest.py --page-cache --mix analyze_hit=1   # 結果頁快取命中 (同一份表單)
+
+啟動 gunicorn 時預設關掉結果頁快取 (BAZI_PAGE_CACHE_TTL=0)，analyze 量的是完整的排盤 + 渲染；
+--page-cache 才打開，搭配 analyze_hit (每次送同一份表單) 量快取命中。--url 模式沿用服務本身的設定。
+
+--profile 是「速率:秒數」的階梯，逐段升速 (ramp-up)；每段回報
+吞吐量、p50/p95/p99、錯誤率、各 worker 的 CPU%、RSS 與 PSS/USS
+(PSS/USS 才看得出 fork 後共用的記憶體頁：USS 是 worker 自己獨占的部分)。
+實際吞吐量跟不上目標，或 p99 超過 --slo-ms 的第一段即視為飽和點。
+
+只用標準函式庫 (asyncio 原生 HTTP/1.1 keep-alive 連線)，不需額外安裝套件。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode, urlparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PATHS = {
+    "index": ("GET", "/"),
+    "analyze": ("POST", "/analyze"),
+    "analyze_hit": ("POST", "/analyze"),
+    "scrape": ("POST", "/api/scrape"),
+}
+
+
+# analyze_hit 每次都送這一份 (開 --page-cache 時除了第一次都是快取命中)
+HIT_FORM = {"name": "壓測", "sex": "1", "year": "76", "month": "5", "day": "3", "hour": "10", "minute": "30"}
+
+
+def random_form():
+    return {
+        "name": "壓測",
+        "sex": random.choice("01"),
+        "year": str(random.randint(40, 100)),
+        "month": str(random.randint(1, 12)),
+        "day": str(random.randint(1, 28)),
+        "hour": str(random.randint(0, 23)),
+        "minute": str(random.randint(0, 59)),
+    }
+
+
+# ==========================================
+# 迷你非同步 HTTP/1.1 用戶端 (keep-alive 連線池)
+# ==========================================
+class Conn:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+
+class Pool:
+    def __init__(self, host, port, max_conns):
+        self.host = host
+        self.port = port
+        self.sem = asyncio.Semaphore(max_conns)
+        self.idle = []
+
+    async def request(self, method, path, body=b"", timeout=30.0):
+        async with self.sem:
+            conn = self.idle.pop() if self.idle else None
+            if conn is None:
+                r, w = await asyncio.open_connection(self.host, self.port)
+                conn = Conn(r, w)
+            try:
+                status, keep = await asyncio.wait_for(self._roundtrip(conn, method, path, body), timeout)
+            except BaseException:
+                conn.writer.close()
+                raise
+            if keep:
+                self.idle.append(conn)
+            else:
+                conn.writer.close()
+            return status
+
+    async def _roundtrip(self, conn, method, path, body):
+        head = ["%s %s HTTP/1.1" % (method, path), "Host: %s:%d" % (self.host, self.port),
+                "Connection: keep-alive"]
+        if method == "POST":
+            head.append("Content-Type: application/x-www-form-urlencoded")
+            head.append("Content-Length: %d" % len(body))
+        conn.writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await conn.writer.drain()
+
+        status_line = await conn.reader.readline()
+        if not status_line:
+            raise ConnectionError("server closed connection")
+        status = int(status_line.split()[1])
+        length, chunked, keep = 0, False, True
+        while True:
+            line = await conn.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = line.decode("latin-1").partition(":")
+            k, v = k.strip().lower(), v.strip().lower()
+            if k == "content-length":
+                length = int(v)
+            elif k == "transfer-encoding" and "chunked" in v:
+                chunked = True
+            elif k == "connection" and v == "close":
+                keep = False
+        if chunked:
+            while True:
+                size = int((await conn.reader.readline()).split(b";")[0], 16)
+                await conn.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        elif length:
+            await conn.reader.readexactly(length)
+        return status, keep
+
+    def close(self):
+        for c in self.idle:
+            c.writer.close()
+        self.idle.clear()
+
+
+# ==========================================
+# 統計
+# ==========================================
+def pct(sorted_vals, q):
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+
+def read_proc(pid):
+    """(cpu 秒數, {rss, pss, uss} bytes)；讀 /proc，非 Linux 回傳 None"""
+    try:
+        with open("/proc/%d/stat" % pid) as f:
+            parts = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        cpu = (int(parts[11]) + int(parts[12])) / ticks
+        mem = {}
+        with open("/proc/%d/status" % pid) as f:
+            mem["rss"] = next(int(l.split()[1]) * 1024 for l in f if l.startswith("VmRSS:"))
+    except (OSError, StopIteration, IndexError, ValueError):
+        return None
+    try:
+        # smaps_rollup：Pss = 共用頁按行程數分攤；Private_* = 獨占頁 (USS)
+        with open("/proc/%d/smaps_rollup" % pid) as f:
+            fields = {}
+            for line in f:
+                k, _, v = line.partition(":")
+                if v.strip().endswith("kB"):
+                    fields[k] = int(v.split()[0]) * 1024
+        mem["pss"] = fields.get("Pss", 0)
+        mem["uss"] = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    except OSError:
+        pass
+    return cpu, mem
+
+
+def child_pids(ppid):
+    try:
+        with open("/proc/%d/task/%d/children" % (ppid, ppid)) as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+class WorkerSampler:
+    """記錄 gunicorn 各 worker 的 CPU 使用率與 RSS"""
+
+    def __init__(self, master_pid):
+        self.master_pid = master_pid
+        self.last = {}
+
+    def sample(self):
+        now = time.monotonic()
+        out = []
+        for pid in child_pids(self.master_pid) if self.master_pid else []:
+            st = read_proc(pid)
+            if st is None:
+                continue
+            cpu, mem = st
+            prev = self.last.get(pid)
+            cpu_pct = 100.0 * (cpu - prev[1]) / (now - prev[0]) if prev and now > prev[0] else 0.0
+            self.last[pid] = (now, cpu)
+            row = {"pid": pid, "cpu_pct": round(cpu_pct, 1)}
+            for k, v in mem.items():
+                row[k + "_mb"] = round(v / 2**20, 1)
+            out.append(row)
+        return out
+
+
+# ==========================================
+# 驅動：開放式 (open-loop) 到達，固定速率發送
+# ==========================================
+async def run_step(pool, mix, rate, seconds, timeout):
+    names = [n for n, w in mix for _ in range(w)]
+    lat, errors, statuses = [], 0, {}
+    tasks = []
+
+    async def one(name):
+        nonlocal errors
+        method, path = PATHS[name]
+        form = HIT_FORM if name == "analyze_hit" else random_form()
+        body = urlencode(form).encode() if method == "POST" else b""
+        t0 = time.perf_counter()
+        try:
+            status = await pool.request(method, path, body, timeout)
+        except Exception:
+            errors += 1
+            statuses["error"] = statuses.get("error", 0) + 1
+            return
+        lat.append(time.perf_counter() - t0)
+        statuses[status] = statuses.get(status, 0) + 1
+        if status >= 500:
+            errors += 1
+
+    start = time.perf_counter()
+    n = int(rate * seconds)
+    for i in range(n):
+        # 依排程時間送出，不等前一個回應 (避免 coordinated omission)
+        delay = start + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(one(random.choice(names))))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    lat.sort()
+    done = len(lat)
+    return {
+        "target_rps": rate,
+        "sent": n,
+        "throughput_rps": round(done / elapsed, 1) if elapsed else 0.0,
+        "error_rate": round(errors / n, 4) if n else 0.0,
+        "p50_ms": round(pct(lat, 0.50) * 1000, 1),
+        "p95_ms": round(pct(lat, 0.95) * 1000, 1),
+        "p99_ms": round(pct(lat, 0.99) * 1000, 1),
+        "status": {str(k): v for k, v in statuses.items()},
+    }
+
+
+async def drive(host, port, mix, profile, max_conns, timeout, sampler, slo_ms):
+    pool = Pool(host, port, max_conns)
+    steps = []
+    saturated_at = None
+    sampler.sample()
+    try:
+        for rate, seconds in profile:
+            res = await run_step(pool, mix, rate, seconds, timeout)
+            res["workers"] = sampler.sample()
+            steps.append(res)
+            ok = res["throughput_rps"] >= 0.9 * rate and res["p99_ms"] <= slo_ms and res["error_rate"] < 0.01
+            flag = "" if ok else "  <-- saturated"
+            if not ok and saturated_at is None:
+                saturated_at = rate
+            print("%7.1f rps -> %7.1f rps  p50 %7.1f  p95 %7.1f  p99 %7.1f ms  err %5.2f%%  %s%s" % (
+                rate, res["throughput_rps"], res["p50_ms"], res["p95_ms"], res["p99_ms"],
+                res["error_rate"] * 100,
+                " ".join("[%d cpu %.0f%% rss %.0fMB uss %.0fMB]" % (
+                    w["pid"], w["cpu_pct"], w["rss_mb"], w.get("uss_mb", 0)) for w in res["workers"]),
+                flag))
+    finally:
+        pool.close()
+    return steps, saturated_at
+
+
+# ==========================================
+# 服務啟動
+# ==========================================
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_port(host, port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not open %s:%d" % (host, port))
+
+
+def start_gunicorn(port, workers, threads, worker_class, env, config=None, target="app:app"):
+    cmd = [sys.executable, "-m", "gunicorn", target, "--bind", "127.0.0.1:%d" % port,
+           "--workers", str(workers), "--threads", str(threads), "--log-level", "warning"]
+    empty = None
+    if config:
+        # 正式設定檔決定 preload / gc.freeze；worker class 沿用設定檔 (除非另外指定)
+        cmd += ["-c", config]
+        if worker_class:
+            cmd += ["--worker-class", worker_class]
+    else:
+        # 不用設定檔時等同原本的 `gunicorn app:app` (空設定檔，避免自動讀到 ./gunicorn.conf.py)
+        empty = tempfile.NamedTemporaryFile("w", suffix=".conf.py", delete=False)
+        empty.close()
+        cmd += ["-c", empty.name, "--worker-class", worker_class or "sync", "--timeout", "120"]
+    proc = subprocess.Popen(cmd, cwd=HERE, env=env)
+    try:
+        wait_port("127.0.0.1", port, timeout=60)
+    finally:
+        # 設定檔只在 master 啟動時讀一次：開始聽 port (或啟動失敗) 後就刪掉，不在 /tmp 留檔
+        if empty is not None:
+            os.unlink(empty.name)
+    # 等所有 worker fork 完成
+    deadline = time.monotonic() + 10
+    while len(child_pids(proc.pid)) < workers and time.monotonic() < deadline:
+        time.sleep(0.1)
+    return proc
+
+
+def parse_profile(text):
+    steps = []
+    for part in text.split(","):
+        rate, _, secs = part.partition(":")
+        steps.append((float(rate), float(secs or 10)))
+    return steps
+
+
+def parse_mix(text):
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in PATHS:
+            raise SystemExit("unknown path in --mix: %s (choose %s)" % (name, ", ".join(PATHS)))
+        mix.append((name, int(weight or 1)))
+    return mix
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="八字服務本機壓力測試")
+    ap.add_argument("--url", help="打已在跑的服務，不啟動 gunicorn")
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--threads", type=int, default=1)
+    ap.add_argument("--worker-class", help="sync / gthread / ... (預設 sync；有 --config 時沿用設定檔)")
+    ap.add_argument("--config", help="gunicorn 設定檔，例如 gunicorn.conf.py")
+    ap.add_argument("--target", default="app:app", help="WSGI/ASGI 進入點 (app:app 或 asgi:app)")
+    ap.add_argument("--profile", default="10:10,25:10,50:10,100:10", help="速率:秒數, 逗號分隔")
+    ap.add_argument("--mix", default="index=1,analyze=4")
+    ap.add_argument("--max-conns", type=int, default=256)
+    ap.add_argument("--timeout", type=float, default=30.0)
+    ap.add_argument("--slo-ms", type=float, default=1000.0, help="p99 上限，超過視為飽和")
+    ap.add_argument("--page-cache", action="store_true", help="不關結果頁快取 (預設關閉，量完整的 /analyze)")
+    ap.add_argument("--standin", action="store_true", help="啟動本機 NCC stand-in 並開啟爬蟲路徑")
+    ap.add_argument("--json", help="把結果寫到這個 JSON 檔")
+    args = ap.parse_args(argv)
+
+    env = dict(os.environ)
+    if not args.page_cache:
+        env["BAZI_PAGE_CACHE_TTL"] = "0"
+    standin = None
+    if args.standin:
+        import ncc_standin
+        standin, _ = ncc_standin.serve(port=0)
+        env["BAZI_NCC_URL"] = "http://127.0.0.1:%d/s.php" % standin.server_address[1]
+        env["BAZI_ENABLE_CRAWLER"] = "1"
+
+    proc = None
+    if args.url:
+        u = urlparse(args.url)
+        host, port = u.hostname, u.port or 80
+    else:
+        host, port = "127.0.0.1", free_port()
+        proc = start_gunicorn(port, args.workers, args.threads, args.worker_class, env,
+                              args.config, args.target)
+        print("gunicorn pid %d: %d x %s worker(s), %d thread(s)%s" % (
+            proc.pid, args.workers, args.worker_class or ("(config)" if args.config else "sync"),
+            args.threads, ", config %s" % args.config if args.config else ""))
+
+    try:
+        sampler = WorkerSampler(proc.pid if proc else None)
+        steps, saturated_at = asyncio.run(drive(
+            host, port, parse_mix(args.mix), parse_profile(args.profile),
+            args.max_conns, args.timeout, sampler, args.slo_ms))
+    finally:
+        if proc is not None:
+            proc.send_signal(signal.SIGTERM)
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if standin is not None:
+            standin.shutdown()
+
+    print("saturation point: %s" % ("%.1f rps" % saturated_at if saturated_at else "not reached"))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "config": {"workers": args.workers, "threads": args.threads,
+                           "worker_class": args.worker_class, "gunicorn_config": args.config,
+                           "target": args.target,
+                           "mix": args.mix},
+                "steps": steps,
+                "saturated_at_rps": saturated_at,
+            }, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
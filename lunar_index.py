@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+農曆 ↔ 國曆 換算：預先算好的農曆月首索引 (data/lunar_index.json)
+
+每個農曆年只存三個數字：
+  [正月初一的 ordinal (date.toordinal), 閏月 (0 = 無閏月), 月大小 bits]
+月大小 bits 依該年月份順序 (閏月排在原月之後)，第 i 個 bit = 1 表示大月 (30 天)，0 表示小月 (29 天)。
+
+載入後展開成「每個農曆月的月首 ordinal」的排序陣列：
+  - 國曆 -> 農曆：bisect 找到所在月份，再相減得日
+  - 農曆 -> 國曆：dict 查月首，再加上日數
+都不需要 lunar_python；lunar_python 只在重建索引 (build) 與逐日驗證 (validate) 時才用到。
+
+  python lunar_index.py build                  # 由 lunar_python 重建 data/lunar_index.json
+  python lunar_index.py validate               # 範圍內每一天與 lunar_python 比對
+  python lunar_index.py to-solar 1990 閏5 1     # 農曆 -> 國曆
+  python lunar_index.py to-lunar 1990 6 23     # 國曆 -> 農曆
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from datetime import date
+
+import memprof
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "lunar_index.json")
+
+# 支援的農曆年範圍 (含頭尾)
+FIRST_YEAR = 1900
+LAST_YEAR = 2100
+
+MONTH_NAMES = "正二三四五六七八九十冬臘"
+
+_LOCK = threading.Lock()
+_INDEX = None
+
+
+class _Index:
+    """展開後的月首表 (唯讀)"""
+
+    __slots__ = ("first_year", "last_year", "starts", "keys", "by_key")
+
+    def __init__(self, first_year, years):
+        self.first_year = first_year
+        self.last_year = first_year + len(years) - 1
+        starts = array("l")
+        keys = []
+        for i, (new_year, leap, bits) in enumerate(years):
+            y = first_year + i
+            ordinal = new_year
+            seq = 0
+            for m in range(1, 13):
+                for is_leap in ((False, True) if m == leap else (False,)):
+                    starts.append(ordinal)
+                    keys.append((y, m, is_leap))
+                    ordinal += 30 if bits >> seq & 1 else 29
+                    seq += 1
+        # 最後一個月的月底 (哨兵)：下一年的正月初一
+        starts.append(ordinal)
+        self.starts = starts
+        self.keys = tuple(keys)
+        self.by_key = {k: i for i, k in enumerate(keys)}
+
+
+def _load(path):
+    with open(path, encoding="utf-8") as f:
+        doc = json.load(f)
+    first_year = doc["first_year"]
+    years = doc["years"]
+    # 相鄰兩年要首尾相接，避免索引檔被改壞
+    idx = _Index(first_year, years)
+    for i in range(1, len(years)):
+        if idx.starts[idx.by_key[(first_year + i, 1, False)]] != years[i][0]:
+            raise ValueError("lunar index: %d 年正月初一與前一年不相接" % (first_year + i))
+    return idx
+
+
+def index(path=None):
+    """第一次用到才載入索引 (gunicorn 預載時在 master 載入，fork 後共用)"""
+    global _INDEX
+    if _INDEX is None:
+        with _LOCK:
+            if _INDEX is None:
+                _INDEX = _load(path or os.environ.get("BAZI_LUNAR_INDEX_PATH") or DEFAULT_PATH)
+    return _INDEX
+
+
+def cache_info():
+    return {"loaded": _INDEX is not None, "months": len(_INDEX.keys) if _INDEX is not None else 0}
+
+
+memprof.register_cache("lunar_index", cache_info, lambda: _INDEX)
+
+
+# ==========================================
+# 換算
+# ==========================================
+def to_solar(year, month, day, leap=False):
+    """農曆 (年, 月, 日, 是否閏月) -> 國曆 (年, 月, 日)"""
+    idx = index()
+    if not idx.first_year <= year <= idx.last_year:
+        raise ValueError("農曆年份需介於 %d ~ %d" % (idx.first_year, idx.last_year))
+    if not 1 <= month <= 12:
+        raise ValueError("農曆月份需為 1~12")
+    i = idx.by_key.get((year, month, bool(leap)))
+    if i is None:
+        raise ValueError("農曆 %d 年沒有閏%s月" % (year, MONTH_NAMES[month - 1]))
+    length = idx.starts[i + 1] - idx.starts[i]
+    if not 1 <= day <= length:
+        raise ValueError("農曆 %d 年%s%s月只有 %d 天" % (
+            year, "閏" if leap else "", MONTH_NAMES[month - 1], length))
+    d = date.fromordinal(idx.starts[i] + day - 1)
+    return d.year, d.month, d.day
+
+
+def to_lunar(year, month, day):
+    """國曆 (年, 月, 日) -> 農曆 (年, 月, 日, 是否閏月)"""
+    idx = index()
+    ordinal = date(year, month, day).toordinal()
+    i = bisect_right(idx.starts, ordinal) - 1
+    if i < 0 or i >= len(idx.keys):
+        raise ValueError("日期超出農曆索引範圍 (農曆 %d ~ %d 年)" % (idx.first_year, idx.last_year))
+    y, m, is_leap = idx.keys[i]
+    return y, m, ordinal - idx.starts[i] + 1, is_leap
+
+
+def month_days(year, month, leap=False):
+    """農曆某月的天數 (29 或 30)"""
+    idx = index()
+    i = idx.by_key.get((year, month, bool(leap)))
+    if i is None:
+        raise ValueError("農曆 %d 年沒有%s%d月" % (year, "閏" if leap else "", month))
+    return idx.starts[i + 1] - idx.starts[i]
+
+
+def leap_month(year):
+    """農曆某年的閏月 (0 = 無閏月)"""
+    idx = index()
+    for m in range(1, 13):
+        if (year, m, True) in idx.by_key:
+            return m
+    return 0
+
+
+# ==========================================
+# 建表 / 驗證 (需要 lunar_python)
+# ==========================================
+def build(first_year=FIRST_YEAR, last_year=LAST_YEAR):
+    """由 lunar_python 算出每一年的 [正月初一 ordinal, 閏月, 月大小 bits]"""
+    from lunar_python import LunarYear, Solar
+    years = []
+    for y in range(first_year, last_year + 1):
+        months = [m for m in LunarYear.fromYear(y).getMonthsInYear() if m.getYear() == y]
+        first = Solar.fromJulianDay(months[0].getFirstJulianDay())
+        leap = 0
+        bits = 0
+        for seq, m in enumerate(months):
+            if m.getMonth() < 0:
+                leap = -m.getMonth()
+            if m.getDayCount() == 30:
+                bits |= 1 << seq
+        years.append([date(first.getYear(), first.getMonth(), first.getDay()).toordinal(), leap, bits])
+    return {"version": 1, "first_year": first_year, "years": years}
+
+
+def validate(verbose=False):
+    """範圍內每一天：國曆 -> 農曆、農曆 -> 國曆都與 lunar_python 比對；回傳 (天數, 錯誤列表)"""
+    from lunar_python import Solar
+    idx = index()
+    errors = []
+    start, end = idx.starts[0], idx.starts[-1]
+    for ordinal in range(start, end):
+        d = date.fromordinal(ordinal)
+        lunar = Solar.fromYmd(d.year, d.month, d.day).getLunar()
+        expect = (lunar.getYear(), abs(lunar.getMonth()), lunar.getDay(), lunar.getMonth() < 0)
+        got = to_lunar(d.year, d.month, d.day)
+        if got != expect:
+            errors.append("%s: to_lunar %r != %r" % (d, got, expect))
+        elif to_solar(*got) != (d.year, d.month, d.day):
+            errors.append("%s: to_solar%r != %r" % (d, got, to_solar(*got)))
+        if verbose and d.month == 1 and d.day == 1:
+            print("  %d ..." % d.year, file=sys.stderr)
+    return end - start, errors
+
+
+def _parse_lunar_month(text):
+    """'5' / '閏5' / '5L' -> (5, 是否閏月)"""
+    text = text.strip()
+    leap = text.startswith("閏") or text.upper().endswith("L")
+    return int(text.strip("閏Ll")), leap
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="農曆 ↔ 國曆 索引")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build", help="由 lunar_python 重建索引檔")
+    b.add_argument("--first-year", type=int, default=FIRST_YEAR)
+    b.add_argument("--last-year", type=int, default=LAST_YEAR)
+    b.add_argument("--out", default=DEFAULT_PATH)
+    sub.add_parser("validate", help="範圍內逐日與 lunar_python 比對")
+    s = sub.add_parser("to-solar", help="農曆 -> 國曆")
+    s.add_argument("year", type=int)
+    s.add_argument("month", help="月份，閏月寫成 閏5 或 5L")
+    s.add_argument("day", type=int)
+    g = sub.add_parser("to-lunar", help="國曆 -> 農曆")
+    g.add_argument("year", type=int)
+    g.add_argument("month", type=int)
+    g.add_argument("day", type=int)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "build":
+        doc = build(args.first_year, args.last_year)
+        tmp = args.out + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write('{"version": %d, "first_year": %d, "years": [\n' % (doc["version"], doc["first_year"]))
+            f.write(",\n".join(json.dumps(row) for row in doc["years"]))
+            f.write("\n]}\n")
+        os.replace(tmp, args.out)
+        print("wrote %s (%d years)" % (args.out, len(doc["years"])))
+        return 0
+    if args.cmd == "validate":
+        days, errors = validate(verbose=True)
+        for e in errors[:20]:
+            print(e)
+        print("%d days checked, %d mismatches" % (days, len(errors)))
+        return 1 if errors else 0
+    if args.cmd == "to-solar":
+        month, leap = _parse_lunar_month(args.month)
+        print("%04d-%02d-%02d" % to_solar(args.year, month, args.day, leap))
+        return 0
+    y, m, d, leap = to_lunar(args.year, args.month, args.day)
+    print("農曆 %d 年%s%s月%d日" % (y, "閏" if leap else "", MONTH_NAMES[m - 1], d))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
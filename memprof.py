@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""
+每個 worker 的記憶體帳：RSS / PSS、各快取大小、tracemalloc 配置熱點 (依模組歸戶) 與快照差異
+
+環境變數：
+  BAZI_MEMPROF            1 = 啟動時開 tracemalloc (預設關閉；關閉時仍可看 RSS 與快取大小)
+  BAZI_MEMPROF_FRAMES     每筆配置保留幾層呼叫堆疊 (預設 8；越多越能歸到「誰呼叫的」，但越慢越佔記憶體)
+  BAZI_MEMPROF_INTERVAL   若設定 (秒)，背景定期拍快照；第一張當 baseline，其後只留最近 BAZI_MEMPROF_KEEP 張
+  BAZI_MEMPROF_KEEP       保留幾張快照 (預設 4，不含 baseline)
+要連 import 階段的配置都算進去，改用 PYTHONTRACEMALLOC=8 啟動 (tracemalloc 由直譯器一開始就追蹤)。
+
+tracemalloc 很貴：lunar_python 排盤配置大量小物件，開著時 /analyze 會慢二、三十倍。
+線上只在一個 worker 上短暫打開 (action=start → 拍快照 → action=stop)，不要整批常駐。
+
+歸戶規則：從最內層往外找第一個「本專案檔案」或「第三方套件」的 frame
+(json / re 等標準函式庫不算)，所以文案檔解析出來的字串會算在 interpretations，
+lunar_python 建的物件算在 lunar_python，模板編譯算在 jinja2。
+
+各快取在自己的模組裡 register_cache(名稱, info, target)：info() 回傳筆數等資訊，
+target() 回傳快取容器，報表時遞迴估算位元組數 (deep_sizeof)。
+
+  GET    /admin/memory?top=20              報表 (本 worker；多 worker 時每次可能打到不同的 worker)
+  POST   /admin/memory?action=snapshot&label=noon    拍快照
+  GET    /admin/memory?diff=baseline..noon            兩張快照的差異 (依模組 + 依行號)
+  POST   /admin/memory?action=start|stop               執行中開 / 關 tracemalloc
+  DELETE /admin/memory                               清掉快照
+
+  python memprof.py --url http://127.0.0.1:8000 --token $BAZI_ADMIN_TOKEN [--snapshot noon] [--diff baseline..noon]
+  python memprof.py --local --requests 300          # 本機：import app、預熱、打 N 個請求，印出報表與差異
+"""
+import argparse
+import gc
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from types import MappingProxyType
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+_CACHES = OrderedDict()   # name -> (info, target)
+_CACHES_LOCK = threading.Lock()
+
+
+# ==========================================
+# 快取大小
+# ==========================================
+def register_cache(name, info=None, target=None):
+    """登記一個快取：info() -> dict (筆數等)，target() -> 快取容器 (估算位元組數用)"""
+    with _CACHES_LOCK:
+        _CACHES[name] = (info, target)
+
+
+def deep_sizeof(obj, limit=200000):
+    """遞迴估算物件大小 (容器 + 內容，同一物件只算一次)；最多走 limit 個物件"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack and len(seen) < limit:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, (type, type(sys), type(deep_sizeof))):
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, (dict, MappingProxyType, OrderedDict)):
+            for k, v in o.items():
+                stack.append(k)
+                stack.append(v)
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif hasattr(o, "__dict__"):
+            stack.append(vars(o))
+        elif hasattr(type(o), "__slots__"):
+            stack.extend(getattr(o, s) for s in type(o).__slots__ if hasattr(o, s))
+    return total
+
+
+def cache_report(sizes=True):
+    with _CACHES_LOCK:
+        items = list(_CACHES.items())
+    out = {}
+    for name, (info, target) in items:
+        try:
+            row = dict(info()) if info else {}
+            if sizes and target is not None:
+                row["bytes"] = deep_sizeof(target())
+        except Exception as e:  # 報表不能因為某個快取壞掉就整個失敗
+            row = {"error": "%s: %s" % (type(e).__name__, e)}
+        out[name] = row
+    return out
+
+
+# ==========================================
+# 行程記憶體 (Linux /proc；其他平台只有 ru_maxrss)
+# ==========================================
+def _proc_kb(path, keys):
+    out = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                k, _, v = line.partition(":")
+                if k in keys:
+                    out[k] = int(v.split()[0])
+    except (OSError, ValueError):
+        pass
+    return out
+
+
+def process_memory():
+    """RSS 與 PSS (KB)；PSS 把和其他 worker 共用 (preload + fork) 的頁平分，比 RSS 更接近實際成本"""
+    out = {"pid": os.getpid()}
+    out.update({k.lower() + "_kb": v for k, v in _proc_kb(
+        "/proc/self/status", ("VmRSS", "VmHWM", "RssAnon", "RssFile", "RssShmem")).items()})
+    out.update({k.lower() + "_kb": v for k, v in _proc_kb(
+        "/proc/self/smaps_rollup", ("Pss", "Private_Clean", "Private_Dirty", "Shared_Clean", "Shared_Dirty")).items()})
+    if "vmrss_kb" not in out:
+        try:
+            import resource
+            out["maxrss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        except (ImportError, OSError):
+            pass
+    out["gc_counts"] = gc.get_count()
+    out["gc_frozen"] = gc.get_freeze_count()
+    return out
+
+
+# ==========================================
+# tracemalloc
+# ==========================================
+_SITE_PACKAGE = re.compile(r"[/\\](?:site|dist)-packages[/\\]([^/\\]+)")
+_OWNER_CACHE = {}
+
+
+def _owner(filename):
+    """檔名 -> 歸戶名稱：本專案模組名、第三方套件名；標準函式庫回傳 None"""
+    owner = _OWNER_CACHE.get(filename, False)
+    if owner is not False:
+        return owner
+    m = _SITE_PACKAGE.search(filename)
+    if m:
+        owner = m.group(1).split(".")[0]
+    elif os.path.dirname(filename) == HERE:
+        owner = os.path.splitext(os.path.basename(filename))[0]
+    else:
+        owner = None
+    _OWNER_CACHE[filename] = owner
+    return owner
+
+
+def _stdlib_name(filename):
+    if filename.startswith("<"):
+        return filename
+    return "stdlib:" + os.path.splitext(os.path.basename(filename))[0]
+
+
+def owner_of(traceback):
+    for frame in reversed(traceback):   # 最內層 (最近的呼叫) 在最後
+        owner = _owner(frame.filename)
+        if owner:
+            return owner
+    return _stdlib_name(traceback[-1].filename) if len(traceback) else "<unknown>"
+
+
+def by_module(snapshot):
+    """{歸戶名稱: [bytes, count]}；memprof 自己 (報表、快照清單) 不算"""
+    out = {}
+    for stat in snapshot.statistics("traceback"):
+        owner = owner_of(stat.traceback)
+        if owner == "memprof":
+            continue
+        row = out.setdefault(owner, [0, 0])
+        row[0] += stat.size
+        row[1] += stat.count
+    return out
+
+
+def _site(frame):
+    path = frame.filename
+    if path.startswith(HERE + os.sep):
+        path = path[len(HERE) + 1:]
+    else:
+        m = _SITE_PACKAGE.search(path)
+        if m:
+            path = path[m.start(1):]
+    return "%s:%d" % (path, frame.lineno)
+
+
+def _top_modules(mods, top):
+    rows = sorted(mods.items(), key=lambda kv: -kv[1][0])[:top]
+    return [{"module": k, "kb": round(v[0] / 1024.0, 1), "count": v[1]} for k, v in rows]
+
+
+class MemoryProfiler:
+    """tracemalloc 快照的保管與比較；baseline 一直保留，其他快照最多 keep 張"""
+
+    def __init__(self, frames=8, keep=4, interval=None):
+        self.frames = frames
+        self.keep = keep
+        self.interval = interval
+        self._snapshots = OrderedDict()   # label -> {"at", "snapshot", "caches", "process"}
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._timer = None
+
+    # ---------- 開關 ----------
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        if self.interval and self._timer is None:
+            self._timer = threading.Thread(target=self._periodic, name="bazi-memprof", daemon=True)
+            self._timer.start()
+
+    def stop(self):
+        tracemalloc.stop()
+
+    def _periodic(self):
+        while True:
+            time.sleep(self.interval)
+            if tracemalloc.is_tracing():
+                self.snapshot()
+
+    # ---------- 快照 ----------
+    def snapshot(self, label=None):
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc 未啟動 (BAZI_MEMPROF=1 或 action=start)")
+        # 不用 snapshot.filter_traces()：它在 Python 裡逐筆 fnmatch，十幾萬筆要十幾秒
+        snap = tracemalloc.take_snapshot()
+        entry = {"at": time.time(), "snapshot": snap, "traced_kb": round(tracemalloc.get_traced_memory()[0] / 1024.0, 1),
+                 "caches": cache_report(), "process": process_memory()}
+        with self._lock:
+            self._seq += 1
+            if label is None:
+                label = "baseline" if "baseline" not in self._snapshots else "auto-%d" % self._seq
+            self._snapshots.pop(label, None)
+            self._snapshots[label] = entry
+            others = [k for k in self._snapshots if k != "baseline"]
+            for k in others[:max(0, len(others) - self.keep)]:
+                del self._snapshots[k]
+        return label
+
+    def labels(self):
+        with self._lock:
+            return [{"label": k, "at": round(v["at"], 3), "traced_kb": v["traced_kb"]}
+                    for k, v in self._snapshots.items()]
+
+    def reset(self):
+        with self._lock:
+            self._snapshots.clear()
+
+    def _get(self, label):
+        with self._lock:
+            if label == "latest" and self._snapshots:
+                label = next(reversed(self._snapshots))
+            entry = self._snapshots.get(label)
+        if entry is None:
+            raise KeyError("沒有這張快照：%s" % label)
+        return entry
+
+    def diff(self, old, new, top=20):
+        """兩張快照的差異：依模組、依行號 (配置點)、快取筆數 / 大小、RSS"""
+        a, b = self._get(old), self._get(new)
+        ma, mb = by_module(a["snapshot"]), by_module(b["snapshot"])
+        mods = []
+        for k in set(ma) | set(mb):
+            da = ma.get(k, (0, 0))
+            db = mb.get(k, (0, 0))
+            if da != db:
+                mods.append({"module": k, "kb_diff": round((db[0] - da[0]) / 1024.0, 1),
+                             "kb": round(db[0] / 1024.0, 1), "count_diff": db[1] - da[1]})
+        mods.sort(key=lambda r: -abs(r["kb_diff"]))
+        sites = [{"site": _site(s.traceback[-1]), "kb_diff": round(s.size_diff / 1024.0, 1),
+                  "kb": round(s.size / 1024.0, 1), "count_diff": s.count_diff}
+                 for s in b["snapshot"].compare_to(a["snapshot"], "lineno")[:top] if s.size_diff]
+        caches = {}
+        for name in set(a["caches"]) | set(b["caches"]):
+            ca, cb = a["caches"].get(name, {}), b["caches"].get(name, {})
+            delta = {k: cb[k] - ca.get(k, 0) for k in cb
+                     if isinstance(cb[k], (int, float)) and not isinstance(cb[k], bool) and cb[k] != ca.get(k, 0)}
+            if delta:
+                caches[name] = delta
+        proc = {k: b["process"][k] - a["process"].get(k, 0) for k in b["process"]
+                if k.endswith("_kb") and k in a["process"]}
+        return {"old": old, "new": new, "seconds": round(b["at"] - a["at"], 1),
+                "modules": mods[:top], "sites": sites, "caches": caches, "process_kb_diff": proc}
+
+    def report(self, top=20):
+        out = {"tracing": tracemalloc.is_tracing(), "process": process_memory(), "caches": cache_report()}
+        if tracemalloc.is_tracing():
+            snap = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            out["traced_kb"] = round(current / 1024.0, 1)
+            out["traced_peak_kb"] = round(peak / 1024.0, 1)
+            out["modules"] = _top_modules(by_module(snap), top)
+            out["sites"] = [{"site": _site(s.traceback[-1]), "kb": round(s.size / 1024.0, 1), "count": s.count}
+                            for s in snap.statistics("lineno")[:top]]
+        out["snapshots"] = self.labels()
+        return out
+
+
+def _env_int(name, default):
+    v = os.environ.get(name)
+    return int(v) if v else default
+
+
+PROFILER = MemoryProfiler(frames=_env_int("BAZI_MEMPROF_FRAMES", 8), keep=_env_int("BAZI_MEMPROF_KEEP", 4),
+                          interval=_env_int("BAZI_MEMPROF_INTERVAL", 0) or None)
+
+
+def install():
+    """依 BAZI_MEMPROF 決定是否開 tracemalloc；回傳 PROFILER (不管有沒有開，報表都可以用)"""
+    if os.environ.get("BAZI_MEMPROF") == "1" or tracemalloc.is_tracing():
+        PROFILER.start()
+    return PROFILER
+
+
+# ==========================================
+# CLI：文字報表
+# ==========================================
+def format_report(rep):
+    lines = []
+    p = rep.get("process", {})
+    lines.append("pid %s  rss %s KB  pss %s KB  anon %s KB  private_dirty %s KB  gc_frozen %s" % (
+        p.get("pid"), p.get("vmrss_kb", p.get("maxrss_kb")), p.get("pss_kb", "-"), p.get("rssanon_kb", "-"),
+        p.get("private_dirty_kb", "-"), p.get("gc_frozen")))
+    if "traced_kb" in rep:
+        lines.append("tracemalloc: %.1f KB (peak %.1f KB)" % (rep["traced_kb"], rep["traced_peak_kb"]))
+    lines.append("")
+    lines.append("%-28s %s" % ("cache", "info"))
+    for name, row in rep.get("caches", {}).items():
+        lines.append("%-28s %s" % (name, json.dumps(row, ensure_ascii=False)))
+    if rep.get("modules"):
+        lines.append("")
+        lines.append("%-28s %12s %10s" % ("module", "KB", "count"))
+        for r in rep["modules"]:
+            lines.append("%-28s %12.1f %10d" % (r["module"], r["kb"], r["count"]))
+    if rep.get("sites"):
+        lines.append("")
+        lines.append("%-60s %10s %8s" % ("site", "KB", "count"))
+        for r in rep["sites"]:
+            lines.append("%-60s %10.1f %8d" % (r["site"][-60:], r["kb"], r["count"]))
+    if rep.get("snapshots"):
+        lines.append("")
+        lines.append("snapshots: " + ", ".join("%s (%.1f KB)" % (s["label"], s["traced_kb"]) for s in rep["snapshots"]))
+    return "\n".join(lines) + "\n"
+
+
+def format_diff(d):
+    lines = ["diff %s -> %s (%.1fs)" % (d["old"], d["new"], d["seconds"]),
+             "process: " + ", ".join("%s %+d" % (k, v) for k, v in sorted(d["process_kb_diff"].items())), ""]
+    lines.append("%-28s %12s %12s %10s" % ("module", "KB diff", "KB", "count diff"))
+    for r in d["modules"]:
+        lines.append("%-28s %+12.1f %12.1f %+10d" % (r["module"], r["kb_diff"], r["kb"], r["count_diff"]))
+    lines.append("")
+    lines.append("%-60s %10s %10s" % ("site", "KB diff", "count diff"))
+    for r in d["sites"]:
+        lines.append("%-60s %+10.1f %+10d" % (r["site"][-60:], r["kb_diff"], r["count_diff"]))
+    if d["caches"]:
+        lines.append("")
+        for name, delta in sorted(d["caches"].items()):
+            lines.append("cache %-22s %s" % (name, ", ".join("%s %+g" % kv for kv in sorted(delta.items()))))
+    return "\n".join(lines) + "\n"
+
+
+def _remote(url, token, method="GET", **params):
+    from urllib.parse import urlencode
+    from urllib.request import Request, urlopen
+    req = Request(url.rstrip("/") + "/admin/memory?" + urlencode(params), method=method,
+                  headers={"X-Admin-Token": token or ""})
+    with urlopen(req, timeout=60) as r:
+        return json.loads(r.read().decode("utf-8"))
+
+
+def _local(requests_n, top):
+    PROFILER.start()
+    import app as web
+    web.warmup(1)
+    PROFILER.snapshot("baseline")
+    client = web.app.test_client()
+    for i in range(requests_n):
+        client.post("/analyze", data={"year": str(60 + i % 40), "month": str(1 + i % 12), "day": str(1 + i % 28),
+                                      "hour": str(i % 24), "minute": "0", "sex": str(i % 2)})
+    gc.collect()
+    PROFILER.snapshot("after")
+    return PROFILER.report(top), PROFILER.diff("baseline", "after", top)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="worker 記憶體帳 / tracemalloc 報表")
+    ap.add_argument("--url", help="打執行中服務的 /admin/memory (需 BAZI_ADMIN_TOKEN)")
+    ap.add_argument("--token", default=os.environ.get("BAZI_ADMIN_TOKEN"))
+    ap.add_argument("--snapshot", metavar="LABEL", help="先在服務端拍一張快照")
+    ap.add_argument("--diff", metavar="OLD..NEW", help="印出兩張快照的差異 (NEW 可寫 latest)")
+    ap.add_argument("--local", action="store_true", help="本機 import app、預熱後打 --requests 個請求")
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--json", action="store_true", help="輸出 JSON 而不是文字")
+    args = ap.parse_args(argv)
+
+    if args.local:
+        rep, diff = _local(args.requests, args.top)
+        out = [rep, diff]
+        text = format_report(rep) + "\n" + format_diff(diff)
+    elif args.url:
+        if args.snapshot:
+            _remote(args.url, args.token, "POST", action="snapshot", label=args.snapshot)
+        if args.diff:
+            diff = _remote(args.url, args.token, diff=args.diff, top=args.top)
+            out, text = diff, format_diff(diff)
+        else:
+            rep = _remote(args.url, args.token, top=args.top)
+            out, text = rep, format_report(rep)
+    else:
+        ap.print_help()
+        return 2
+    sys.stdout.write(json.dumps(out, ensure_ascii=False, indent=1) + "\n" if args.json else text)
+    return 0
+
+
+if __name__ == "__main__":
+    # 各模組 import 的是 memprof，不是 __main__：共用同一份登記表與快照
+    sys.modules.setdefault("memprof", sys.modules[__name__])
+    sys.exit(main())
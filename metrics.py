@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+輕量級延遲量測：分段計時 + Prometheus 文字格式輸出
+
+- stage("calc_user")：量一段程式的耗時，記進直方圖，並收進本次請求的 Server-Timing
+- REGISTRY.render()：輸出 /metrics 用的 Prometheus 文字格式
+- 多個 gunicorn worker：設定 BAZI_METRICS_DIR (或 PROMETHEUS_MULTIPROC_DIR)，
+  每個 worker 把自己的快照寫到 metrics_<pid>.json，/metrics 讀取時全部加總
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import memprof
+
+# 直方圖桶 (秒)：從 0.5ms 到 60s，涵蓋本地運算與爬蟲
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+           0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 寫檔節流：同一個 worker 最多每秒寫一次快照；被節流掉的那次由計時器在時間到時補寫
+FLUSH_INTERVAL = 1.0
+
+# 本次請求的分段耗時 [(stage, seconds), ...]；不在請求內時為 None
+_TIMINGS = contextvars.ContextVar("bazi_stage_timings", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(key, extra=None):
+    pairs = list(key)
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join('%s="%s"' % (k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_num(v):
+    if v == int(v) and abs(v) < 1e15:
+        return str(int(v))
+    return repr(float(v))
+
+
+def _pid_alive(pid):
+    if pid is None or pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+class Registry:
+    """行程內的計數器 / 直方圖 / gauge 集合 (執行緒安全)"""
+
+    def __init__(self, multiproc_dir=None):
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, label_key) -> float
+        self._hists = {}       # (name, label_key) -> [bucket counts..., +Inf, sum]
+        self._gauges = {}      # (name, label_key) -> float (目前值)
+        self._help = {}
+        self.multiproc_dir = multiproc_dir
+        self._last_flush = 0.0
+        self._pending = None   # (pid, Timer)：已排定的補寫；fork 之後 pid 不同即視為沒有
+
+    # ---------- 寫入 ----------
+    def describe(self, name, help_text, kind):
+        self._help[name] = (help_text, kind)
+
+    def inc(self, name, amount=1.0, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._gauges[key] = float(value)
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        idx = bisect_left(BUCKETS, value)
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            h[idx] += 1
+            h[-1] += value
+
+    # ---------- 讀取 ----------
+    def sizes(self):
+        """各類序列數 (label 組合越多越佔記憶體)"""
+        with self._lock:
+            return {"counters": len(self._counters), "histograms": len(self._hists), "gauges": len(self._gauges)}
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "counters": [[n, dict(k), v] for (n, k), v in self._counters.items()],
+                "histograms": [[n, dict(k), list(h)] for (n, k), h in self._hists.items()],
+                "gauges": [[n, dict(k), v] for (n, k), v in self._gauges.items()],
+            }
+
+    def flush(self, force=False):
+        """把本 worker 的快照寫到共用目錄 (原子替換)；未設定目錄時不做事"""
+        if not self.multiproc_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < FLUSH_INTERVAL:
+            # 這一批數字先不寫，但不能等下一個請求：worker 閒下來就永遠寫不出去了
+            self._schedule_flush(self._last_flush + FLUSH_INTERVAL - now)
+            return
+        self._last_flush = now
+        path = os.path.join(self.multiproc_dir, "metrics_%d.json" % os.getpid())
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def _schedule_flush(self, delay):
+        pid = os.getpid()
+        with self._lock:
+            if self._pending is not None and self._pending[0] == pid:
+                return
+            timer = threading.Timer(delay, self._deferred_flush)
+            timer.daemon = True
+            self._pending = (pid, timer)
+        timer.start()
+
+    def _deferred_flush(self):
+        with self._lock:
+            self._pending = None
+        self.flush(force=True)
+
+    def _collect(self):
+        """合併所有 worker 的快照；未設定共用目錄時只回傳本行程"""
+        if not self.multiproc_dir:
+            return [self.snapshot()]
+        self.flush(force=True)
+        snaps = []
+        try:
+            names = os.listdir(self.multiproc_dir)
+        except OSError:
+            return [self.snapshot()]
+        for fn in names:
+            if not (fn.startswith("metrics_") and fn.endswith(".json")):
+                continue
+            try:
+                with open(os.path.join(self.multiproc_dir, fn), encoding="utf-8") as f:
+                    snaps.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snaps
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)"""
+        counters, hists, gauges = {}, {}, {}
+        for snap in self._collect():
+            # gauge 是「目前值」：已結束的 worker 留下的快照不算
+            if _pid_alive(snap.get("pid")):
+                for name, labels, value in snap.get("gauges", []):
+                    key = (name, _label_key(labels))
+                    gauges[key] = gauges.get(key, 0.0) + value
+            for name, labels, value in snap.get("counters", []):
+                key = (name, _label_key(labels))
+                counters[key] = counters.get(key, 0.0) + value
+            for name, labels, h in snap.get("histograms", []):
+                key = (name, _label_key(labels))
+                acc = hists.get(key)
+                if acc is None:
+                    hists[key] = list(h)
+                else:
+                    for i, v in enumerate(h):
+                        acc[i] += v
+
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name in seen:
+                return
+            seen.add(name)
+            help_text, _ = self._help.get(name, ("", kind))
+            if help_text:
+                lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s %s" % (name, kind))
+
+        for (name, key), value in sorted(counters.items()):
+            header(name, "counter")
+            lines.append("%s%s %s" % (name, _fmt_labels(key), _fmt_num(value)))
+
+        for (name, key), value in sorted(gauges.items()):
+            header(name, "gauge")
+            lines.append("%s%s %s" % (name, _fmt_labels(key), _fmt_num(value)))
+
+        for (name, key), h in sorted(hists.items()):
+            header(name, "histogram")
+            cum = 0
+            for bound, n in zip(BUCKETS, h):
+                cum += n
+                lines.append("%s_bucket%s %d" % (name, _fmt_labels(key, ("le", repr(bound))), cum))
+            cum += h[len(BUCKETS)]
+            lines.append("%s_bucket%s %d" % (name, _fmt_labels(key, ("le", "+Inf")), cum))
+            lines.append("%s_sum%s %s" % (name, _fmt_labels(key), _fmt_num(h[-1])))
+            lines.append("%s_count%s %d" % (name, _fmt_labels(key), cum))
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry(os.environ.get("BAZI_METRICS_DIR") or os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+REGISTRY.describe("bazi_stage_seconds", "Per-stage latency inside /analyze", "histogram")
+REGISTRY.describe("bazi_request_seconds", "HTTP request latency by route", "histogram")
+REGISTRY.describe("bazi_requests_total", "HTTP requests by route and status", "counter")
+REGISTRY.describe("bazi_crawler_phase_seconds", "Crawler phase latency", "histogram")
+REGISTRY.describe("bazi_crawler_cache_total", "Crawler today-pillar cache lookups", "counter")
+REGISTRY.describe("bazi_crawler_webdriver_commands_total", "WebDriver commands sent by the crawler", "counter")
+REGISTRY.describe("bazi_log_dropped_total", "Log records dropped because the log queue was full", "counter")
+
+memprof.register_cache("metrics", REGISTRY.sizes, lambda: (REGISTRY._counters, REGISTRY._hists, REGISTRY._gauges))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+@contextmanager
+def stage(name, metric="bazi_stage_seconds", **labels):
+    """量測一段程式：記進直方圖，並加到本次請求的 Server-Timing"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        REGISTRY.observe(metric, dt, stage=name, **labels)
+        timings = _TIMINGS.get()
+        if timings is not None:
+            timings.append((name, dt))
+
+
+def server_timing_header(timings):
+    """[(name, seconds)] -> 'name;dur=1.234, ...' (毫秒)"""
+    return ", ".join("%s;dur=%.3f" % (name, dt * 1000.0) for name, dt in timings)
+
+
+def begin_request():
+    """開始收集本次請求的分段耗時；回傳 token 給 end_request()"""
+    return _TIMINGS.set([])
+
+
+def current_timings():
+    """本次請求到目前為止的分段耗時 [(stage, seconds)]；不在請求內時為空"""
+    return list(_TIMINGS.get() or ())
+
+
+def end_request(token):
+    """結束收集，回傳 [(stage, seconds)]"""
+    timings = _TIMINGS.get() or []
+    _TIMINGS.reset(token)
+    return timings
+
+
+def record_request(route, method, status, seconds):
+    REGISTRY.observe("bazi_request_seconds", seconds, route=route, method=method)
+    REGISTRY.inc("bazi_requests_total", route=route, method=method, status=status)
+    REGISTRY.flush()
+
+
+def init_app(app):
+    """掛上 Flask hooks：每個請求收集分段耗時，回應時寫 Server-Timing 並記錄總延遲"""
+    from flask import g, request
+
+    @app.before_request
+    def _metrics_begin():
+        g._metrics_t0 = time.perf_counter()
+        g._metrics_token = begin_request()
+
+    @app.after_request
+    def _metrics_end(response):
+        t0 = getattr(g, "_metrics_t0", None)
+        if t0 is None:
+            return response
+        total = time.perf_counter() - t0
+        timings = _TIMINGS.get() or []
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        if timings:
+            response.headers["Server-Timing"] = server_timing_header(timings + [("total", total)])
+        record_request(route, request.method, response.status_code, total)
+        return response
+
+    @app.teardown_request
+    def _metrics_teardown(exc):
+        token = g.pop("_metrics_token", None)
+        if token is not None:
+            _TIMINGS.reset(token)
+
+    return app
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+本機假的 NCC 排盤頁 (stand-in)，給爬蟲壓測 / 量測用，不必打到真正的網站
+
+  python ncc_standin.py --port 8765 --delay 0.05
+  BAZI_NCC_URL=http://127.0.0.1:8765/s.php python ...
+
+表單欄位 (_Name/_Sex/_YearMode/_Year/_Month/_Day/_Hour/_Min、「確定送出」按鈕)
+與結果頁結構 (div.w10 內的 span.w-blue) 都照 crawler_service 會找的樣子做，
+四柱用本地 八字.calc_bazi_8char 算。
+
+--render-delay 秒數 > 0 時，結果頁先回空殼，再由頁面內 setTimeout 把四柱畫上去
+(模擬結果由前端腳本產生的情況，用來驗證爬蟲是等 DOM 事件而不是固定 sleep)。
+/_stats 回傳 JSON：頁面請求數 (pages) 與靜態資源請求數 (static，網路層封鎖生效時應為 0)。
+"""
+import argparse
+import html
+import importlib.util
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+try:
+    import 八字 as bazi_py  # type: ignore
+except Exception:
+    _spec = importlib.util.spec_from_file_location("bazi_py", Path(__file__).with_name("八字.py"))
+    bazi_py = importlib.util.module_from_spec(_spec)
+    _spec.loader.exec_module(bazi_py)  # type: ignore
+
+
+def _options(lo, hi, selected=None):
+    return "".join(
+        '<option value="%d"%s>%d</option>' % (i, " selected" if i == selected else "", i)
+        for i in range(lo, hi + 1)
+    )
+
+
+FORM_HTML = """<!DOCTYPE html>
+<html lang="zh-TW"><head><meta charset="UTF-8"><title>NCC stand-in</title>
+<link rel="stylesheet" href="/static/site.css">
+</head><body>
+<img src="/static/logo.png" alt="">
+<form id="f" method="POST" action="/result">
+  <input type="text" id="_Name" name="_Name">
+  <label><input type="radio" name="_Sex" value="1" checked>男</label>
+  <label><input type="radio" name="_Sex" value="0">女</label>
+  <label><input type="radio" name="_YearMode" value="0">民國</label>
+  <label><input type="radio" name="_YearMode" value="1" checked>西元</label>
+  <select id="_Year" name="_Year">%(years)s</select>
+  <select id="_Month" name="_Month">%(months)s</select>
+  <select id="_Day" name="_Day">%(days)s</select>
+  <select id="_Hour" name="_Hour">%(hours)s</select>
+  <select id="_Min" name="_Min">%(mins)s</select>
+  <input type="submit" value="確定送出">
+</form>
+</body></html>
+"""
+
+RESULT_HTML = """<!DOCTYPE html>
+<html lang="zh-TW"><head><meta charset="UTF-8"><title>排盤結果</title></head><body>
+<div class="w10">姓名：%(name)s</div>
+<div class="w10">四 柱：%(spans)s</div>
+</body></html>
+"""
+
+# 結果延後畫出：四柱放在 data-p 裡，render_delay 毫秒後才產生 span.w-blue
+RESULT_LATE_HTML = """<!DOCTYPE html>
+<html lang="zh-TW"><head><meta charset="UTF-8"><title>排盤結果</title></head><body>
+<div class="w10">姓名：%(name)s</div>
+<div class="w10" id="pillars" data-p="%(pillars)s">四 柱：</div>
+<script>
+setTimeout(function () {
+  var box = document.getElementById('pillars');
+  box.getAttribute('data-p').split(',').forEach(function (p) {
+    var s = document.createElement('span');
+    s.className = 'w-blue';
+    s.textContent = p;
+    box.appendChild(s);
+  });
+}, %(ms)d);
+</script>
+</body></html>
+"""
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    server_version = "NCCStandIn/1.0"
+    delay = 0.0
+    render_delay = 0.0
+    hits = 0
+    static_hits = 0
+    _lock = threading.Lock()
+
+    def log_message(self, fmt, *args):  # 安靜模式
+        pass
+
+    def _send(self, status, body, ctype="text/html; charset=utf-8"):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _count(self, static=False):
+        with StandInHandler._lock:
+            if static:
+                StandInHandler.static_hits += 1
+            else:
+                StandInHandler.hits += 1
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith("/static/"):
+            # 讓「封鎖圖片/樣式」的效果量得出來：資源故意慢一點
+            self._count(static=True)
+            time.sleep(self.delay)
+            return self._send(200, "", "application/octet-stream")
+        if path == "/_hits":
+            return self._send(200, str(StandInHandler.hits), "text/plain")
+        if path == "/_stats":
+            return self._send(200, json.dumps(stats()), "application/json")
+        self._count()
+        time.sleep(self.delay)
+        self._send(200, FORM_HTML % {
+            "years": _options(1900, 2100, 1987),
+            "months": _options(1, 12),
+            "days": _options(1, 31),
+            "hours": _options(0, 23),
+            "mins": _options(0, 59),
+        })
+
+    def do_POST(self):
+        self._count()
+        length = int(self.headers.get("Content-Length") or 0)
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+
+        def field(key, default):
+            return (form.get(key) or [default])[0]
+
+        time.sleep(self.delay)
+        try:
+            b = bazi_py.calc_bazi_8char(int(field("_Year", "1987")), int(field("_Month", "1")),
+                                        int(field("_Day", "1")), int(field("_Hour", "12")),
+                                        int(field("_Min", "0")))
+        except Exception as e:
+            return self._send(400, "<p>%s</p>" % html.escape(str(e)))
+        name = html.escape(field("_Name", ""))
+        if self.render_delay > 0:
+            return self._send(200, RESULT_LATE_HTML % {
+                "name": name, "pillars": ",".join(b.as_tuple()), "ms": int(self.render_delay * 1000)})
+        spans = "".join('<span class="w-blue">%s</span>' % p for p in b.as_tuple())
+        self._send(200, RESULT_HTML % {"name": name, "spans": spans})
+
+
+def stats():
+    """目前的請求計數 (所有 stand-in 共用)"""
+    return {"pages": StandInHandler.hits, "static": StandInHandler.static_hits}
+
+
+def serve(host="127.0.0.1", port=8765, delay=0.0, render_delay=0.0):
+    """啟動 stand-in；回傳 (server, thread)，呼叫 server.shutdown() 結束"""
+    handler = type("Handler", (StandInHandler,), {"delay": delay, "render_delay": render_delay})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    t = threading.Thread(target=server.serve_forever, name="ncc-standin", daemon=True)
+    t.start()
+    return server, t
+
+
+def main():
+    ap = argparse.ArgumentParser(description="本機假的 NCC 排盤頁")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--delay", type=float, default=0.0, help="每個回應的人工延遲 (秒)")
+    ap.add_argument("--render-delay", type=float, default=0.0, help="結果頁延後幾秒才用 JS 畫出四柱")
+    args = ap.parse_args()
+    server, t = serve(args.host, args.port, args.delay, args.render_delay)
+    print("NCC stand-in: http://%s:%d/s.php" % (args.host, server.server_address[1]))
+    try:
+        t.join()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+線上取樣剖析 (cProfile)
+
+環境變數：
+  BAZI_PROFILE_RATE   取樣比例 0~1 (預設 0 = 關閉)
+  BAZI_PROFILE_TOKEN  帶 X-Profile-Token: <token> 的請求一定剖析
+  BAZI_PROFILE_DIR    若設定，每次取樣後把該路由的累積結果寫成 .pstats
+
+兩個都沒設定時 install() 直接回傳，不包任何中介層 → 關閉時零成本。
+cProfile / pstats 也只在啟用時才載入，不拖慢 `import app`。
+"""
+import hmac
+import os
+import random
+import threading
+
+PROFILE_HEADER = "HTTP_X_PROFILE_TOKEN"
+
+# 對不到路由規則的請求 (掃描器、404) 全部併在這一項，不依路徑各開一份統計
+UNMATCHED = "<unmatched>"
+
+# 不剖析的路徑：管理端點，以及串流回應 (剖析時會把整個本文讀進記憶體，/export/ 可能有好幾 GB)
+SKIP_PREFIXES = ("/admin/", "/export/")
+
+
+class SamplingProfiler:
+    """WSGI 中介層：依比例或 token 對請求做 cProfile，並依路由累積統計"""
+
+    def __init__(self, wsgi_app, rate=0.0, token=None, dump_dir=None, url_map=None):
+        self.wsgi_app = wsgi_app
+        self.url_map = url_map
+        self.rate = rate
+        self.token = token
+        self.dump_dir = dump_dir
+        self._stats = {}       # route ("方法 路由規則" 或 UNMATCHED) -> pstats.Stats
+        self._samples = {}     # route -> 取樣次數
+        self._stats_lock = threading.Lock()
+        # 同一時間只剖析一個請求 (cProfile 不適合多個同時啟用)
+        self._busy = threading.Lock()
+
+    def _wanted(self, environ):
+        if environ.get("PATH_INFO", "").startswith(SKIP_PREFIXES):
+            return False
+        if self.token:
+            sent = environ.get(PROFILE_HEADER)
+            if sent and hmac.compare_digest(sent, self.token):
+                return True
+        return self.rate > 0 and random.random() < self.rate
+
+    def _route(self, environ):
+        """統計的鍵：比對到的路由規則 (例如 "POST /analyze")；比對不到時 UNMATCHED"""
+        if self.url_map is None:
+            return UNMATCHED
+        from werkzeug.exceptions import HTTPException
+        try:
+            rule, _ = self.url_map.bind_to_environ(environ).match(return_rule=True)
+        except HTTPException:
+            return UNMATCHED
+        return "%s %s" % (environ.get("REQUEST_METHOD", "GET"), rule.rule)
+
+    def __call__(self, environ, start_response):
+        if not self._wanted(environ) or not self._busy.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+        import cProfile
+        route = self._route(environ)
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+            try:
+                # 把回應本文也讀完，才算到 render 的時間
+                it = self.wsgi_app(environ, start_response)
+                try:
+                    body = list(it)
+                finally:
+                    if hasattr(it, "close"):
+                        it.close()
+            finally:
+                prof.disable()
+        finally:
+            self._busy.release()
+        self._record(route, prof)
+        return body
+
+    def _record(self, route, prof):
+        import pstats
+        import re
+        with self._stats_lock:
+            st = self._stats.get(route)
+            if st is None:
+                st = self._stats[route] = pstats.Stats(prof)
+            else:
+                st.add(prof)
+            self._samples[route] = self._samples.get(route, 0) + 1
+            if self.dump_dir:
+                slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+                path = os.path.join(self.dump_dir, "%s.%d.pstats" % (slug, os.getpid()))
+                try:
+                    st.dump_stats(path)
+                except OSError:
+                    pass
+
+    # ---------- 管理介面 ----------
+    def top(self, route=None, limit=30, sort="cumulative"):
+        """回傳 pstats 文字報表；route=None 時合併所有路由"""
+        import io
+        import pstats
+        with self._stats_lock:
+            if route is not None:
+                st = self._stats.get(route)
+                routes = [route] if st is not None else []
+            else:
+                routes = sorted(self._stats)
+            if not routes:
+                return "(no samples)\n"
+            buf = io.StringIO()
+            merged = pstats.Stats(stream=buf)
+            for r in routes:
+                merged.add(self._stats[r])
+            merged.sort_stats(sort).print_stats(limit)
+        header = "".join("# %s: %d samples\n" % (r, self._samples.get(r, 0)) for r in routes)
+        return header + buf.getvalue()
+
+    def reset(self):
+        with self._stats_lock:
+            self._stats.clear()
+            self._samples.clear()
+
+
+def install(app):
+    """依環境變數決定是否掛上剖析器；回傳 SamplingProfiler 或 None"""
+    try:
+        rate = float(os.environ.get("BAZI_PROFILE_RATE") or 0)
+    except ValueError:
+        rate = 0.0
+    token = os.environ.get("BAZI_PROFILE_TOKEN") or None
+    if rate <= 0 and not token:
+        return None
+    dump_dir = os.environ.get("BAZI_PROFILE_DIR") or None
+    if dump_dir:
+        os.makedirs(dump_dir, exist_ok=True)
+    profiler = SamplingProfiler(app.wsgi_app, rate=min(rate, 1.0), token=token, dump_dir=dump_dir,
+                                url_map=app.url_map)
+    app.wsgi_app = profiler
+    return profiler
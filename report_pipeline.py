@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+"""
+年度攻略報告批次產生器 (離線批次，不經過 Web)
+
+  python report_pipeline.py users.csv --out reports/ --year 2026
+  python report_pipeline.py users.csv --out reports/ --format md --workers 8
+  python report_pipeline.py users.jsonl --out reports/          # 中斷後再跑一次會從上次進度繼續
+
+輸入：CSV (欄位 id,name,birth) 或 JSONL ({"id":..,"name":..,"birth":..})；
+birth 用 八字.parse_datetime 的格式 (含農曆，例如「農曆1990-閏05-01 13:30」)；
+沒寫時間 (或寫「時辰不詳」) 時表頭列出 12 個時辰的時柱，正文只依日支，所有時辰相同。
+
+做法：
+- 年曆 (每天的日柱 / 月柱) 在主行程算一次，傳給所有 worker
+- 報告內容只取決於使用者的日支 (12 種)：每段關係文案 (fragment) 依 (層, 日支, 對象地支) 快取，
+  整份正文依日支快取；每位使用者只需要排一次盤 + 組表頭 + 寫檔
+- ProcessPoolExecutor 分批 (chunk) 處理；主行程把每筆結果寫進 <out>/manifest.jsonl，
+  重跑時已完成且檔案仍在的使用者直接跳過 (年份 / 格式不同時會重做)
+- 報告檔先寫暫存檔再 os.replace，不會留下寫一半的檔案
+"""
+import argparse
+import csv
+import html
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import 八字 as bazi_py
+from bazi_calc_v2 import WebBaziAnalyzer
+
+MANIFEST = "manifest.jsonl"
+FORMATS = {"html": ".html", "md": ".md"}
+
+DEFAULT_CHUNK = 50
+
+# 月支 -> 月份名稱 (寅月為正月)
+MONTH_LABEL = dict(zip("寅卯辰巳午未申酉戌亥子丑", "正二三四五六七八九十冬臘"))
+
+
+# ==========================================
+# 年曆：每天中午的日柱 / 月柱
+# ==========================================
+def year_calendar(year):
+    """[(ISO 日期, 日柱, 月柱)]；整批只算一次"""
+    d = date(year, 1, 1)
+    days = []
+    while d.year == year:
+        bz = bazi_py.calc_bazi_8char(d.year, d.month, d.day, 12, 0)
+        days.append((d.isoformat(), bz.day, bz.month))
+        d += timedelta(days=1)
+    return tuple(days)
+
+
+def month_periods(calendar):
+    """依月柱切段 (節氣換月)：[(月柱, [(日期, 日柱), ...]), ...]"""
+    periods = []
+    for iso, day_pillar, month_pillar in calendar:
+        if not periods or periods[-1][0] != month_pillar:
+            periods.append((month_pillar, []))
+        periods[-1][1].append((iso, day_pillar))
+    return periods
+
+
+# ==========================================
+# 文案片段 (fragment)：不同使用者只要地支相同就共用
+# ==========================================
+_STATE = {}       # worker 設定：year / fmt / out_dir / periods
+_FRAGMENTS = {}   # (fmt, layer, 日支, 對象地支) -> str
+_BODIES = {}      # (fmt, 日支) -> 報告正文
+
+
+def _layer_rows(user_day, target, layer):
+    # layer1 只看今日日支、layer2 只看今日月支：兩個位置都帶 target，取需要的那一層
+    return WebBaziAnalyzer.get_analysis_result(user_day, target, target)["layer%d" % layer]
+
+
+def fragment(fmt, layer, user_day, target):
+    key = (fmt, layer, user_day, target)
+    text = _FRAGMENTS.get(key)
+    if text is None:
+        parts = []
+        for row in _layer_rows(user_day, target, layer):
+            if fmt == "html":
+                parts.append('<div class="rel rel-%s"><h4>%s</h4><p>%s</p></div>' % (
+                    row["relation_type"], html.escape(row["relation_name"]),
+                    html.escape(row["content"].strip()).replace("\n", "<br>")))
+            else:
+                parts.append("#### %s\n\n%s\n" % (row["relation_name"], row["content"].strip()))
+        text = _FRAGMENTS[key] = "\n".join(parts)
+    return text
+
+
+def relation_names(user_day, target):
+    key = ("names", 1, user_day, target)
+    text = _FRAGMENTS.get(key)
+    if text is None:
+        text = _FRAGMENTS[key] = "、".join(r["relation_name"] for r in _layer_rows(user_day, target, 1))
+    return text
+
+
+def _period_title(month_pillar, days):
+    return "%s月 (%s ~ %s)　月柱 %s" % (MONTH_LABEL.get(month_pillar[-1], ""), days[0][0], days[-1][0], month_pillar)
+
+
+def report_body(fmt, user_day):
+    """報告正文 (不含個人資料)：依月份列出月運、每日關係、本月重點日解讀"""
+    key = (fmt, user_day)
+    body = _BODIES.get(key)
+    if body is not None:
+        return body
+    out = []
+    for month_pillar, days in _STATE["periods"]:
+        month_zhi = month_pillar[-1]
+        # 本月重點日：有特殊關係的日支，各列一次完整解讀
+        focus = {}
+        for iso, day_pillar in days:
+            zhi = day_pillar[-1]
+            if relation_names(user_day, zhi) != "無特殊關係":
+                focus.setdefault(zhi, []).append(iso[5:])
+        if fmt == "html":
+            out.append("<section><h2>%s</h2>" % html.escape(_period_title(month_pillar, days)))
+            out.append("<h3>本月氣場</h3>" + fragment(fmt, 2, user_day, month_zhi))
+            out.append("<h3>每日關係</h3><table><tr><th>日期</th><th>日柱</th><th>關係</th></tr>")
+            out.extend("<tr><td>%s</td><td>%s</td><td>%s</td></tr>" % (iso, day_pillar, relation_names(user_day, day_pillar[-1]))
+                       for iso, day_pillar in days)
+            out.append("</table>")
+            for zhi, dates in focus.items():
+                out.append("<h3>%s日 (%s)</h3>" % (zhi, "、".join(dates)) + fragment(fmt, 1, user_day, zhi))
+            out.append("</section>")
+        else:
+            out.append("## %s\n\n### 本月氣場\n\n%s" % (_period_title(month_pillar, days), fragment(fmt, 2, user_day, month_zhi)))
+            out.append("### 每日關係\n\n| 日期 | 日柱 | 關係 |\n|---|---|---|")
+            out.extend("| %s | %s | %s |" % (iso, day_pillar, relation_names(user_day, day_pillar[-1]))
+                       for iso, day_pillar in days)
+            out.append("")
+            for zhi, dates in focus.items():
+                out.append("### %s日 (%s)\n\n%s" % (zhi, "、".join(dates), fragment(fmt, 1, user_day, zhi)))
+    body = _BODIES[key] = "\n".join(out)
+    return body
+
+
+def _variants_note(variants):
+    """時辰不詳：各時辰的時柱 (交節的時段另列節後的年 / 月柱)"""
+    hours = "、".join("%s %s" % (bazi_py.hour_label(v), v.bazi.hour) for v in variants)
+    jie = "".join("；%s 交節後為 %s" % (v.jie.strftime("%H:%M"), " ".join(v.after_jie.as_tuple()))
+                  for v in variants if v.jie)
+    return "時辰不詳，時柱可能為：%s%s。本報告只依日支，所有時辰內容相同。" % (hours, jie)
+
+
+def render_report(fmt, user, bazi, variants=None):
+    year = _STATE["year"]
+    title = "%s %d 年度攻略報告" % (user.get("name") or user["id"], year)
+    pillars = " ".join(bazi.as_tuple()) if variants is None else " ".join(bazi.as_tuple()[:3]) + " ？"
+    body = report_body(fmt, bazi.day[-1])
+    if variants is not None:
+        note = _variants_note(variants)
+        body = ("<p>%s</p>" % html.escape(note) if fmt == "html" else note + "\n\n") + body
+    if fmt == "html":
+        return (
+            '<!DOCTYPE html><html lang="zh-TW"><head><meta charset="UTF-8"><title>%s</title>'
+            "<style>body{font-family:sans-serif;max-width:860px;margin:auto;line-height:1.7}"
+            "table{border-collapse:collapse}td,th{border:1px solid #ddd;padding:2px 8px}"
+            ".rel-good h4{color:#27ae60}.rel-bad h4{color:#c0392b}.rel-warn h4{color:#e67e22}</style></head><body>"
+            "<h1>%s</h1><p>出生：%s　八字：%s　日支：%s</p>%s</body></html>\n"
+        ) % (html.escape(title), html.escape(title), html.escape(user["birth"]), pillars, bazi.day[-1], body)
+    return "# %s\n\n出生：%s　八字：%s　日支：%s\n\n%s\n" % (title, user["birth"], pillars, bazi.day[-1], body)
+
+
+# ==========================================
+# worker
+# ==========================================
+def _init_worker(year, fmt, out_dir, calendar):
+    _STATE.update(year=year, fmt=fmt, out_dir=out_dir, periods=month_periods(calendar))
+    _FRAGMENTS.clear()
+    _BODIES.clear()
+
+
+def report_path(out_dir, user_id, fmt):
+    return os.path.join(out_dir, re.sub(r"[^\w.-]", "_", user_id) + FORMATS[fmt])
+
+
+def run_chunk(users):
+    """產生一批報告，回傳 manifest 紀錄"""
+    fmt, out_dir = _STATE["fmt"], _STATE["out_dir"]
+    records = []
+    for user in users:
+        t0 = time.perf_counter()
+        rec = {"id": user["id"], "year": _STATE["year"], "format": fmt}
+        try:
+            y, mo, d, hh, mm = bazi_py.parse_birth(user["birth"])
+            if hh is None:
+                variants = bazi_py.hour_variants(y, mo, d)
+                text = render_report(fmt, user, variants[0].bazi, variants)
+            else:
+                text = render_report(fmt, user, bazi_py.calc_bazi_8char(y, mo, d, hh, mm))
+            path = report_path(out_dir, user["id"], fmt)
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, path)
+            rec.update(status="done", path=os.path.basename(path), chars=len(text))
+        except Exception as e:
+            rec.update(status="error", error="%s: %s" % (type(e).__name__, e))
+        rec["seconds"] = round(time.perf_counter() - t0, 6)
+        records.append(rec)
+    return records
+
+
+# ==========================================
+# 主行程：讀輸入、續跑、分派
+# ==========================================
+def read_users(path):
+    users = []
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for i, row in enumerate(rows, 1):
+            if not row.get("birth"):
+                raise ValueError("%s 第 %d 筆缺少 birth 欄位" % (path, i))
+            users.append({"id": str(row.get("id") or i), "name": row.get("name") or "",
+                          "birth": row["birth"]})
+    return users
+
+
+def _birth_year(user):
+    try:
+        return bazi_py.parse_datetime(user["birth"])[0]
+    except ValueError:
+        return 0  # 格式錯誤的排最前面，交給 worker 記成 error
+
+
+def load_manifest(out_dir, year, fmt):
+    """已完成 (同年份、同格式、檔案仍在) 的使用者 id"""
+    done = set()
+    try:
+        f = open(os.path.join(out_dir, MANIFEST), encoding="utf-8")
+    except FileNotFoundError:
+        return done
+    with f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # 上次中斷時寫到一半的那一行
+            if rec.get("year") != year or rec.get("format") != fmt:
+                continue
+            if rec.get("status") == "done" and os.path.exists(os.path.join(out_dir, rec["path"])):
+                done.add(rec["id"])
+            else:
+                done.discard(rec["id"])
+    return done
+
+
+def run(users, out_dir, year, fmt="html", workers=None, chunk=DEFAULT_CHUNK, log=sys.stderr):
+    """產生報告；回傳 {"done", "skipped", "errors", "seconds"}"""
+    os.makedirs(out_dir, exist_ok=True)
+    finished = load_manifest(out_dir, year, fmt)
+    pending = [u for u in users if u["id"] not in finished]
+    stats = {"done": 0, "skipped": len(users) - len(pending), "errors": 0, "seconds": 0.0}
+    if not pending:
+        return stats
+
+    t0 = time.perf_counter()
+    calendar = year_calendar(year)
+    # 依出生年排序再分批：lunar_python 只快取最近一個農曆年，同年連續排盤快很多
+    pending.sort(key=_birth_year)
+    chunks = [pending[i:i + chunk] for i in range(0, len(pending), chunk)]
+    workers = workers or os.cpu_count() or 1
+
+    with open(os.path.join(out_dir, MANIFEST), "a", encoding="utf-8") as manifest:
+        def record(records):
+            for rec in records:
+                manifest.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                stats["done" if rec["status"] == "done" else "errors"] += 1
+            manifest.flush()
+            n = stats["done"] + stats["errors"]
+            print("[report] %d/%d (%.0f/s)" % (n, len(pending), n / (time.perf_counter() - t0)), file=log)
+
+        if workers == 1:
+            _init_worker(year, fmt, out_dir, calendar)
+            for c in chunks:
+                record(run_chunk(c))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(year, fmt, out_dir, calendar)) as pool:
+                for fut in as_completed([pool.submit(run_chunk, c) for c in chunks]):
+                    record(fut.result())
+
+    stats["seconds"] = round(time.perf_counter() - t0, 3)
+    return stats
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="批次產生年度攻略報告")
+    ap.add_argument("input", help="CSV (id,name,birth) 或 JSONL")
+    ap.add_argument("--out", required=True, help="輸出目錄 (含 manifest.jsonl)")
+    ap.add_argument("--year", type=int, default=date.today().year)
+    ap.add_argument("--format", choices=sorted(FORMATS), default="html")
+    ap.add_argument("--workers", type=int, default=None, help="行程數 (預設 CPU 數；1 = 不開行程池)")
+    ap.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help="每批幾位使用者")
+    args = ap.parse_args(argv)
+
+    users = read_users(args.input)
+    stats = run(users, args.out, args.year, args.format, args.workers, args.chunk)
+    print(json.dumps(stats, ensure_ascii=False))
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
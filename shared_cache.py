@@ -0,0 +1,494 @@
+# -*- coding: utf-8 -*-
+"""
+跨實例共用快取：行程內 L1 (LRU) -> 共用層 (Redis 協定，或測試用的記憶體版)
+
+多個 Render 實例各自重算今日盤、各自爬今日四柱、各自渲染同一張結果頁；
+共用層讓一個實例算過，其他實例直接拿。
+
+  CACHE.get_or_compute("page", (k1, k2, ...), compute, ttl=600, grace=60)
+  CACHE.get("scrape", "today", "2025-12-18") / CACHE.set("scrape", ("today", "2025-12-18"), value, ttl)
+
+鍵：bazi:<BAZI_CACHE_VERSION>:<namespace>:v<NAMESPACES[namespace]>:<parts>
+  - 值的格式改了就把 NAMESPACES 裡的版本加一；整體作廢就改 BAZI_CACHE_VERSION
+  - parts 太長時取 sha1，鍵長度固定
+值：JSON {"s": 軟到期, "h": 硬到期, "v": 值} (epoch 秒)；共用層的 TTL = ttl + grace
+
+防踩踏 (stampede)：
+  - 同一行程：同一個鍵同時只有一個執行緒在算 (分段鎖)
+  - 跨實例：沒命中時先搶 <鍵>:lock (SET NX PX)；搶不到的輪詢等別人寫入，最多等 BAZI_CACHE_WAIT_MS，逾時才自己算
+  - 過了軟到期但還在 grace 內：只有搶到鎖的那個請求重算，其他請求先回舊值
+共用層連不上 / 逾時：記 error、BAZI_CACHE_RETRY_S 秒內不再嘗試，只用 L1 + 自己算 (不會讓請求失敗)
+
+L1 上限：today / scrape 的值只有幾十個位元組，共用 BAZI_CACHE_L1_SIZE 筆 (預設 256)；
+page 一筆是整張結果頁 (約 55KB)，另外放一個只有 BAZI_CACHE_L1_PAGES 筆的 LRU (預設 32，約 2MB / worker)，
+其餘的頁面只在共用層。BAZI_CACHE_L1_SIZE=0 時兩個 L1 都關掉。
+
+環境變數：
+  BAZI_CACHE_URL        redis://[:password@]host:port/db，或 memory:// (行程內假後端)；未設定時只有 L1
+  BAZI_CACHE_VERSION / BAZI_CACHE_L1_SIZE / BAZI_CACHE_L1_PAGES / BAZI_CACHE_POOL / BAZI_CACHE_TIMEOUT_MS
+  BAZI_CACHE_LOCK_MS / BAZI_CACHE_WAIT_MS / BAZI_CACHE_RETRY_S
+本機測試：python cache_standin.py --port 6390，再設 BAZI_CACHE_URL=redis://127.0.0.1:6390/0
+"""
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import unquote, urlparse
+
+import jsonlog
+import memprof
+from metrics import REGISTRY
+
+log = jsonlog.get_logger("cache")
+
+REGISTRY.describe("bazi_cache_total", "Shared cache lookups by namespace and result", "counter")
+
+# 各命名空間的值格式版本
+NAMESPACES = {
+    "today": 1,    # 今日四柱 [年, 月, 日, 時]，鍵含時區與有效期限
+    "scrape": 1,   # 爬蟲抓到的四柱 (今日 / 命主)
+    "page": 1,     # 渲染好的 /analyze 結果頁
+}
+# 值很大、在 L1 裡另外限制筆數的命名空間
+L1_PAGES = "page"
+
+
+def _env_num(name, default, cast=int):
+    v = os.environ.get(name)
+    return cast(v) if v else default
+
+
+class CacheError(Exception):
+    """共用層協定錯誤 (伺服器回 -ERR、連線池用盡、連線中斷)"""
+
+
+# ==========================================
+# RESP (Redis 協定)
+# ==========================================
+def encode(*args):
+    """指令 -> RESP 陣列 (bulk string)"""
+    out = [b"*%d\r\n" % len(args)]
+    for a in args:
+        if not isinstance(a, bytes):
+            a = str(a).encode("utf-8")
+        out.append(b"$%d\r\n%s\r\n" % (len(a), a))
+    return b"".join(out)
+
+
+def read_reply(rfile):
+    """讀一個 RESP 回覆；-ERR 以 CacheError 丟出 (連線本身仍可用)"""
+    line = rfile.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("cache connection closed")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode("utf-8")
+    if kind == b"-":
+        raise CacheError(rest.decode("utf-8", "replace"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        n = int(rest)
+        if n < 0:
+            return None
+        data = rfile.read(n + 2)
+        if len(data) != n + 2:
+            raise ConnectionError("cache connection closed")
+        return data[:-2]
+    if kind == b"*":
+        n = int(rest)
+        return None if n < 0 else [read_reply(rfile) for _ in range(n)]
+    raise CacheError("bad reply: %r" % line[:32])
+
+
+class _Conn:
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile("rb")
+
+    def call(self, *args):
+        self.sock.sendall(encode(*args))
+        return read_reply(self.rfile)
+
+    def close(self):
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class RespClient:
+    """極簡 Redis 客戶端：GET / SET (PX, NX) / DEL，連線池 (LIFO) 最多 pool_size 條"""
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, password=None, pool_size=8, timeout=0.2):
+        self.host, self.port, self.db, self.password = host, port, db, password
+        self.timeout = timeout
+        self._idle = []
+        self._idle_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, pool_size))
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        u = urlparse(url)
+        db = (u.path or "/").lstrip("/")
+        return cls(u.hostname or "127.0.0.1", u.port or 6379, int(db) if db else 0,
+                   unquote(u.password) if u.password else None, **kwargs)
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = _Conn(sock)
+        try:
+            if self.password:
+                conn.call("AUTH", self.password)
+            if self.db:
+                conn.call("SELECT", self.db)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def execute(self, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise CacheError("cache connection pool exhausted")
+        try:
+            with self._idle_lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is not None:
+                try:
+                    return self._call(conn, args)
+                except (OSError, ValueError):
+                    pass  # 閒置連線可能已被伺服器關掉：換一條新的重試一次 (GET/SET/DEL 可重送)
+            return self._call(self._connect(), args)
+        finally:
+            self._slots.release()
+
+    def _call(self, conn, args):
+        try:
+            reply = conn.call(*args)
+        except CacheError:
+            self._put_back(conn)  # 伺服器回錯誤：連線仍同步，可以繼續用
+            raise
+        except BaseException:
+            conn.close()
+            raise
+        self._put_back(conn)
+        return reply
+
+    def _put_back(self, conn):
+        with self._idle_lock:
+            self._idle.append(conn)
+
+    def get(self, key):
+        return self.execute("GET", key)
+
+    def set(self, key, value, ttl_ms, nx=False):
+        args = ["SET", key, value, "PX", max(1, int(ttl_ms))]
+        if nx:
+            args.append("NX")
+        return self.execute(*args) == "OK"
+
+    def delete(self, key):
+        return self.execute("DEL", key)
+
+    def ping(self):
+        return self.execute("PING") == "PONG"
+
+    def close(self):
+        with self._idle_lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+class MemoryBackend:
+    """與 RespClient 同介面的行程內假後端 (測試 / cache_standin.py 用)"""
+
+    def __init__(self):
+        self._data = {}   # key -> (value bytes, 到期 monotonic)
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+            return None if entry is None else entry[0]
+
+    def set(self, key, value, ttl_ms, nx=False):
+        if not isinstance(value, bytes):
+            value = str(value).encode("utf-8")
+        with self._lock:
+            now = time.monotonic()
+            if nx and self._live(key, now) is not None:
+                return False
+            self._data[key] = (value, now + max(1, int(ttl_ms)) / 1000.0)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            return 1 if self._data.pop(key, None) is not None else 0
+
+    def ping(self):
+        return True
+
+    def size(self):
+        with self._lock:
+            now = time.monotonic()
+            return sum(1 for k in list(self._data) if self._live(k, now) is not None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def close(self):
+        pass
+
+
+def backend_from_url(url, pool_size=8, timeout=0.2):
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemoryBackend()
+    if url.startswith("redis://"):
+        return RespClient.from_url(url, pool_size=pool_size, timeout=timeout)
+    raise ValueError("BAZI_CACHE_URL 只支援 redis:// 或 memory://：%s" % url)
+
+
+# ==========================================
+# L1 + 共用層
+# ==========================================
+class SharedCache:
+    STRIPES = 64
+
+    def __init__(self, backend=None, version="1", l1_size=256, l1_pages=32, lock_ms=3000, wait_ms=1000,
+                 retry_s=5.0):
+        self.backend = backend
+        self.version = version
+        self.l1_size = max(0, l1_size)
+        self.l1_pages = max(0, min(l1_pages, self.l1_size))
+        self.lock_ms = lock_ms
+        self.wait = wait_ms / 1000.0
+        self.retry_s = retry_s
+        self._l1 = OrderedDict()   # key -> (軟到期, 硬到期, 值)
+        self._l1_pages = OrderedDict()   # 同上，只放 L1_PAGES 命名空間
+        self._l1_lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(self.STRIPES)]
+        self._down_until = 0.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(backend_from_url(os.environ.get("BAZI_CACHE_URL"),
+                                    pool_size=_env_num("BAZI_CACHE_POOL", 8),
+                                    timeout=_env_num("BAZI_CACHE_TIMEOUT_MS", 200, float) / 1000.0),
+                   version=os.environ.get("BAZI_CACHE_VERSION") or "1",
+                   l1_size=_env_num("BAZI_CACHE_L1_SIZE", 256),
+                   l1_pages=_env_num("BAZI_CACHE_L1_PAGES", 32),
+                   lock_ms=_env_num("BAZI_CACHE_LOCK_MS", 3000),
+                   wait_ms=_env_num("BAZI_CACHE_WAIT_MS", 1000, float),
+                   retry_s=_env_num("BAZI_CACHE_RETRY_S", 5.0, float))
+
+    def key(self, ns, *parts):
+        tail = "|".join(str(p) for p in parts)
+        if len(tail) > 64:
+            tail = hashlib.sha1(tail.encode("utf-8")).hexdigest()
+        return "bazi:%s:%s:v%d:%s" % (self.version, ns, NAMESPACES[ns], tail)
+
+    # ---------- L1 ----------
+    def _l1_of(self, ns):
+        """(該命名空間的 LRU, 筆數上限)"""
+        if ns == L1_PAGES:
+            return self._l1_pages, self.l1_pages
+        return self._l1, self.l1_size
+
+    def _l1_get(self, ns, key, now):
+        l1, _ = self._l1_of(ns)
+        with self._l1_lock:
+            entry = l1.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del l1[key]
+                return None
+            l1.move_to_end(key)
+            return entry
+
+    def _l1_put(self, ns, key, entry):
+        l1, limit = self._l1_of(ns)
+        if not limit:
+            return
+        with self._l1_lock:
+            l1[key] = entry
+            l1.move_to_end(key)
+            while len(l1) > limit:
+                l1.popitem(last=False)
+
+    # ---------- 共用層 (失敗時暫停使用，不丟例外) ----------
+    def _remote(self, ns, op, *args):
+        if self.backend is None or time.monotonic() < self._down_until:
+            return None
+        try:
+            return getattr(self.backend, op)(*args)
+        except (OSError, CacheError, ValueError) as e:
+            self._down_until = time.monotonic() + self.retry_s
+            REGISTRY.inc("bazi_cache_total", ns=ns, result="error")
+            log.warning("shared cache %s failed, bypassing for %.0fs: %s", op, self.retry_s, e)
+            return None
+
+    def _remote_get(self, ns, key, now):
+        raw = self._remote(ns, "get", key)
+        if raw is None:
+            return None
+        try:
+            doc = json.loads(raw)
+            entry = (doc["s"], doc["h"], doc["v"])
+        except (ValueError, KeyError, TypeError):
+            return None
+        if entry[1] <= now:
+            return None
+        self._l1_put(ns, key, entry)
+        return entry
+
+    # ---------- 公開介面 ----------
+    def get(self, ns, *parts):
+        """有效 (未過軟到期) 的值，沒有就回傳 None"""
+        key = self.key(ns, *parts)
+        now = time.time()
+        entry = self._l1_get(ns, key, now)
+        if entry is not None and now < entry[0]:
+            REGISTRY.inc("bazi_cache_total", ns=ns, result="l1_hit")
+            return entry[2]
+        entry = self._remote_get(ns, key, now)
+        if entry is not None and now < entry[0]:
+            REGISTRY.inc("bazi_cache_total", ns=ns, result="hit")
+            return entry[2]
+        REGISTRY.inc("bazi_cache_total", ns=ns, result="miss")
+        return None
+
+    def set(self, ns, parts, value, ttl, grace=0.0):
+        """寫入 L1 與共用層；value 必須可 JSON 化"""
+        self._store(ns, self.key(ns, *parts), value, ttl, grace)
+
+    def _store(self, ns, key, value, ttl, grace):
+        if ttl <= 0:
+            return
+        now = time.time()
+        entry = (now + ttl, now + ttl + grace, value)
+        self._l1_put(ns, key, entry)
+        doc = json.dumps({"s": entry[0], "h": entry[1], "v": value}, ensure_ascii=False, separators=(",", ":"))
+        self._remote(ns, "set", key, doc.encode("utf-8"), (ttl + grace) * 1000.0)
+
+    def delete(self, ns, *parts):
+        key = self.key(ns, *parts)
+        with self._l1_lock:
+            self._l1_of(ns)[0].pop(key, None)
+        self._remote(ns, "delete", key)
+
+    def get_or_compute(self, ns, parts, compute, ttl, grace=0.0):
+        """有就拿、沒有就算 (防踩踏)；compute() 丟出的例外照樣往外丟，不會被快取"""
+        key = self.key(ns, *parts)
+        now = time.time()
+        entry = self._l1_get(ns, key, now)
+        if entry is not None and now < entry[0]:
+            REGISTRY.inc("bazi_cache_total", ns=ns, result="l1_hit")
+            return entry[2]
+        if entry is None:
+            entry = self._remote_get(ns, key, now)
+            if entry is not None and now < entry[0]:
+                REGISTRY.inc("bazi_cache_total", ns=ns, result="hit")
+                return entry[2]
+
+        stripe = self._stripes[hash(key) % self.STRIPES]
+        if entry is not None:
+            # 過了軟到期、還在寬限期：搶得到鎖的重算，其他人先回舊值
+            if not stripe.acquire(blocking=False):
+                REGISTRY.inc("bazi_cache_total", ns=ns, result="stale")
+                return entry[2]
+            try:
+                token = self._lock(ns, key)
+                if token is None:
+                    REGISTRY.inc("bazi_cache_total", ns=ns, result="stale")
+                    return entry[2]
+                return self._compute(ns, key, compute, ttl, grace, token)
+            finally:
+                stripe.release()
+
+        with stripe:
+            # 等鎖期間可能已經有同行程的執行緒算好了
+            now = time.time()
+            entry = self._l1_get(ns, key, now)
+            if entry is not None and now < entry[0]:
+                REGISTRY.inc("bazi_cache_total", ns=ns, result="l1_hit")
+                return entry[2]
+            token = self._lock(ns, key)
+            if token is None:
+                value = self._wait_for(ns, key)
+                if value is not None:
+                    return value[0]
+                token = ""
+            return self._compute(ns, key, compute, ttl, grace, token)
+
+    def _lock(self, ns, key):
+        """搶跨實例的鎖：回傳 token (共用層不可用時回傳 "")；別人持有時回傳 None"""
+        if self.backend is None:
+            return ""
+        token = uuid.uuid4().hex
+        got = self._remote(ns, "set", key + ":lock", token, self.lock_ms, True)
+        if got is None and time.monotonic() < self._down_until:
+            return ""
+        return token if got else None
+
+    def _wait_for(self, ns, key):
+        """輪詢共用層直到別的實例寫入；回傳 (值,) 或逾時 None"""
+        deadline = time.monotonic() + self.wait
+        pause = 0.005
+        while time.monotonic() < deadline:
+            time.sleep(pause)
+            pause = min(pause * 2, 0.05)
+            now = time.time()
+            entry = self._remote_get(ns, key, now)
+            if entry is not None and now < entry[0]:
+                REGISTRY.inc("bazi_cache_total", ns=ns, result="waited")
+                return (entry[2],)
+        REGISTRY.inc("bazi_cache_total", ns=ns, result="wait_timeout")
+        return None
+
+    def _compute(self, ns, key, compute, ttl, grace, token):
+        REGISTRY.inc("bazi_cache_total", ns=ns, result="miss")
+        try:
+            value = compute()
+            self._store(ns, key, value, ttl, grace)
+            return value
+        finally:
+            if token:
+                # 只刪自己的鎖 (GET 與 DEL 之間的空檔最多讓下一個人提早重算，不影響正確性)
+                if self._remote(ns, "get", key + ":lock") == token.encode("ascii"):
+                    self._remote(ns, "delete", key + ":lock")
+
+    def clear_local(self):
+        with self._l1_lock:
+            self._l1.clear()
+            self._l1_pages.clear()
+
+    def info(self):
+        with self._l1_lock:
+            l1, pages = len(self._l1), len(self._l1_pages)
+        return {"backend": type(self.backend).__name__ if self.backend is not None else None,
+                "version": self.version, "l1_entries": l1, "l1_size": self.l1_size,
+                "l1_page_entries": pages, "l1_pages": self.l1_pages,
+                "bypassed": time.monotonic() < self._down_until}
+
+
+CACHE = SharedCache.from_env()
+memprof.register_cache("shared_cache_l1", lambda: CACHE.info(), lambda: CACHE._l1)
+memprof.register_cache("shared_cache_l1_pages", lambda: CACHE.info(), lambda: CACHE._l1_pages)
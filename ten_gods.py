@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+十神 + 五行強弱計分 (只查表，不依賴 lunar_python)
+
+預先算好的表：
+  TEN_GOD_TABLE[日干][他干]          10×10   十神名稱索引
+  HIDDEN_STEMS[地支]                 12×N    藏干與權重 (本氣 / 中氣 / 餘氣)
+  BRANCH_ELEMENTS[地支]              12×5    地支換算成五行分數
+  BRANCH_GODS[日干][地支]            10×12   地支藏干換算成十神分數 (10 維)
+
+單筆 (Web)：score(bazi) -> dict
+批次 (分析)：四柱打包成 60 甲子索引 (0~59)，每張命盤 4 個 byte：
+  packed = pack_many([bazi, ...])                  # 或自己組 array("B")
+  elements = score_elements_batch(packed)          # array("d")，每張命盤 5 個數 (木火土金水)
+  support = strength_batch(packed)                 # array("d")，日主得助比例 (>= 0.5 視為身強)
+批次版把 (年柱, 月柱)、(日柱, 時柱) 兩兩合併成 3600 筆的五行向量表，每張命盤只做兩次查表相加。
+"""
+from array import array
+
+STEMS = "甲乙丙丁戊己庚辛壬癸"
+BRANCHES = "子丑寅卯辰巳午未申酉戌亥"
+ELEMENTS = "木火土金水"
+
+STEM_INDEX = {s: i for i, s in enumerate(STEMS)}
+BRANCH_INDEX = {b: i for i, b in enumerate(BRANCHES)}
+
+# 十神依「與日干的五行關係」排序；同陰陽在前、異陰陽在後
+TEN_GODS = ("比肩", "劫財", "食神", "傷官", "偏財", "正財", "七殺", "正官", "偏印", "正印")
+
+# 月令最旺：月支的分數加倍
+MONTH_BRANCH_WEIGHT = 2.0
+STEM_WEIGHT = 1.0
+
+# 藏干 (本氣, 中氣, 餘氣) 與權重
+HIDDEN_STEMS = {
+    "子": (("癸", 1.0),),
+    "丑": (("己", 0.6), ("癸", 0.3), ("辛", 0.1)),
+    "寅": (("甲", 0.6), ("丙", 0.3), ("戊", 0.1)),
+    "卯": (("乙", 1.0),),
+    "辰": (("戊", 0.6), ("乙", 0.3), ("癸", 0.1)),
+    "巳": (("丙", 0.6), ("庚", 0.3), ("戊", 0.1)),
+    "午": (("丁", 0.7), ("己", 0.3)),
+    "未": (("己", 0.6), ("丁", 0.3), ("乙", 0.1)),
+    "申": (("庚", 0.6), ("壬", 0.3), ("戊", 0.1)),
+    "酉": (("辛", 1.0),),
+    "戌": (("戊", 0.6), ("辛", 0.3), ("丁", 0.1)),
+    "亥": (("壬", 0.7), ("甲", 0.3)),
+}
+
+
+def stem_element(stem_idx):
+    return stem_idx // 2
+
+
+def _ten_god(day_idx, other_idx):
+    """日干 vs 他干 -> 十神索引 (0~9)"""
+    # 五行依相生順序 木火土金水 排列，相差幾步就是什麼關係：
+    # 0 同我 (比劫)、1 我生 (食傷)、2 我剋 (財)、3 剋我 (官殺)、4 生我 (印)
+    rel = (stem_element(other_idx) - stem_element(day_idx)) % 5
+    same_polarity = day_idx % 2 == other_idx % 2
+    return rel * 2 + (0 if same_polarity else 1)
+
+
+def _build():
+    ten_god = tuple(tuple(_ten_god(d, o) for o in range(10)) for d in range(10))
+    branch_elements = {}
+    for b, hidden in HIDDEN_STEMS.items():
+        vec = [0.0] * 5
+        for s, w in hidden:
+            vec[stem_element(STEMS.index(s))] += w
+        branch_elements[b] = tuple(vec)
+    branch_gods = []
+    for d in range(10):
+        row = {}
+        for b, hidden in HIDDEN_STEMS.items():
+            vec = [0.0] * 10
+            for s, w in hidden:
+                vec[ten_god[d][STEMS.index(s)]] += w
+            row[b] = tuple(vec)
+        branch_gods.append(row)
+    return ten_god, branch_elements, tuple(branch_gods)
+
+
+TEN_GOD_TABLE, BRANCH_ELEMENTS, BRANCH_GODS = _build()
+
+
+# ==========================================
+# 單筆
+# ==========================================
+def _split(bazi):
+    pillars = bazi.as_tuple() if hasattr(bazi, "as_tuple") else tuple(bazi)
+    if len(pillars) != 4 or any(len(p) != 2 or p[0] not in STEM_INDEX or p[1] not in BRANCH_INDEX for p in pillars):
+        raise ValueError("四柱格式錯誤：需為四個「天干地支」兩字組合")
+    return pillars
+
+
+def score(bazi):
+    """BaZi (或四柱 tuple) -> 十神 / 藏干 / 五行分數"""
+    pillars = _split(bazi)
+    day_idx = STEM_INDEX[pillars[2][0]]
+    gods = TEN_GOD_TABLE[day_idx]
+    elements = [0.0] * 5
+    god_totals = [0.0] * 10
+    stems, branches = [], []
+    for pos, (s, b) in enumerate(pillars):
+        si = STEM_INDEX[s]
+        if pos != 2:  # 日干本身是日主，不算十神也不重複計分
+            elements[stem_element(si)] += STEM_WEIGHT
+            god_totals[gods[si]] += STEM_WEIGHT
+        stems.append({"stem": s, "ten_god": "日主" if pos == 2 else TEN_GODS[gods[si]]})
+        w = MONTH_BRANCH_WEIGHT if pos == 1 else 1.0
+        for e, v in enumerate(BRANCH_ELEMENTS[b]):
+            elements[e] += v * w
+        for g, v in enumerate(BRANCH_GODS[day_idx][b]):
+            god_totals[g] += v * w
+        branches.append({"branch": b, "hidden": [
+            {"stem": hs, "weight": hw, "ten_god": TEN_GODS[gods[STEM_INDEX[hs]]]} for hs, hw in HIDDEN_STEMS[b]
+        ]})
+    # 日主也算自己一份
+    me = stem_element(day_idx)
+    elements[me] += STEM_WEIGHT
+    total = sum(elements)
+    support = (elements[me] + elements[(me - 1) % 5]) / total
+    return {
+        "day_master": pillars[2][0],
+        "day_master_element": ELEMENTS[me],
+        "stems": stems,
+        "branches": branches,
+        "elements": {ELEMENTS[i]: round(v, 2) for i, v in enumerate(elements)},
+        "ten_gods": {TEN_GODS[i]: round(v, 2) for i, v in enumerate(god_totals) if v},
+        "support": round(support, 3),
+        "strength": "身強" if support >= 0.5 else "身弱",
+    }
+
+
+# ==========================================
+# 批次
+# ==========================================
+def pillar_index(pillar):
+    """「甲子」-> 0 … 「癸亥」-> 59"""
+    s, b = STEM_INDEX[pillar[0]], BRANCH_INDEX[pillar[1]]
+    if s % 2 != b % 2:
+        raise ValueError("不存在的干支組合：%s" % pillar)
+    return (6 * s - 5 * b) % 60
+
+
+def pack_many(charts):
+    """[BaZi 或四柱 tuple, ...] -> array("B")，每張命盤 4 個 byte"""
+    out = array("B")
+    for c in charts:
+        out.extend(pillar_index(p) for p in _split(c))
+    return out
+
+
+def _pillar_vectors(weight_branch):
+    """60 甲子 -> 五行向量 (天干 STEM_WEIGHT + 地支藏干 × weight_branch)"""
+    vecs = []
+    for i in range(60):
+        vec = list(BRANCH_ELEMENTS[BRANCHES[i % 12]])
+        vec = [v * weight_branch for v in vec]
+        vec[stem_element(i % 10)] += STEM_WEIGHT
+        vecs.append(vec)
+    return vecs
+
+
+def _pair_tables():
+    plain, month = _pillar_vectors(1.0), _pillar_vectors(MONTH_BRANCH_WEIGHT)
+    # (年柱, 月柱)：兩柱天干都算
+    ym = tuple(tuple(a + b for a, b in zip(plain[y], month[m])) for y in range(60) for m in range(60))
+    # (日柱, 時柱)：日干是日主，一樣算自己一份
+    dh = tuple(tuple(a + b for a, b in zip(plain[d], plain[h])) for d in range(60) for h in range(60))
+    return ym, dh
+
+
+_PAIRS = None
+
+
+def _pairs():
+    global _PAIRS
+    if _PAIRS is None:
+        _PAIRS = _pair_tables()
+    return _PAIRS
+
+
+def score_elements_batch(packed):
+    """array("B") (每張 4 個甲子索引) -> array("d") (每張 5 個五行分數)"""
+    if len(packed) % 4:
+        raise ValueError("packed 長度必須是 4 的倍數")
+    ym, dh = _pairs()
+    out = array("d", bytes(8 * 5 * (len(packed) // 4)))
+    j = 0
+    for i in range(0, len(packed), 4):
+        a = ym[packed[i] * 60 + packed[i + 1]]
+        b = dh[packed[i + 2] * 60 + packed[i + 3]]
+        out[j] = a[0] + b[0]
+        out[j + 1] = a[1] + b[1]
+        out[j + 2] = a[2] + b[2]
+        out[j + 3] = a[3] + b[3]
+        out[j + 4] = a[4] + b[4]
+        j += 5
+    return out
+
+
+def strength_batch(packed, elements=None):
+    """每張命盤的日主得助比例 (同我 + 生我) / 總分；可傳入 score_elements_batch 的結果省一次計算"""
+    if elements is None:
+        elements = score_elements_batch(packed)
+    out = array("d", bytes(8 * (len(packed) // 4)))
+    for n in range(len(out)):
+        me = (packed[4 * n + 2] % 10) // 2
+        e = elements[5 * n:5 * n + 5]
+        out[n] = (e[me] + e[(me - 1) % 5]) / (e[0] + e[1] + e[2] + e[3] + e[4])
+    return out
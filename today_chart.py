@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+「今日盤」：依時區 (或經度 → 真太陽時) 算出當下四柱，並依時區快取
+
+- 時區物件以 lru_cache 快取 (含查無此時區的結果)，不會每個請求都重建 ZoneInfo
+- 每個時區一筆快取，有效到「下一個時辰 / 子夜換日 / 節」邊界為止 (以該時區的當地時間判斷)
+- 節的時刻表用 八字.jie_times (依年份快取)，查下一個節只要 bisect
+- 有效期間以當地牆上時間 [valid_from, valid_until) 表示：夏令時間跳動時會自動重算
+
+一般請求的成本：datetime.now(zone) + 一次 dict 查詢 + 兩次比較。
+本行程沒有時，再查跨實例共用快取 (shared_cache，鍵含時區與下一個邊界，到邊界自然失效)。
+"""
+import bisect
+import math
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+import memprof
+import shared_cache
+import 八字 as bazi_py
+
+try:
+    from zoneinfo import ZoneInfo  # Py3.9+
+except Exception:
+    ZoneInfo = None  # type: ignore
+
+DEFAULT_TZ = os.environ.get("BAZI_DEFAULT_TZ") or "Asia/Taipei"
+
+# 經度量化成 0.25° (= 真太陽時 1 分鐘)，限制快取鍵的數量
+LON_STEP = 0.25
+
+# 快取筆數上限 (時區 × 經度)；超過就整個清掉重建
+MAX_ENTRIES = 4096
+
+_CACHE = {}   # key -> (valid_from, valid_until, bazi)；時間皆為當地牆上時間 (naive)
+_LOCK = threading.Lock()
+
+
+# ==========================================
+# 時區
+# ==========================================
+@lru_cache(maxsize=256)
+def get_zone(name):
+    """時區名稱 -> tzinfo；無效名稱回傳 None (也會被快取)"""
+    if not name:
+        return None
+    if ZoneInfo is not None:
+        try:
+            return ZoneInfo(name)
+        except Exception:
+            pass
+    # 極簡容器可能沒有 tzdata：至少預設時區要能用
+    if name == "Asia/Taipei":
+        return timezone(timedelta(hours=8), "Asia/Taipei")
+    return None
+
+
+def resolve_zone(name):
+    """回傳 (實際使用的時區名稱, tzinfo)；無效或空白時退回預設時區"""
+    zone = get_zone(name) if name else None
+    if zone is None:
+        name, zone = DEFAULT_TZ, get_zone(DEFAULT_TZ)
+        if zone is None:
+            name, zone = "Asia/Taipei", get_zone("Asia/Taipei")
+    return name, zone
+
+
+# ==========================================
+# 真太陽時
+# ==========================================
+def equation_of_time(dt):
+    """均時差 (分鐘)，近似公式，誤差約 ±1 分鐘"""
+    b = 2 * math.pi * (dt.timetuple().tm_yday - 81) / 364.0
+    return 9.87 * math.sin(2 * b) - 7.53 * math.cos(b) - 1.5 * math.sin(b)
+
+
+def true_solar_time(utc_now, longitude):
+    """UTC 時刻 + 經度 -> 當地真太陽時 (naive datetime)"""
+    mean = utc_now.replace(tzinfo=None) + timedelta(minutes=4.0 * longitude)
+    return mean + timedelta(minutes=equation_of_time(mean))
+
+
+# ==========================================
+# 邊界：時辰 / 換日 / 節
+# ==========================================
+def jie_instants(year):
+    """該西元年內所有「節」的時刻 (排序好的 naive datetime)
+
+    排盤只用到分鐘，所以節的秒數無條件進位到下一分鐘：那一分鐘起月柱才會換。
+    """
+    return tuple(t.replace(second=0) + timedelta(minutes=1) if t.second else t
+                 for t in bazi_py.jie_times(year))
+
+
+def next_jie(wall):
+    table = jie_instants(wall.year)
+    i = bisect.bisect_right(table, wall)
+    if i < len(table):
+        return table[i]
+    return jie_instants(wall.year + 1)[0]
+
+
+def next_boundary(wall):
+    """下一個會讓四柱改變的當地時刻：奇數整點 (換時辰)、子夜 (換日)、或節 (換月/換年)"""
+    base = wall.replace(minute=0, second=0, microsecond=0)
+    hour_step = 1 if wall.hour % 2 == 0 else 2
+    nxt = base + timedelta(hours=hour_step)
+    midnight = base.replace(hour=0) + timedelta(days=1)
+    return min(nxt, midnight, next_jie(wall))
+
+
+# ==========================================
+# 今日盤
+# ==========================================
+def _local_now(tz=None, longitude=None):
+    """回傳 (快取鍵, 當地牆上時間 naive, 顯示用 datetime, 時區標籤)"""
+    if longitude is not None:
+        lon = round(float(longitude) / LON_STEP) * LON_STEP
+        if not -180.0 <= lon <= 180.0:
+            raise ValueError("經度需介於 -180 ~ 180")
+        wall = true_solar_time(datetime.now(timezone.utc), lon)
+        label = "真太陽時 %.2f°" % lon
+        return ("LMT", lon), wall, wall, label
+    name, zone = resolve_zone(tz)
+    now = datetime.now(zone)
+    return (name,), now.replace(tzinfo=None), now, name
+
+
+def today_chart(calc, tz=None, longitude=None, build=None):
+    """回傳 (now, zone_label, BaZi)；同一時區在同一時辰內只算一次
+
+    calc 是排盤函數 (app 傳入 八字.calc_bazi_8char，這裡不必再處理中文檔名載入)
+    build 是「四柱 -> BaZi」(例如 八字.BaZi)；有給才會經過跨實例共用快取
+    """
+    key, wall, now, label = _local_now(tz, longitude)
+    # 排盤只精確到分鐘
+    wall = wall.replace(second=0, microsecond=0)
+    entry = _CACHE.get(key)
+    if entry is not None and entry[0] <= wall < entry[1]:
+        return now, label, entry[2]
+
+    until = next_boundary(wall)
+    if build is None:
+        bazi = calc(wall.year, wall.month, wall.day, wall.hour, wall.minute)
+    else:
+        # 同一時區、同一個邊界之前的四柱都一樣：邊界時刻放進鍵裡，TTL 到邊界為止
+        pillars = shared_cache.CACHE.get_or_compute(
+            "today", key + (until.isoformat(timespec="minutes"),),
+            lambda: list(calc(wall.year, wall.month, wall.day, wall.hour, wall.minute).as_tuple()),
+            ttl=(until - wall).total_seconds())
+        bazi = build(*pillars)
+    with _LOCK:
+        if len(_CACHE) >= MAX_ENTRIES:
+            _CACHE.clear()
+        _CACHE[key] = (wall, until, bazi)
+    return now, label, bazi
+
+
+def cache_info():
+    with _LOCK:
+        return {"entries": len(_CACHE), "zones": get_zone.cache_info()._asdict(),
+                "jie_years": bazi_py.jie_times.cache_info()._asdict()}
+
+
+memprof.register_cache("today_chart", cache_info, lambda: _CACHE)
@@ -1,10 +1,25 @@
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Tuple
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+import calendar
 import re
 
+import memprof
+
 # pip install lunar_python
-from lunar_python import Solar
+# lunar_python 載入要十幾毫秒 (大量曆法表)，延到第一次排盤才 import，讓 `import app` 冷啟動更快
+_Solar = None
+
+
+def _solar_cls():
+    global _Solar
+    if _Solar is None:
+        from lunar_python import Solar
+        _Solar = Solar
+    return _Solar
 
 
 @dataclass
@@ -18,6 +33,76 @@ class BaZi:
         return (self.year, self.month, self.day, self.hour)
 
 
+# 農曆輸入的前綴 (大小寫不拘)
+LUNAR_PREFIXES = ("農曆", "农历", "陰曆", "阴历", "lunar")
+
+
+def lunar_to_solar(y: int, mo: int, d: int, leap: bool = False) -> Tuple[int, int, int]:
+    """農曆 -> 國曆 (查預先算好的索引，不經過 lunar_python)"""
+    import lunar_index
+    return lunar_index.to_solar(y, mo, d, leap)
+
+
+# 時間欄寫這些字樣 = 時辰不詳 (大小寫不拘)
+UNKNOWN_HOUR_WORDS = ("時辰不詳", "时辰不详", "不詳", "不详", "unknown", "?")
+
+
+# 預先編譯：整批匯入時每筆只跑一次 regex (常見的 YYYY-MM-DD HH:MM 先走最短的那條)
+_CANONICAL_RE = re.compile(r"(\d{4})-(\d\d)-(\d\d) (\d\d):(\d\d)")
+_BIRTH_RE = re.compile(
+    r"\s*(%s)?\s*(\d{4})[-/](閏|闰)?(\d{1,2})[-/](\d{1,2})"
+    r"(?:\s+(\d{1,2})(?::(\d{1,2}))?|\s*(?:%s))?\s*" % (
+        "|".join(map(re.escape, LUNAR_PREFIXES)), "|".join(map(re.escape, UNKNOWN_HOUR_WORDS))),
+    re.IGNORECASE,
+)
+_MONTH_DAYS = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def days_in_month(y: int, mo: int) -> int:
+    return 29 if mo == 2 and calendar.isleap(y) else _MONTH_DAYS[mo - 1]
+
+
+def parse_birth(s: str) -> Tuple[int, int, int, Optional[int], Optional[int]]:
+    """
+    與 parse_datetime 相同的格式，但沒輸入時間 (或寫「時辰不詳」/ unknown / ?) 時
+    小時、分鐘回傳 None，交給 hour_variants() 列出 12 個時辰
+    農曆日期會先換算成國曆，回傳值一律是國曆；不存在的日期 (例如 2023-02-31) 直接報錯
+    """
+    m = _CANONICAL_RE.fullmatch(s)
+    if m:
+        y, mo, d, hh, mm = map(int, m.groups())
+        lunar = leap = False
+    else:
+        m = _BIRTH_RE.fullmatch(s)
+        if not m or (m.group(3) and not m.group(1)):
+            raise ValueError("格式錯誤：請用 YYYY-MM-DD 或 YYYY-MM-DD HH:MM（例：1990-01-01 13:30；農曆：農曆1990-閏05-01）")
+        lunar, leap = bool(m.group(1)), bool(m.group(3))
+        y = int(m.group(2))
+        mo = int(m.group(4))
+        d = int(m.group(5))
+        hh = int(m.group(6)) if m.group(6) is not None else None
+        mm = (int(m.group(7)) if m.group(7) is not None else 0) if hh is not None else None
+
+    if y < 1:
+        raise ValueError("年份需為 0001 以後")
+    if not (1 <= mo <= 12):
+        raise ValueError("月份需為 1~12")
+    if not (1 <= d <= (30 if lunar else 31)):
+        raise ValueError("日期需為 1~30" if lunar else "日期需為 1~31")
+    if not lunar and d > days_in_month(y, mo):
+        raise ValueError("日期不存在：%d 年 %d 月只有 %d 天" % (y, mo, days_in_month(y, mo)))
+    if hh is not None and not (0 <= hh <= 23):
+        raise ValueError("小時需為 0~23")
+    if mm is not None and not (0 <= mm <= 59):
+        raise ValueError("分鐘需為 0~59")
+
+    if lunar:
+        # 農曆的大小月 / 閏月由索引檢查
+        y, mo, d = lunar_to_solar(y, mo, d, leap=leap)
+
+    return y, mo, d, hh, mm
+
+
 def parse_datetime(s: str) -> Tuple[int, int, int, int, int]:
     """
     支援：
@@ -26,36 +111,18 @@ def parse_datetime(s: str) -> Tuple[int, int, int, int, int]:
       - YYYY-MM-DD HH:MM
       - YYYY/MM/DD
       - YYYY/MM/DD HH:MM
-    沒輸入時間 -> 預設 12:00
+      - 農曆YYYY-MM-DD HH:MM、農曆YYYY-閏MM-DD (閏月)；「陰曆」或「lunar」前綴亦可
+    沒輸入時間 -> 預設 12:00 (要列出所有時辰請改用 parse_birth + hour_variants)
+    農曆日期會先換算成國曆，回傳值一律是國曆
     """
-    s = s.strip().replace("/", "-")
-    m = re.fullmatch(
-        r"(\d{4})-(\d{1,2})-(\d{1,2})(?:\s+(\d{1,2})(?::(\d{1,2}))?)?",
-        s
-    )
-    if not m:
-        raise ValueError("格式錯誤：請用 YYYY-MM-DD 或 YYYY-MM-DD HH:MM（例：1990-01-01 13:30）")
-
-    y = int(m.group(1))
-    mo = int(m.group(2))
-    d = int(m.group(3))
-    hh = int(m.group(4)) if m.group(4) is not None else 12
-    mm = int(m.group(5)) if m.group(5) is not None else 0
-
-    if not (1 <= mo <= 12):
-        raise ValueError("月份需為 1~12")
-    if not (1 <= d <= 31):
-        raise ValueError("日期需為 1~31")
-    if not (0 <= hh <= 23):
-        raise ValueError("小時需為 0~23")
-    if not (0 <= mm <= 59):
-        raise ValueError("分鐘需為 0~59")
-
+    y, mo, d, hh, mm = parse_birth(s)
+    if hh is None:
+        return y, mo, d, 12, 0
     return y, mo, d, hh, mm
 
 
 def calc_bazi_8char(y: int, mo: int, d: int, hh: int, mm: int) -> BaZi:
-    solar = Solar.fromYmdHms(y, mo, d, hh, mm, 0)
+    solar = _solar_cls().fromYmdHms(y, mo, d, hh, mm, 0)
     lunar = solar.getLunar()
     ec = lunar.getEightChar()
     return BaZi(
@@ -66,7 +133,229 @@ def calc_bazi_8char(y: int, mo: int, d: int, hh: int, mm: int) -> BaZi:
     )
 
 
-def pretty_print(dt_str: str, bazi: BaZi, used_default_time: bool) -> None:
+# ==========================================
+# 大運 / 流年
+# ==========================================
+STEMS = "甲乙丙丁戊己庚辛壬癸"
+BRANCHES = "子丑寅卯辰巳午未申酉戌亥"
+JIAZI = tuple(STEMS[i % 10] + BRANCHES[i % 12] for i in range(60))
+_JIAZI_INDEX = {p: i for i, p in enumerate(JIAZI)}
+
+# 日柱六十日一輪，只跟國曆日期有關 (與 lunar_python 相同：23 點之後的晚子時仍算當天)
+_DAY_PILLAR_OFFSET = 14
+
+
+def day_pillar(y: int, mo: int, d: int) -> str:
+    """國曆日期的日柱：純算術，不必經過 lunar_python 排整張盤"""
+    return JIAZI[(datetime(y, mo, d).toordinal() + _DAY_PILLAR_OFFSET) % 60]
+
+# lunar_python 節氣表裡屬於「節」(換月) 的名稱 (含跨年的拼音鍵)
+JIE_NAMES = frozenset([
+    "立春", "惊蛰", "清明", "立夏", "芒种", "小暑", "立秋", "白露", "寒露", "立冬", "大雪", "小寒",
+    "LI_CHUN", "JING_ZHE", "DA_XUE", "XIAO_HAN",
+])
+
+
+class DaYun(NamedTuple):
+    index: int          # 第幾步大運 (1 起算)
+    pillar: str
+    start: datetime     # 交運時刻
+    start_age: int      # 交運那年的虛歲
+
+
+class LiuNian(NamedTuple):
+    year: int
+    age: int            # 虛歲
+    pillar: str
+    dayun: Optional[str]  # 當年所走的大運 (未起運為 None)
+
+
+@dataclass
+class Timeline:
+    forward: bool               # 順行 / 逆行
+    start: datetime             # 起運 (第一步大運) 時刻
+    start_offset: Tuple[int, int, int, int]   # 出生後幾年幾月幾天幾小時起運
+    dayun: List[DaYun] = field(default_factory=list)
+    liunian: List[LiuNian] = field(default_factory=list)
+
+    def dayun_at(self, year: int) -> Optional[DaYun]:
+        current = None
+        for d in self.dayun:
+            if d.start.year <= year:
+                current = d
+        return current
+
+
+@lru_cache(maxsize=512)
+def jie_times(year: int) -> Tuple[datetime, ...]:
+    """該西元年內所有「節」的時刻 (精確到秒)；依年份快取"""
+    seen = set()
+    for month in (1, 7, 12):
+        table = _solar_cls().fromYmd(year, month, 15).getLunar().getJieQiTable()
+        for name, solar in table.items():
+            if name in JIE_NAMES and solar.getYear() == year:
+                seen.add(datetime(year, solar.getMonth(), solar.getDay(),
+                                  solar.getHour(), solar.getMinute(), solar.getSecond()))
+    return tuple(sorted(seen))
+
+
+memprof.register_cache("jie_times", lambda: jie_times.cache_info()._asdict())
+
+
+def _adjacent_jie(birth: datetime, forward: bool) -> datetime:
+    """順行：出生後的下一個節；逆行：出生前 (含當刻) 的上一個節"""
+    table = jie_times(birth.year)
+    i = bisect_right(table, birth)
+    if forward:
+        return table[i] if i < len(table) else jie_times(birth.year + 1)[0]
+    return table[i - 1] if i > 0 else jie_times(birth.year - 1)[-1]
+
+
+def _is_male(sex) -> bool:
+    s = str(sex).strip().lower()
+    if s in ("1", "男", "m", "male"):
+        return True
+    if s in ("0", "女", "f", "female"):
+        return False
+    raise ValueError("性別需為 1 (男) 或 0 (女)")
+
+
+def _add_ymdh(dt: datetime, years: int, months: int, days: int, hours: int) -> datetime:
+    m = dt.month - 1 + months
+    y = dt.year + years + m // 12
+    m = m % 12 + 1
+    d = min(dt.day, calendar.monthrange(y, m)[1])
+    return dt.replace(year=y, month=m, day=d) + timedelta(days=days, hours=hours)
+
+
+def luck_timeline(birth: datetime, sex, bazi: Optional[BaZi] = None,
+                  steps: int = 8, years: int = 80) -> Timeline:
+    """大運 (steps 步，每步十年) + 流年 (出生起 years 年)
+
+    - 陽年男、陰年女順行；陰年男、陽年女逆行
+    - 出生到下一個 (順) / 上一個 (逆) 節的時間差：三天折一年、一天折四個月、一個時辰折十天
+    - 大運從月柱依序往後 (順) 或往前 (逆) 推
+    bazi 可傳入已排好的命盤，省一次排盤；節的時刻表依年份快取，暖機後只剩查表與加法
+    """
+    birth = birth.replace(second=0, microsecond=0)
+    if bazi is None:
+        bazi = calc_bazi_8char(birth.year, birth.month, birth.day, birth.hour, birth.minute)
+    forward = (STEMS.index(bazi.year[0]) % 2 == 0) == _is_male(sex)
+
+    # 以分鐘計：節的秒數捨去 (與 lunar_python 的 Yun sect 2 相同)
+    jie = _adjacent_jie(birth, forward).replace(second=0)
+    span = int(abs((jie - birth).total_seconds()) // 60)
+    # 4320 分 = 3 天 -> 1 年；360 分 -> 1 個月；12 分 -> 1 天；1 分 -> 2 小時
+    y, span = divmod(span, 4320)
+    mo, span = divmod(span, 360)
+    d, span = divmod(span, 12)
+    offset = (y, mo, d, span * 2)
+    start = _add_ymdh(birth, *offset)
+
+    step = 1 if forward else -1
+    month_idx = _JIAZI_INDEX[bazi.month]
+    dayun = []
+    for i in range(1, steps + 1):
+        at = start.replace(year=start.year + 10 * (i - 1)) if not (start.month == 2 and start.day == 29) \
+            else _add_ymdh(start, 10 * (i - 1), 0, 0, 0)
+        dayun.append(DaYun(i, JIAZI[(month_idx + step * i) % 60], at, at.year - birth.year + 1))
+
+    # 每一年所走的大運：依交運年份整段填入，不逐年比較
+    current: List[Optional[str]] = [None] * years
+    for k, dy in enumerate(dayun):
+        lo = max(dy.start.year - birth.year, 0)
+        hi = dayun[k + 1].start.year - birth.year if k + 1 < len(dayun) else years
+        hi = min(hi, years)
+        if hi > lo:
+            current[lo:hi] = [dy.pillar] * (hi - lo)
+    by = birth.year
+    liunian = list(map(LiuNian, range(by, by + years), range(1, years + 1),
+                       [JIAZI[(yr - 4) % 60] for yr in range(by, by + years)], current))
+    return Timeline(forward, start, offset, dayun, liunian)
+
+
+def luck_timelines(rows: Iterable[Tuple[datetime, object]], steps: int = 8, years: int = 80) -> List[Timeline]:
+    """批次：[(出生時刻, 性別), ...] -> [Timeline, ...] (順序與輸入相同)
+
+    依出生年排序後再排盤：lunar_python 只快取最近一個農曆年，同年連續計算快很多。
+    """
+    rows = list(rows)
+    out: List[Optional[Timeline]] = [None] * len(rows)
+    for i in sorted(range(len(rows)), key=lambda i: rows[i][0]):
+        birth, sex = rows[i]
+        out[i] = luck_timeline(birth, sex, steps=steps, years=years)
+    return out  # type: ignore[return-value]
+
+
+# ==========================================
+# 時辰不詳：一次列出 12 個時辰
+# ==========================================
+# (時支, 起, 迄, 晚子時)；以當天 00:00 起的分鐘數表示
+# 子時跨日：00:00~00:59 為早子時；23:00~23:59 為晚子時，日柱仍是當天 (sect 2)，時干則依隔天日干起
+HOUR_WINDOWS = ((BRANCHES[0], 0, 59, False),) + tuple(
+    (BRANCHES[i], i * 120 - 60, i * 120 + 59, False) for i in range(1, 12)
+) + ((BRANCHES[0], 1380, 1439, True),)
+
+
+class HourVariant(NamedTuple):
+    branch: str                 # 時支
+    start: str                  # 時段起 "HH:MM"
+    end: str                    # 時段迄 "HH:MM"
+    late: bool                  # 晚子時 (23:00~)
+    bazi: BaZi                  # 此時段 (開頭) 的四柱
+    jie: Optional[datetime]     # 此時段內交節的時刻；None = 時段內不換月
+    after_jie: Optional[BaZi]   # 交節之後的四柱 (年柱 / 月柱不同)
+
+
+def _hour_pillar(day_stem: int, branch: str, late: bool = False) -> str:
+    """五鼠遁：甲己日起甲子、乙庚日起丙子…；晚子時用隔天的日干"""
+    bi = BRANCHES.index(branch)
+    return STEMS[((day_stem + (1 if late else 0)) % 5 * 2 + bi) % 10] + branch
+
+
+def hour_variants(y: int, mo: int, d: int) -> List[HourVariant]:
+    """時辰不詳：年 / 月 / 日柱只排一次，12 個時柱 (子時分早、晚共 13 段) 由日干推出
+
+    當天若遇到「節」(換月，立春還會換年)，交節之後的時段改用節後的年柱 / 月柱；
+    交節時刻落在某個時段中間時，該時段的 jie / after_jie 會標出前後兩種四柱。
+    排盤最多兩次 (當天 00:00 + 交節那一分鐘)，其餘只是查表。
+    """
+    base = calc_bazi_8char(y, mo, d, 0, 0)
+    day_stem = STEMS.index(base.day[0])
+    midnight = datetime(y, mo, d)
+
+    # 以分鐘計：節的秒數 > 0 時，同一分鐘的 HH:MM:00 仍在交節前
+    jie, cut, after = None, None, None
+    for t in jie_times(y):
+        if t.date() == midnight.date():
+            minute = (t - midnight).seconds // 60 + (1 if t.second else 0)
+            if 0 < minute < 1440:
+                nb = calc_bazi_8char(y, mo, d, minute // 60, minute % 60)
+                jie, cut, after = t, minute, (nb.year, nb.month)
+            break
+
+    out = []
+    for branch, lo, hi, late in HOUR_WINDOWS:
+        hour = _hour_pillar(day_stem, branch, late)
+        year_month = (base.year, base.month)
+        at, split = None, None
+        if cut is not None:
+            if cut <= lo:
+                year_month = after
+            elif cut <= hi:
+                at, split = jie, BaZi(after[0], after[1], base.day, hour)
+        out.append(HourVariant(branch, "%02d:%02d" % divmod(lo, 60), "%02d:%02d" % divmod(hi, 60), late,
+                               BaZi(year_month[0], year_month[1], base.day, hour), at, split))
+    return out
+
+
+def variant_start(variant: HourVariant, y: int, mo: int, d: int) -> datetime:
+    """時段開頭的時刻 (排大運等需要確切時間時使用)"""
+    hh, mm = map(int, variant.start.split(":"))
+    return datetime(y, mo, d, hh, mm)
+
+
+def pretty_print(dt_str: str, bazi: BaZi, used_default_time: bool = False) -> None:
     print("\n==== 八字排盤 ====")
     print(f"輸入時間：{dt_str}")
     print("")
@@ -81,9 +370,43 @@ def pretty_print(dt_str: str, bazi: BaZi, used_default_time: bool) -> None:
         print("提醒：你沒輸入出生時間，時柱是用 12:00 計算，若要準請補上 HH:MM")
 
 
+def hour_label(v: HourVariant) -> str:
+    if v.branch == BRANCHES[0]:
+        return "晚子" if v.late else "早子"
+    return v.branch
+
+
+def print_hour_variants(dt_str: str, variants: List[HourVariant]) -> None:
+    from bazi_calc_v2 import VARIANT_RELATIONS, compare_hour_variants
+
+    rows, stable = compare_hour_variants([(v.bazi.day[-1], v.branch) for v in variants])
+    charts = [v.bazi for v in variants] + [v.after_jie for v in variants if v.after_jie]
+    print("\n==== 八字排盤（時辰不詳）====")
+    print(f"輸入時間：{dt_str}")
+    print("")
+    for name, attr in (("年柱", "year"), ("月柱", "month"), ("日柱", "day")):
+        values = list(dict.fromkeys(getattr(c, attr) for c in charts))
+        print(f"{name}：{' / '.join(values)}" + ("" if len(values) == 1 else "（依時辰不同）"))
+    print("")
+    print("時辰  時段          八字          時支×日支")
+    for v, row in zip(variants, rows):
+        print(f"{hour_label(v).ljust(2, '　')}  {v.start}-{v.end}   {' '.join(v.bazi.as_tuple())}   {'、'.join(row['hour_day'])}")
+        if v.jie:
+            print(f"      {v.jie:%H:%M:%S} 交節，之後為 {' '.join(v.after_jie.as_tuple())}")
+    print("==================")
+    # 今日運勢 / 本月氣場只看日支：日柱不隨時辰改變 (sect 2 晚子時仍算當天) 時就全部相同
+    same = [VARIANT_RELATIONS[k] for k, ok in stable.items() if ok]
+    if len({c.day for c in charts}) == 1:
+        same.insert(0, "日支相關的關係 (今日運勢、本月氣場)")
+    print("所有時辰結果相同：" + ("、".join(same) or "無"))
+    print("隨時辰改變：" + ("、".join(VARIANT_RELATIONS[k] for k, ok in stable.items() if not ok) or "無"))
+
+
 def main_loop() -> None:
-    print("八字排盤（陽曆/公曆）")
+    print("八字排盤（陽曆/公曆，亦可輸入農曆）")
     print("輸入格式：YYYY-MM-DD 或 YYYY-MM-DD HH:MM（例：1990-01-01 13:30）")
+    print("農曆請加前綴：農曆1990-05-01 13:30，閏月寫成 農曆1990-閏05-01")
+    print("不知道出生時間：只輸入日期 (或加上「時辰不詳」)，會列出 12 個時辰")
     print("輸入 q 離開\n")
 
     while True:
@@ -92,11 +415,12 @@ def main_loop() -> None:
             print("已退出。")
             return
 
-        used_default_time = bool(re.fullmatch(r"\d{4}[-/]\d{1,2}[-/]\d{1,2}", s))
         try:
-            y, mo, d, hh, mm = parse_datetime(s)
-            bazi = calc_bazi_8char(y, mo, d, hh, mm)
-            pretty_print(s, bazi, used_default_time)
+            y, mo, d, hh, mm = parse_birth(s)
+            if hh is None:
+                print_hour_variants(s, hour_variants(y, mo, d))
+            else:
+                pretty_print(s, calc_bazi_8char(y, mo, d, hh, mm))
         except Exception as e:
             print(f"\n[錯誤] {e}\n")
 